@@ -1,152 +1,136 @@
-import tkinter as tk
-from tkinter import messagebox
-import json
 import os
 
-DATA_FILE = "accounts.json"
-
-
-# ================= FILE =================
-def load_accounts():
-    if not os.path.exists(DATA_FILE):
-        return {}
-    with open(DATA_FILE, "r") as f:
-        return json.load(f)
-
-
-def save_accounts(accounts):
-    with open(DATA_FILE, "w") as f:
-        json.dump(accounts, f, indent=4)
-
-
-# ================= ACCOUNT =================
-class Account:
-    def __init__(self, acc_number, pin, balance=0, history=None):
-        self._acc_number = acc_number
-        self._pin = pin
-        self._balance = balance
-        self._history = history if history else []
-
-    def deposit(self, amount):
-        self._balance += amount
-        self._history.append(f"Setor Rp {amount}")
-
-    def withdraw(self, amount):
-        if amount > self._balance:
-            return False
-        self._balance -= amount
-        self._history.append(f"Tarik Rp {amount}")
-        return True
-
-    def add_history(self, text):
-        self._history.append(text)
-
-    def get_balance(self):
-        return self._balance
-
-    def get_history(self):
-        return self._history
-    
-class SavingAccount(Account):
-    def withdraw(self, amount):
-        admin_fee = 2000
-        total = amount + admin_fee
-        if total > self._balance:
-            return False
-        self._balance -= total
-        self._history.append(
-            f"Tarik Rp {amount} (Admin Rp {admin_fee})"
-        )
-        return True
-
-
-# ================= BANK =================
-class Bank:
-    def __init__(self):
-        self.accounts = load_accounts()
-
-    def save(self):
-        save_accounts(self.accounts)
-
-    def add_account(self, acc_number, pin):
-        if acc_number in self.accounts:
-            return False
-        self.accounts[acc_number] = {
-            "pin": pin,
-            "balance": 0,
-            "history": []
-        }
-        self.save()
-        return True
-
-    def authenticate(self, acc_number, pin):
-        data = self.accounts.get(acc_number)
-        if data and data["pin"] == pin:
-            return SavingAccount(
-                acc_number,
-                pin,
-                data["balance"],
-                data.get("history", [])
-            )
-        return None
-
-    def update_account(self, account: Account):
-        self.accounts[account._acc_number]["balance"] = account.get_balance()
-        self.accounts[account._acc_number]["history"] = account.get_history()
-        self.save()
-
-    def transfer(self, from_acc: Account, to_acc, amount):
-        if to_acc not in self.accounts:
-            return False, "Rekening tujuan tidak ditemukan"
-        if amount > from_acc.get_balance():
-            return False, "Saldo tidak cukup"
-
-        from_acc.withdraw(amount)
-        from_acc.add_history(f"Transfer Rp {amount} ke {to_acc}")
-
-        self.accounts[to_acc]["balance"] += amount
-        self.accounts[to_acc]["history"].append(
-            f"Terima transfer Rp {amount} dari {from_acc._acc_number}"
-        )
+from bank import Bank
+from bank.worker import Worker
+
+tk = None
+messagebox = None
 
-        self.update_account(from_acc)
-        self.save()
-        return True, "Transfer berhasil"
+# Poll background jobs about once a frame at 60 fps
+POLL_MS = 16
+PENDING_TEXT = "Memproses..."
+
+
+def load_tk():
+    """Import tkinter on first use, so the module imports headless"""
+    global tk, messagebox
+    if tk is None:
+        import tkinter
+        from tkinter import messagebox as box
+        tk, messagebox = tkinter, box
+    return tk
 
 
 # ================= GUI =================
 class ATMApp:
-    def __init__(self, root):
+    def __init__(self, root, bank=None):
+        load_tk()
         self.root = root
         self.root.title("ATM Simulator")
-        self.bank = Bank()
+        self.bank = bank if bank is not None else Bank()
         self.current_account = None
+        self.screens = {}
+        self.proses_buttons = {}
+        # Bank calls that may write to disk run here, off the Tk thread
+        self.worker = Worker()
+        self.root.protocol("WM_DELETE_WINDOW", self.close)
+        self.root.grid_rowconfigure(0, weight=1)
+        self.root.grid_columnconfigure(0, weight=1)
         self.login_screen()
 
-    def clear(self):
-        for w in self.root.winfo_children():
-            w.destroy()
+    def show(self, name):
+        """Raise the cached frame of a screen, building it on first use;
+        ``refresh_<name>`` updates its dynamic fields on every visit"""
+        screen = self.screens.get(name)
+        if screen is None:
+            screen = tk.Frame(self.root)
+            screen.grid(row=0, column=0, sticky="nsew")
+            getattr(self, "build_" + name)(screen)
+            self.screens[name] = screen
+        refresh = getattr(self, "refresh_" + name, None)
+        if refresh is not None:
+            refresh()
+        screen.tkraise()
+
+    def reset_entry(self, entry, text=""):
+        entry.delete(0, "end")
+        entry.insert(0, text)
+
+    def proses_button(self, screen, name, text, command):
+        button = tk.Button(screen, text=text, width=25, command=command)
+        self.proses_buttons[name] = (button, text)
+        return button
+
+    # ---------- BACKGROUND ----------
+    def when_done(self, future, callback):
+        """Call ``callback(future)`` on the Tk thread once it is done;
+        polling with ``after`` keeps the mainloop drawing meanwhile"""
+        if future.done():
+            callback(future)
+        else:
+            self.root.after(POLL_MS, self.when_done, future, callback)
+
+    def run_pending(self, name, done, job, *args):
+        """Run ``job(*args)`` on the worker, showing screen ``name`` as
+        pending, then call ``done(result)`` on the Tk thread"""
+        self.set_pending(name, True)
+
+        def finish(future):
+            self.set_pending(name, False)
+            try:
+                result = future.result()
+            except Exception:
+                messagebox.showerror("Error", "Transaksi gagal disimpan")
+                return
+            done(result)
+
+        self.when_done(self.worker.submit(job, *args), finish)
+
+    def set_pending(self, name, pending):
+        button, text = self.proses_buttons[name]
+        if pending:
+            button.config(text=PENDING_TEXT, state="disabled")
+        else:
+            button.config(text=text, state="normal")
+
+    def close(self):
+        # Let queued writes finish before the window goes away
+        self.worker.close()
+        self.root.destroy()
 
     # ---------- LOGIN ----------
     def login_screen(self):
-        self.clear()
-        tk.Label(self.root, text="LOGIN ATM", font=("Arial", 16)).pack(pady=10)
+        self.current_account = None
+        self.show("login")
+
+    def build_login(self, screen):
+        tk.Label(screen, text="LOGIN ATM", font=("Arial", 16)).pack(pady=10)
 
-        tk.Label(self.root, text="No Rekening").pack()
-        self.ent_rek = tk.Entry(self.root)
+        tk.Label(screen, text="No Rekening").pack()
+        self.ent_rek = tk.Entry(screen)
         self.ent_rek.pack()
 
-        tk.Label(self.root, text="PIN").pack()
-        self.ent_pin = tk.Entry(self.root, show="*")
+        tk.Label(screen, text="PIN").pack()
+        self.ent_pin = tk.Entry(screen, show="*")
         self.ent_pin.pack()
 
-        tk.Button(self.root, text="Login", width=25,
+        tk.Button(screen, text="Login", width=25,
                   command=self.login).pack(pady=5)
-        tk.Button(self.root, text="Register", width=25,
-                  command=self.register).pack()
+        self.proses_button(screen, "register", "Register",
+                           self.register).pack()
+
+    def refresh_login(self):
+        self.reset_entry(self.ent_rek)
+        self.reset_entry(self.ent_pin)
 
     def login(self):
-        acc = self.bank.authenticate(self.ent_rek.get(), self.ent_pin.get())
+        future = self.bank.authenticate_async(
+            self.ent_rek.get(), self.ent_pin.get()
+        )
+        self.when_done(future, self.finish_login)
+
+    def finish_login(self, future):
+        acc = future.result()
         if acc:
             self.current_account = acc
             self.main_menu()
@@ -154,124 +138,182 @@ class ATMApp:
             messagebox.showerror("Error", "Login gagal")
 
     def register(self):
-        if self.bank.add_account(self.ent_rek.get(), self.ent_pin.get()):
-            messagebox.showinfo("Sukses", "Akun berhasil dibuat")
-        else:
-            messagebox.showerror("Error", "Rekening sudah ada")
+        def selesai(created):
+            if created:
+                messagebox.showinfo("Sukses", "Akun berhasil dibuat")
+            else:
+                messagebox.showerror("Error", "Rekening sudah ada")
+
+        self.run_pending("register", selesai, self.bank.add_account,
+                         self.ent_rek.get(), self.ent_pin.get())
 
     # ---------- MENU UTAMA ----------
     def main_menu(self):
-        self.clear()
-        tk.Label(self.root, text="MENU UTAMA", font=("Arial", 16)).pack(pady=10)
+        self.show("menu")
+
+    def build_menu(self, screen):
+        tk.Label(screen, text="MENU UTAMA", font=("Arial", 16)).pack(pady=10)
 
-        tk.Button(self.root, text="Cek Saldo", width=25,
+        tk.Button(screen, text="Cek Saldo", width=25,
                   command=self.check_balance).pack(pady=3)
-        tk.Button(self.root, text="Setor", width=25,
+        tk.Button(screen, text="Setor", width=25,
                   command=self.setor_screen).pack(pady=3)
-        tk.Button(self.root, text="Tarik", width=25,
+        tk.Button(screen, text="Tarik", width=25,
                   command=self.tarik_screen).pack(pady=3)
-        tk.Button(self.root, text="Transfer", width=25,
+        tk.Button(screen, text="Transfer", width=25,
                   command=self.transfer_screen).pack(pady=3)
-        tk.Button(self.root, text="History", width=25,
+        tk.Button(screen, text="History", width=25,
                   command=self.show_history).pack(pady=3)
-        tk.Button(self.root, text="Logout", width=25,
+        tk.Button(screen, text="Logout", width=25,
                   command=self.login_screen).pack(pady=10)
 
     # ---------- SETOR ----------
     def setor_screen(self):
-        self.clear()
-        tk.Label(self.root, text="SETOR TUNAI", font=("Arial", 16)).pack(pady=10)
+        self.show("setor")
 
-        tk.Label(self.root, text="Jumlah").pack()
-        ent = tk.Entry(self.root)
+    def build_setor(self, screen):
+        tk.Label(screen, text="SETOR TUNAI", font=("Arial", 16)).pack(pady=10)
+
+        tk.Label(screen, text="Jumlah").pack()
+        ent = self.ent_setor = tk.Entry(screen)
         ent.pack()
 
         def proses():
             try:
                 amt = int(ent.get())
-                self.current_account.deposit(amt)
-                self.bank.update_account(self.current_account)
+            except ValueError:
+                messagebox.showerror("Error", "Input tidak valid")
+                return
+            account = self.current_account
+
+            def setor():
+                # One atomic save; nothing changes here if it fails
+                return self.bank.deposit(account._acc_number, amt)
+
+            def selesai(stored):
+                if self.current_account is account:
+                    self.current_account = stored
                 messagebox.showinfo("Sukses", "Setor berhasil")
                 self.main_menu()
-            except:
-                messagebox.showerror("Error", "Input tidak valid")
 
-        tk.Button(self.root, text="Proses Setor", width=25,
-                  command=proses).pack(pady=5)
-        tk.Button(self.root, text="Kembali", width=25,
+            self.run_pending("setor", selesai, setor)
+
+        self.proses_button(screen, "setor", "Proses Setor",
+                           proses).pack(pady=5)
+        tk.Button(screen, text="Kembali", width=25,
                   command=self.main_menu).pack()
 
+    def refresh_setor(self):
+        self.reset_entry(self.ent_setor)
+
     # ---------- TARIK ----------
     def tarik_screen(self):
-        self.clear()
-        tk.Label(self.root, text="TARIK TUNAI", font=("Arial", 16)).pack(pady=10)
+        self.show("tarik")
 
-        tk.Label(self.root, text="Jumlah").pack()
-        ent = tk.Entry(self.root)
+    def build_tarik(self, screen):
+        tk.Label(screen, text="TARIK TUNAI", font=("Arial", 16)).pack(pady=10)
+
+        tk.Label(screen, text="Jumlah").pack()
+        ent = self.ent_tarik = tk.Entry(screen)
         ent.pack()
 
         def proses():
             try:
                 amt = int(ent.get())
-                if not self.current_account.withdraw(amt):
+            except ValueError:
+                messagebox.showerror("Error", "Input tidak valid")
+                return
+            account = self.current_account
+
+            def tarik():
+                return self.bank.withdraw(account._acc_number, amt)
+
+            def selesai(stored):
+                if stored is None:
                     messagebox.showerror("Error", "Saldo tidak cukup")
                     return
-                self.bank.update_account(self.current_account)
+                if self.current_account is account:
+                    self.current_account = stored
                 messagebox.showinfo("Sukses", "Tarik berhasil")
                 self.main_menu()
-            except:
-                messagebox.showerror("Error", "Input tidak valid")
 
-        tk.Button(self.root, text="Proses Tarik", width=25,
-                  command=proses).pack(pady=5)
-        tk.Button(self.root, text="Kembali", width=25,
+            self.run_pending("tarik", selesai, tarik)
+
+        self.proses_button(screen, "tarik", "Proses Tarik",
+                           proses).pack(pady=5)
+        tk.Button(screen, text="Kembali", width=25,
                   command=self.main_menu).pack()
 
+    def refresh_tarik(self):
+        self.reset_entry(self.ent_tarik)
+
     # ---------- TRANSFER ----------
     def transfer_screen(self):
-        self.clear()
-        tk.Label(self.root, text="TRANSFER", font=("Arial", 16)).pack(pady=10)
+        self.show("transfer")
+
+    def build_transfer(self, screen):
+        tk.Label(screen, text="TRANSFER", font=("Arial", 16)).pack(pady=10)
 
-        tk.Label(self.root, text="Rekening Tujuan").pack()
-        ent_rek = tk.Entry(self.root)
+        tk.Label(screen, text="Rekening Tujuan").pack()
+        ent_rek = self.ent_tujuan = tk.Entry(screen)
         ent_rek.pack()
 
-        tk.Label(self.root, text="Jumlah").pack()
-        ent_amt = tk.Entry(self.root)
+        tk.Label(screen, text="Jumlah").pack()
+        ent_amt = self.ent_transfer = tk.Entry(screen)
         ent_amt.pack()
 
         def proses():
             try:
-                ok, msg = self.bank.transfer(
-                    self.current_account,
-                    ent_rek.get(),
-                    int(ent_amt.get())
-                )
+                amt = int(ent_amt.get())
+            except ValueError:
+                messagebox.showerror("Error", "Input tidak valid")
+                return
+
+            def selesai(result):
+                ok, msg = result
                 if ok:
                     messagebox.showinfo("Sukses", msg)
                     self.main_menu()
                 else:
                     messagebox.showerror("Error", msg)
-            except:
-                messagebox.showerror("Error", "Input tidak valid")
 
-        tk.Button(self.root, text="Proses Transfer", width=25,
-                  command=proses).pack(pady=5)
-        tk.Button(self.root, text="Kembali", width=25,
+            self.run_pending("transfer", selesai, self.bank.transfer,
+                             self.current_account, ent_rek.get(), amt)
+
+        self.proses_button(screen, "transfer", "Proses Transfer",
+                           proses).pack(pady=5)
+        tk.Button(screen, text="Kembali", width=25,
                   command=self.main_menu).pack()
 
+    def refresh_transfer(self):
+        self.reset_entry(self.ent_tujuan)
+        self.reset_entry(self.ent_transfer)
+
     # ---------- OTHER ----------
     def check_balance(self):
         messagebox.showinfo("Saldo",
                             f"Saldo Anda: Rp {self.current_account.get_balance()}")
 
     def show_history(self):
-        h = self.current_account.get_history()
-        messagebox.showinfo("History", "\n".join(h) if h else "Belum ada transaksi")
+        # Reading history waits for a save in progress, so it queues too
+        future = self.worker.submit(
+            self.bank.history_page, self.current_account._acc_number
+        )
+        self.when_done(future, self.finish_history)
+
+    def finish_history(self, future):
+        h, _ = future.result()
+        messagebox.showinfo("History", "\n".join(map(str, h)) if h else "Belum ada transaksi")
 
 
 # ================= RUN =================
 if __name__ == "__main__":
-    root = tk.Tk()
-    ATMApp(root)
+    root = load_tk().Tk()
+    server = os.environ.get("ATM_SERVER")
+    if server:
+        from bank.client import RemoteBank
+        host, _, port = server.rpartition(":")
+        ATMApp(root, RemoteBank(host, int(port)))
+    else:
+        ATMApp(root)
     root.mainloop()
\ No newline at end of file
@@ -1,130 +1,46 @@
-import tkinter as tk
-from tkinter import messagebox
-import json
 import os
 
-DATA_FILE = "accounts.json"
-
-
-# ================= FILE =================
-def load_accounts():
-    if not os.path.exists(DATA_FILE):
-        return {}
-    with open(DATA_FILE, "r") as f:
-        return json.load(f)
-
-
-def save_accounts(accounts):
-    with open(DATA_FILE, "w") as f:
-        json.dump(accounts, f, indent=4)
-
-
-# ================= ACCOUNT =================
-class Account:
-    def __init__(self, acc_number, pin, balance=0, history=None):
-        self._acc_number = acc_number
-        self._pin = pin
-        self._balance = balance
-        self._history = history if history else []
-
-    def deposit(self, amount):
-        self._balance += amount
-        self._history.append(f"Setor Rp {amount:,}")
-
-    def withdraw(self, amount):
-        if amount > self._balance:
-            return False
-        self._balance -= amount
-        self._history.append(f"Tarik Rp {amount:,}")
-        return True
-
-    def add_history(self, text):
-        self._history.append(text)
-
-    def get_balance(self):
-        return self._balance
-
-    def get_history(self):
-        return self._history
-    
-class SavingAccount(Account):
-    def withdraw(self, amount):
-        admin_fee = 2000
-        total = amount + admin_fee
-        if total > self._balance:
-            return False
-        self._balance -= total
-        self._history.append(
-            f"Tarik Rp {amount:,} (Admin Rp {admin_fee:,})"
-        )
-        return True
-
-
-# ================= BANK =================
-class Bank:
-    def __init__(self):
-        self.accounts = load_accounts()
-
-    def save(self):
-        save_accounts(self.accounts)
-
-    def add_account(self, acc_number, pin):
-        if acc_number in self.accounts:
-            return False
-        self.accounts[acc_number] = {
-            "pin": pin,
-            "balance": 0,
-            "history": []
-        }
-        self.save()
-        return True
-
-    def authenticate(self, acc_number, pin):
-        data = self.accounts.get(acc_number)
-        if data and data["pin"] == pin:
-            return SavingAccount(
-                acc_number,
-                pin,
-                data["balance"],
-                data.get("history", [])
-            )
-        return None
-
-    def update_account(self, account: Account):
-        self.accounts[account._acc_number]["balance"] = account.get_balance()
-        self.accounts[account._acc_number]["history"] = account.get_history()
-        self.save()
-
-    def transfer(self, from_acc: Account, to_acc, amount):
-        if to_acc not in self.accounts:
-            return False, "Rekening tujuan tidak ditemukan"
-        if amount > from_acc.get_balance():
-            return False, "Saldo tidak cukup"
-
-        from_acc.withdraw(amount)
-        from_acc.add_history(f"Transfer Rp {amount:,} ke {to_acc}")
-
-        self.accounts[to_acc]["balance"] += amount
-        self.accounts[to_acc]["history"].append(
-            f"Terima transfer Rp {amount:,} dari {from_acc._acc_number}"
-        )
+from bank import Bank
+from bank.worker import Worker
+
+tk = None
+messagebox = None
 
-        self.update_account(from_acc)
-        self.save()
-        return True, "Transfer berhasil"
+# Poll background jobs about once a frame at 60 fps
+POLL_MS = 16
+PENDING_TEXT = "⏳ MEMPROSES..."
+
+
+def load_tk():
+    """Import tkinter on first use, so the module imports headless"""
+    global tk, messagebox
+    if tk is None:
+        import tkinter
+        from tkinter import messagebox as box
+        tk, messagebox = tkinter, box
+    return tk
 
 
 # ================= GUI =================
 class ATMApp:
-    def __init__(self, root):
+    def __init__(self, root, bank=None):
+        load_tk()
         self.root = root
         self.root.title("ATM Simulator")
         self.root.geometry("500x650")
         self.root.configure(bg="#1a1a2e")
         self.root.resizable(False, False)
         
-        self.bank = Bank()
+        self.bank = bank if bank is not None else Bank()
         self.current_account = None
+        self.screens = {}
+        self.balance_labels = {}
+        self.proses_buttons = {}
+        # Bank calls that may write to disk run here, off the Tk thread
+        self.worker = Worker()
+        self.root.protocol("WM_DELETE_WINDOW", self.close)
+        self.root.grid_rowconfigure(0, weight=1)
+        self.root.grid_columnconfigure(0, weight=1)
         
         # Color scheme
         self.bg_primary = "#1a1a2e"
@@ -138,13 +54,26 @@ class ATMApp:
         
         self.login_screen()
 
-    def clear(self):
-        for w in self.root.winfo_children():
-            w.destroy()
-
-    def create_header(self, title):
+    def show(self, name):
+        """Raise the cached frame of a screen, building it on first use.
+
+        Screens are stacked in the same place; only ``refresh_<name>``
+        runs on every visit to update the dynamic fields.
+        """
+        screen = self.screens.get(name)
+        if screen is None:
+            screen = tk.Frame(self.root, bg=self.bg_primary)
+            screen.grid(row=0, column=0, sticky="nsew")
+            getattr(self, "build_" + name)(screen)
+            self.screens[name] = screen
+        refresh = getattr(self, "refresh_" + name, None)
+        if refresh is not None:
+            refresh()
+        screen.tkraise()
+
+    def create_header(self, parent, title):
         """Create a styled header"""
-        header_frame = tk.Frame(self.root, bg=self.bg_secondary, height=100)
+        header_frame = tk.Frame(parent, bg=self.bg_secondary, height=100)
         header_frame.pack(fill="x", pady=(0, 20))
         header_frame.pack_propagate(False)
         
@@ -218,12 +147,81 @@ class ATMApp:
         )
         return label
 
+    def create_balance(self, parent, name, pady):
+        """Create the "Saldo Saat Ini" box, refreshed on every visit"""
+        balance_frame = tk.Frame(parent, bg=self.bg_secondary, height=60)
+        balance_frame.pack(fill="x", pady=pady)
+        balance_frame.pack_propagate(False)
+
+        label = tk.Label(
+            balance_frame,
+            font=("Segoe UI", 12, "bold"),
+            bg=self.bg_secondary,
+            fg=self.success
+        )
+        label.pack(pady=20)
+        self.balance_labels[name] = label
+
+    def refresh_balance(self, name):
+        self.balance_labels[name].config(
+            text=f"Saldo Saat Ini: Rp {self.current_account.get_balance():,}"
+        )
+
+    def reset_entry(self, entry, text=""):
+        entry.delete(0, "end")
+        entry.insert(0, text)
+
+    def create_proses_button(self, parent, name, text, command):
+        button = self.create_button(parent, text, command, "primary")
+        self.proses_buttons[name] = (button, text)
+        return button
+
+    # ---------- BACKGROUND ----------
+    def when_done(self, future, callback):
+        """Call ``callback(future)`` on the Tk thread once it is done;
+        polling with ``after`` keeps the mainloop drawing meanwhile"""
+        if future.done():
+            callback(future)
+        else:
+            self.root.after(POLL_MS, self.when_done, future, callback)
+
+    def run_pending(self, name, done, job, *args):
+        """Run ``job(*args)`` on the worker, showing screen ``name`` as
+        pending, then call ``done(result)`` on the Tk thread"""
+        self.set_pending(name, True)
+
+        def finish(future):
+            self.set_pending(name, False)
+            try:
+                result = future.result()
+            except Exception:
+                messagebox.showerror("❌ Error", "Transaksi gagal disimpan!")
+                return
+            done(result)
+
+        self.when_done(self.worker.submit(job, *args), finish)
+
+    def set_pending(self, name, pending):
+        button, text = self.proses_buttons[name]
+        if pending:
+            button.config(text=PENDING_TEXT, state="disabled")
+        else:
+            button.config(text=text, state="normal")
+
+    def close(self):
+        # Let queued writes finish before the window goes away
+        self.worker.close()
+        self.root.destroy()
+
     # ---------- LOGIN ----------
     def login_screen(self):
-        self.clear()
-        self.create_header("LOGIN")
+        self.current_account = None
+        self.show("login")
+
+    def build_login(self, screen):
+        self.create_header(screen, "LOGIN")
 
-        content_frame = tk.Frame(self.root, bg=self.bg_primary)
+        content_frame = tk.Frame(screen, bg=self.bg_primary)
         content_frame.pack(expand=True, fill="both", padx=40)
 
         # Account Number
@@ -246,10 +244,22 @@ class ATMApp:
 
         # Buttons
         self.create_button(content_frame, "🔓 LOGIN", self.login, "primary").pack(pady=8)
-        self.create_button(content_frame, "📝 REGISTER", self.register, "secondary").pack(pady=8)
+        register_button = self.create_button(content_frame, "📝 REGISTER", self.register, "secondary")
+        register_button.pack(pady=8)
+        self.proses_buttons["register"] = (register_button, "📝 REGISTER")
+
+    def refresh_login(self):
+        self.reset_entry(self.ent_rek)
+        self.reset_entry(self.ent_pin)
 
     def login(self):
-        acc = self.bank.authenticate(self.ent_rek.get(), self.ent_pin.get())
+        future = self.bank.authenticate_async(
+            self.ent_rek.get(), self.ent_pin.get()
+        )
+        self.when_done(future, self.finish_login)
+
+    def finish_login(self, future):
+        acc = future.result()
         if acc:
             self.current_account = acc
             self.main_menu()
@@ -260,19 +270,25 @@ class ATMApp:
         if not self.ent_rek.get() or not self.ent_pin.get():
             messagebox.showerror("❌ Error", "Mohon isi semua field!")
             return
-            
-        if self.bank.add_account(self.ent_rek.get(), self.ent_pin.get()):
-            messagebox.showinfo("✅ Sukses", "Akun berhasil dibuat!")
-        else:
-            messagebox.showerror("❌ Error", "Rekening sudah ada!")
+
+        def selesai(created):
+            if created:
+                messagebox.showinfo("✅ Sukses", "Akun berhasil dibuat!")
+            else:
+                messagebox.showerror("❌ Error", "Rekening sudah ada!")
+
+        self.run_pending("register", selesai, self.bank.add_account,
+                         self.ent_rek.get(), self.ent_pin.get())
 
     # ---------- MENU UTAMA ----------
     def main_menu(self):
-        self.clear()
-        self.create_header("MENU UTAMA")
+        self.show("menu")
+
+    def build_menu(self, screen):
+        self.create_header(screen, "MENU UTAMA")
 
         # Welcome message
-        welcome_frame = tk.Frame(self.root, bg=self.bg_secondary, height=80)
+        welcome_frame = tk.Frame(screen, bg=self.bg_secondary, height=80)
         welcome_frame.pack(fill="x", padx=40, pady=(0, 20))
         welcome_frame.pack_propagate(False)
         
@@ -284,15 +300,15 @@ class ATMApp:
             fg=self.text_secondary
         ).pack(pady=(15, 0))
         
-        tk.Label(
+        self.lbl_rekening = tk.Label(
             welcome_frame,
-            text=f"Rek. {self.current_account._acc_number}",
             font=("Segoe UI", 14, "bold"),
             bg=self.bg_secondary,
             fg=self.success
-        ).pack()
+        )
+        self.lbl_rekening.pack()
 
-        content_frame = tk.Frame(self.root, bg=self.bg_primary)
+        content_frame = tk.Frame(screen, bg=self.bg_primary)
         content_frame.pack(expand=True, fill="both", padx=40)
 
         # Menu buttons
@@ -305,26 +321,21 @@ class ATMApp:
         tk.Frame(content_frame, bg=self.bg_primary, height=20).pack()
         self.create_button(content_frame, "🚪 LOGOUT", self.login_screen, "primary").pack(pady=5)
 
+    def refresh_menu(self):
+        self.lbl_rekening.config(text=f"Rek. {self.current_account._acc_number}")
+
     # ---------- SETOR ----------
     def setor_screen(self):
-        self.clear()
-        self.create_header("SETOR TUNAI")
+        self.show("setor")
+
+    def build_setor(self, screen):
+        self.create_header(screen, "SETOR TUNAI")
 
-        content_frame = tk.Frame(self.root, bg=self.bg_primary)
+        content_frame = tk.Frame(screen, bg=self.bg_primary)
         content_frame.pack(expand=True, fill="both", padx=40)
 
         # Balance display
-        balance_frame = tk.Frame(content_frame, bg=self.bg_secondary, height=60)
-        balance_frame.pack(fill="x", pady=(0, 30))
-        balance_frame.pack_propagate(False)
-        
-        tk.Label(
-            balance_frame,
-            text=f"Saldo Saat Ini: Rp {self.current_account.get_balance():,}",
-            font=("Segoe UI", 12, "bold"),
-            bg=self.bg_secondary,
-            fg=self.success
-        ).pack(pady=20)
+        self.create_balance(content_frame, "setor", (0, 30))
 
         self.create_label(content_frame, "Jumlah Setoran", 12, True).pack(anchor="w", pady=(0, 10))
         
@@ -332,46 +343,51 @@ class ATMApp:
         entry_frame.pack(fill="x", pady=(0, 30))
         entry_frame.pack_propagate(False)
         
-        ent = self.create_entry(entry_frame)
+        ent = self.ent_setor = self.create_entry(entry_frame)
         ent.pack(fill="both", padx=15, pady=12)
-        ent.insert(0, "0")
 
         def proses():
             try:
                 amt = int(ent.get())
-                if amt <= 0:
-                    messagebox.showerror("❌ Error", "Jumlah harus lebih dari 0!")
-                    return
-                self.current_account.deposit(amt)
-                self.bank.update_account(self.current_account)
+            except ValueError:
+                messagebox.showerror("❌ Error", "Input tidak valid!")
+                return
+            if amt <= 0:
+                messagebox.showerror("❌ Error", "Jumlah harus lebih dari 0!")
+                return
+            account = self.current_account
+
+            def setor():
+                # One atomic save; nothing changes here if it fails
+                return self.bank.deposit(account._acc_number, amt)
+
+            def selesai(stored):
+                if self.current_account is account:
+                    self.current_account = stored
                 messagebox.showinfo("✅ Sukses", f"Setor Rp {amt:,} berhasil!")
                 self.main_menu()
-            except:
-                messagebox.showerror("❌ Error", "Input tidak valid!")
 
-        self.create_button(content_frame, "✔ PROSES SETOR", proses, "primary").pack(pady=8)
+            self.run_pending("setor", selesai, setor)
+
+        self.create_proses_button(content_frame, "setor", "✔ PROSES SETOR", proses).pack(pady=8)
         self.create_button(content_frame, "← KEMBALI", self.main_menu, "secondary").pack(pady=8)
 
+    def refresh_setor(self):
+        self.refresh_balance("setor")
+        self.reset_entry(self.ent_setor, "0")
+
     # ---------- TARIK ----------
     def tarik_screen(self):
-        self.clear()
-        self.create_header("TARIK TUNAI")
+        self.show("tarik")
+
+    def build_tarik(self, screen):
+        self.create_header(screen, "TARIK TUNAI")
 
-        content_frame = tk.Frame(self.root, bg=self.bg_primary)
+        content_frame = tk.Frame(screen, bg=self.bg_primary)
         content_frame.pack(expand=True, fill="both", padx=40)
 
         # Balance display
-        balance_frame = tk.Frame(content_frame, bg=self.bg_secondary, height=60)
-        balance_frame.pack(fill="x", pady=(0, 20))
-        balance_frame.pack_propagate(False)
-        
-        tk.Label(
-            balance_frame,
-            text=f"Saldo Saat Ini: Rp {self.current_account.get_balance():,}",
-            font=("Segoe UI", 12, "bold"),
-            bg=self.bg_secondary,
-            fg=self.success
-        ).pack(pady=20)
+        self.create_balance(content_frame, "tarik", (0, 20))
 
         # Info
         info_label = tk.Label(
@@ -389,48 +405,53 @@ class ATMApp:
         entry_frame.pack(fill="x", pady=(0, 30))
         entry_frame.pack_propagate(False)
         
-        ent = self.create_entry(entry_frame)
+        ent = self.ent_tarik = self.create_entry(entry_frame)
         ent.pack(fill="both", padx=15, pady=12)
-        ent.insert(0, "0")
 
         def proses():
             try:
                 amt = int(ent.get())
-                if amt <= 0:
-                    messagebox.showerror("❌ Error", "Jumlah harus lebih dari 0!")
-                    return
-                if not self.current_account.withdraw(amt):
+            except ValueError:
+                messagebox.showerror("❌ Error", "Input tidak valid!")
+                return
+            if amt <= 0:
+                messagebox.showerror("❌ Error", "Jumlah harus lebih dari 0!")
+                return
+            account = self.current_account
+
+            def tarik():
+                return self.bank.withdraw(account._acc_number, amt)
+
+            def selesai(stored):
+                if stored is None:
                     messagebox.showerror("❌ Error", "Saldo tidak cukup!\n(Termasuk biaya admin Rp 2.000)")
                     return
-                self.bank.update_account(self.current_account)
+                if self.current_account is account:
+                    self.current_account = stored
                 messagebox.showinfo("✅ Sukses", f"Tarik Rp {amt:,} berhasil!")
                 self.main_menu()
-            except:
-                messagebox.showerror("❌ Error", "Input tidak valid!")
 
-        self.create_button(content_frame, "✔ PROSES TARIK", proses, "primary").pack(pady=8)
+            self.run_pending("tarik", selesai, tarik)
+
+        self.create_proses_button(content_frame, "tarik", "✔ PROSES TARIK", proses).pack(pady=8)
         self.create_button(content_frame, "← KEMBALI", self.main_menu, "secondary").pack(pady=8)
 
+    def refresh_tarik(self):
+        self.refresh_balance("tarik")
+        self.reset_entry(self.ent_tarik, "0")
+
     # ---------- TRANSFER ----------
     def transfer_screen(self):
-        self.clear()
-        self.create_header("TRANSFER")
+        self.show("transfer")
+
+    def build_transfer(self, screen):
+        self.create_header(screen, "TRANSFER")
 
-        content_frame = tk.Frame(self.root, bg=self.bg_primary)
+        content_frame = tk.Frame(screen, bg=self.bg_primary)
         content_frame.pack(expand=True, fill="both", padx=40)
 
         # Balance display
-        balance_frame = tk.Frame(content_frame, bg=self.bg_secondary, height=60)
-        balance_frame.pack(fill="x", pady=(0, 30))
-        balance_frame.pack_propagate(False)
-        
-        tk.Label(
-            balance_frame,
-            text=f"Saldo Saat Ini: Rp {self.current_account.get_balance():,}",
-            font=("Segoe UI", 12, "bold"),
-            bg=self.bg_secondary,
-            fg=self.success
-        ).pack(pady=20)
+        self.create_balance(content_frame, "transfer", (0, 30))
 
         # Target account
         self.create_label(content_frame, "Rekening Tujuan", 12, True).pack(anchor="w", pady=(0, 10))
@@ -438,7 +459,7 @@ class ATMApp:
         entry_frame1.pack(fill="x", pady=(0, 20))
         entry_frame1.pack_propagate(False)
         
-        ent_rek = self.create_entry(entry_frame1)
+        ent_rek = self.ent_tujuan = self.create_entry(entry_frame1)
         ent_rek.pack(fill="both", padx=15, pady=12)
 
         # Amount
@@ -447,32 +468,38 @@ class ATMApp:
         entry_frame2.pack(fill="x", pady=(0, 30))
         entry_frame2.pack_propagate(False)
         
-        ent_amt = self.create_entry(entry_frame2)
+        ent_amt = self.ent_transfer = self.create_entry(entry_frame2)
         ent_amt.pack(fill="both", padx=15, pady=12)
-        ent_amt.insert(0, "0")
 
         def proses():
             try:
                 amt = int(ent_amt.get())
-                if amt <= 0:
-                    messagebox.showerror("❌ Error", "Jumlah harus lebih dari 0!")
-                    return
-                ok, msg = self.bank.transfer(
-                    self.current_account,
-                    ent_rek.get(),
-                    amt
-                )
+            except ValueError:
+                messagebox.showerror("❌ Error", "Input tidak valid!")
+                return
+            if amt <= 0:
+                messagebox.showerror("❌ Error", "Jumlah harus lebih dari 0!")
+                return
+
+            def selesai(result):
+                ok, msg = result
                 if ok:
                     messagebox.showinfo("✅ Sukses", f"{msg}\nJumlah: Rp {amt:,}")
                     self.main_menu()
                 else:
                     messagebox.showerror("❌ Error", msg)
-            except:
-                messagebox.showerror("❌ Error", "Input tidak valid!")
 
-        self.create_button(content_frame, "✔ PROSES TRANSFER", proses, "primary").pack(pady=8)
+            self.run_pending("transfer", selesai, self.bank.transfer,
+                             self.current_account, ent_rek.get(), amt)
+
+        self.create_proses_button(content_frame, "transfer", "✔ PROSES TRANSFER", proses).pack(pady=8)
         self.create_button(content_frame, "← KEMBALI", self.main_menu, "secondary").pack(pady=8)
 
+    def refresh_transfer(self):
+        self.refresh_balance("transfer")
+        self.reset_entry(self.ent_tujuan)
+        self.reset_entry(self.ent_transfer, "0")
+
     # ---------- OTHER ----------
     def check_balance(self):
         messagebox.showinfo(
@@ -482,9 +509,16 @@ class ATMApp:
         )
 
     def show_history(self):
-        h = self.current_account.get_history()
+        # Reading history waits for a save in progress, so it queues too
+        future = self.worker.submit(
+            self.bank.history_page, self.current_account._acc_number, 10
+        )
+        self.when_done(future, self.finish_history)
+
+    def finish_history(self, future):
+        h, _ = future.result()
         if h:
-            history_text = "\n".join([f"• {item}" for item in h[-10:]])  # Show last 10
+            history_text = "\n".join([f"• {item}" for item in h])  # Show last 10
             messagebox.showinfo("📋 History Transaksi", history_text)
         else:
             messagebox.showinfo("📋 History Transaksi", "Belum ada transaksi")
@@ -492,6 +526,12 @@ class ATMApp:
 
 # ================= RUN =================
 if __name__ == "__main__":
-    root = tk.Tk()
-    ATMApp(root)
+    root = load_tk().Tk()
+    server = os.environ.get("ATM_SERVER")
+    if server:
+        from bank.client import RemoteBank
+        host, _, port = server.rpartition(":")
+        ATMApp(root, RemoteBank(host, int(port)))
+    else:
+        ATMApp(root)
     root.mainloop()
\ No newline at end of file
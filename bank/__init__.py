@@ -0,0 +1,5 @@
+"""Banking engine shared by the ATM front-ends; imports without tkinter."""
+from bank.account import Account, SavingAccount
+from bank.bank import Bank, DATA_FILE, STORAGE
+
+__all__ = ["Account", "SavingAccount", "Bank", "DATA_FILE", "STORAGE"]
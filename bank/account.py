@@ -0,0 +1,50 @@
+from bank.records import Transaction, DEPOSIT, WITHDRAW, parse_legacy
+
+
+# ================= ACCOUNT =================
+class Account:
+    __slots__ = ("_acc_number", "_pin", "_balance", "_history", "_saved")
+
+    def __init__(self, acc_number, pin, balance=0, history=None):
+        self._acc_number = acc_number
+        self._pin = pin
+        self._balance = balance
+        self._history = history if history else []
+        self._saved = len(self._history)
+
+    def deposit(self, amount):
+        self._balance += amount
+        self._history.append(Transaction(DEPOSIT, amount))
+
+    def withdraw(self, amount):
+        if amount > self._balance:
+            return False
+        self._balance -= amount
+        self._history.append(Transaction(WITHDRAW, amount))
+        return True
+
+    def add_history(self, record):
+        if isinstance(record, str):
+            record = parse_legacy(record)
+        self._history.append(record)
+
+    def get_balance(self):
+        return self._balance
+
+    def get_history(self):
+        return self._history
+
+
+class SavingAccount(Account):
+    __slots__ = ()
+
+    ADMIN_FEE = 2000
+
+    def withdraw(self, amount):
+        admin_fee = self.ADMIN_FEE
+        total = amount + admin_fee
+        if total > self._balance:
+            return False
+        self._balance -= total
+        self._history.append(Transaction(WITHDRAW, amount, admin_fee))
+        return True
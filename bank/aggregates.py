@@ -0,0 +1,129 @@
+import time
+
+from bank.pins import LOCKED_PIN
+from bank.records import (
+    AccountRecord, DEPOSIT, WITHDRAW, TRANSFER_OUT, TRANSFER_IN, SYSTEM_PREFIX
+)
+
+# Bank-wide running totals are kept in system accounts next to the
+# customer accounts: TOTALS for all time, TOTALS + "/YYYY-MM-DD" per day
+TOTALS = SYSTEM_PREFIX + "totals"
+FIELDS = ("deposits", "withdrawals", "fees", "transfers_in", "transfers_out",
+          "transactions")
+
+
+# ================= TOTALS =================
+def zero():
+    return [0] * len(FIELDS)
+
+
+def tally(totals, entries):
+    """Add history entries to a totals list in place.
+
+    A withdrawal followed by the transfer-out entry it pays for counts
+    as one transfer, as both are written by the same operation.
+    """
+    i, n = 0, len(entries)
+    while i < n:
+        t = entries[i]
+        kind = t.kind
+        if kind == WITHDRAW:
+            paired = i + 1 < n and entries[i + 1].kind == TRANSFER_OUT
+            if paired and entries[i + 1].amount == t.amount:
+                totals[4] += t.amount
+                i += 1
+            else:
+                totals[1] += t.amount
+            totals[2] += t.fee
+        elif kind == DEPOSIT:
+            totals[0] += t.amount
+        elif kind == TRANSFER_IN:
+            totals[3] += t.amount
+        elif kind == TRANSFER_OUT:
+            totals[4] += t.amount
+        else:
+            i += 1
+            continue  # a NOTE moves no money
+        totals[5] += 1
+        i += 1
+
+
+def day_key(day):
+    """System account holding the bank-wide totals of a local day, given
+    as a ``datetime.date`` or ``"YYYY-MM-DD"``"""
+    return f"{TOTALS}/{day}"
+
+
+def entry_day(entries):
+    """Local day a change counts on: that of its last entry"""
+    return time.strftime("%Y-%m-%d", time.localtime(entries[-1].time))
+
+
+def as_dict(balance, totals):
+    result = dict(zip(FIELDS, totals or zero()))
+    result["balance"] = balance
+    return result
+
+
+# ================= TABLES =================
+def post(accounts, history, acc_number, data, delta, entries, stale=None,
+         before=None):
+    """Fold one change of ``acc_number`` into the running totals.
+
+    ``delta`` is the balance change and ``entries`` the history added
+    with it.  Bank-wide totals are only kept once ``build`` has run;
+    ``stale(record)`` tells a replay that a totals record already holds
+    the change.  ``before(key, record)`` is called ahead of changing a
+    totals record, with None for one about to be created.
+    """
+    if acc_number.startswith(SYSTEM_PREFIX):
+        return
+    if data.totals is not None:
+        tally(data.totals, entries)
+    keys = [TOTALS]
+    if entries:
+        keys.append(day_key(entry_day(entries)))
+    for key in keys:
+        record = accounts.get(key)
+        if record is None:
+            if key == TOTALS:
+                return
+            if before is not None:
+                before(key, None)
+            record = AccountRecord(LOCKED_PIN, totals=zero())
+            history.init(record)
+        elif stale is not None and stale(record):
+            continue
+        elif before is not None:
+            before(key, record)
+        record.balance += delta
+        tally(record.totals, entries)
+        accounts[key] = record  # marks it changed in lazy tables
+
+
+def build(accounts, history):
+    """Create the bank-wide totals of a table that has none.
+
+    Accounts stored before totals existed are tallied from their live
+    history; archived entries and daily totals of past days are not
+    recovered.  Returns False when the totals were already there.
+    """
+    if TOTALS in accounts:
+        return False
+    whole = AccountRecord(LOCKED_PIN, totals=zero())
+    history.init(whole)
+    for acc_number in list(accounts):
+        if acc_number.startswith(SYSTEM_PREFIX):
+            continue
+        data = accounts[acc_number]
+        if data.totals is None:
+            data.totals = zero()
+            tally(data.totals, history.read(
+                acc_number, data, history.first(data), history.count(data)
+            ))
+            accounts[acc_number] = data
+        whole.balance += data.balance
+        for i, value in enumerate(data.totals):
+            whole.totals[i] += value
+    accounts[TOTALS] = whole
+    return True
@@ -0,0 +1,173 @@
+import argparse
+import json
+import lzma
+import os
+import re
+import sys
+import time
+import zlib
+
+from bank.records import Transaction, pack
+
+CODECS = {
+    "lzma": (".xz", lzma.compress, lzma.decompress),
+    "zlib": (".zz", zlib.compress, zlib.decompress),
+}
+
+_SAFE_NAME = re.compile(r"[\w-]+")
+_ARCHIVE_NAME = re.compile(r"^(\d+)-(\d+)\.jsonl\.(xz|zz)$")
+
+
+# ================= ARCHIVE =================
+class Archive:
+    """Compressed, append-only store of history moved out of the live ledger.
+
+    Every compaction writes one file per account named after the absolute
+    index range it covers, e.g. ``000000000000-000000000500.jsonl.xz``.
+    Files are written to a temporary name, synced and renamed, so a crash
+    never leaves a half-written archive behind.
+    """
+
+    def __init__(self, root, codec="lzma"):
+        self.root = root
+        self.suffix, self._compress, _ = CODECS[codec]
+        os.makedirs(root, exist_ok=True)
+
+    def _dir(self, acc_number):
+        if _SAFE_NAME.fullmatch(acc_number):
+            return os.path.join(self.root, acc_number)
+        return os.path.join(self.root, "x" + acc_number.encode().hex())
+
+    def write(self, acc_number, start, entries):
+        """Archive entries ``start .. start + len(entries)`` of an account"""
+        directory = self._dir(acc_number)
+        os.makedirs(directory, exist_ok=True)
+        name = f"{start:012d}-{start + len(entries):012d}.jsonl{self.suffix}"
+        path = os.path.join(directory, name)
+        body = "".join(
+            json.dumps(t, separators=(",", ":"), default=pack) + "\n"
+            for t in entries
+        ).encode()
+        with open(path + ".tmp", "wb") as f:
+            f.write(self._compress(body))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+
+    def files(self, acc_number):
+        """Archive files of an account as ``(start, stop, path)``, in order"""
+        try:
+            names = os.listdir(self._dir(acc_number))
+        except FileNotFoundError:
+            return []
+        found = []
+        for name in names:
+            m = _ARCHIVE_NAME.match(name)
+            if m:
+                found.append((int(m.group(1)), int(m.group(2)),
+                              os.path.join(self._dir(acc_number), name)))
+        return sorted(found)
+
+    def entries(self, acc_number, upto=None):
+        """Yield archived entries oldest first, one file at a time.
+
+        ``upto`` is the archived offset recorded by the live store; any
+        range beyond it comes from a compaction that never completed and
+        is still live, so it is skipped.
+        """
+        position = 0
+        for start, stop, path in self.files(acc_number):
+            if upto is not None and stop > upto:
+                break
+            if stop <= position:
+                continue
+            with open(path, "rb") as f:
+                lines = _decompress(path, f.read()).decode().splitlines()
+            for line in lines[max(position - start, 0):]:
+                yield Transaction.unpack(json.loads(line))
+            position = stop
+
+
+class Discard:
+    """Archive that keeps nothing, for bookkeeping history that is of no
+    use once it is compacted away"""
+
+    def write(self, acc_number, start, entries):
+        pass
+
+
+def _decompress(path, data):
+    for suffix, _, decompress in CODECS.values():
+        if path.endswith(suffix):
+            return decompress(data)
+    raise ValueError(f"Unknown archive codec: {path}")
+
+
+# ================= COMPACTION =================
+def split_point(entries, keep=None, before=None):
+    """How many leading entries are old enough to archive.
+
+    An entry is old when more than ``keep`` newer entries follow it, or
+    when it is older than the epoch time ``before``.  Entries from
+    migrated history carry time 0 and always count as old by age.
+    """
+    cut = 0
+    if keep is not None:
+        cut = max(len(entries) - keep, 0)
+    if before is not None:
+        aged = 0
+        while aged < len(entries) and entries[aged].time < before:
+            aged += 1
+        cut = max(cut, aged)
+    return cut
+
+
+def checkpoint_balance(balance, live):
+    """Balance just before the first entry that stays live"""
+    return balance - sum(t.delta() for t in live)
+
+
+# ================= CLI =================
+def main(argv=None):
+    from bank.storage import STORAGE, STORAGE_KINDS, open_storage
+
+    parser = argparse.ArgumentParser(
+        description="Move old history into compressed archives"
+    )
+    parser.add_argument("--storage", default=STORAGE,
+                        choices=STORAGE_KINDS)
+    parser.add_argument("--segmented", action="store_true")
+    parser.add_argument("--keep", type=int,
+                        help="entries to keep live per account")
+    parser.add_argument("--older-than-days", type=float,
+                        help="archive entries older than this")
+    parser.add_argument("--codec", default="lzma", choices=sorted(CODECS))
+    parser.add_argument("--show", metavar="ACC",
+                        help="print the archived statement of an account")
+    args = parser.parse_args(argv)
+
+    from bank.bank import DATA_FILE, Bank
+
+    bank = Bank(open_storage(args.storage, DATA_FILE,
+                             segmented=args.segmented))
+    archive = Archive(os.path.splitext(DATA_FILE)[0] + ".archive",
+                      args.codec)
+    try:
+        if args.show:
+            for entry in bank.archived_history(args.show, archive):
+                print(entry)
+            return 0
+        if args.keep is None and args.older_than_days is None:
+            parser.error("give --keep and/or --older-than-days")
+        before = None
+        if args.older_than_days is not None:
+            before = time.time() - args.older_than_days * 86400
+        moved = bank.compact_history(archive, args.keep, before)
+        print(f"{moved} entries archived")
+    finally:
+        bank.storage.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
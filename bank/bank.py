@@ -0,0 +1,353 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+from bank.account import Account, SavingAccount
+from bank.aggregates import TOTALS, as_dict, day_key
+from bank.archive import Discard
+from bank.batch import Batch
+from bank.dedup import DEDUP_CAPACITY, DEDUP_TTL, DedupCache
+from bank.history import RECENT
+from bank.locks import LockManager
+from bank.metrics import (
+    NULL_METRICS, instrumented, found, funded, transfer_result,
+    storage_gauges
+)
+from bank.pins import (
+    LOCKED_PIN, hash_pin, verify_pin, needs_rehash, is_hashed
+)
+from bank.records import (
+    Transaction, NOTE, TRANSFER_OUT, TRANSFER_IN, SYSTEM_PREFIX
+)
+from bank.storage import STORAGE, open_storage
+
+DATA_FILE = "accounts.json"
+AUTH_WORKERS = os.cpu_count() or 1
+# Holds one NOTE per idempotency key, written with the change it covers
+KEYS = SYSTEM_PREFIX + "keys"
+
+
+# ================= BANK =================
+class Bank:
+    """Account operations over a Storage backend.
+
+    ``deposit``, ``withdraw`` and ``transfer`` take an optional client
+    idempotency key.  A repeat of a keyed request returns the first
+    result from ``dedup`` without running again.  Successful results are
+    stored in the ``KEYS`` account in the same store transaction as the
+    change itself, so the cache is rebuilt on start for keys younger
+    than ``dedup_ttl``; older ones are dropped from the store then.
+    """
+
+    def __init__(self, storage=None, metrics=None, auth_workers=AUTH_WORKERS,
+                 dedup_capacity=DEDUP_CAPACITY, dedup_ttl=DEDUP_TTL):
+        if storage is None:
+            storage = open_storage(STORAGE, DATA_FILE)
+        self.storage = storage
+        self.locks = LockManager()
+        # PIN hashing releases the GIL, so logins on this pool use every core
+        self.auth_pool = ThreadPoolExecutor(max_workers=auth_workers,
+                                            thread_name_prefix="auth")
+        self.metrics = metrics if metrics is not None else NULL_METRICS
+        if self.metrics.enabled:
+            storage.metrics = self.metrics
+            storage_gauges(self.metrics, storage)
+        self.dedup = DedupCache(dedup_capacity, dedup_ttl)
+        self._load_keys()
+
+    @instrumented("add_account", found)
+    def add_account(self, acc_number, pin):
+        if acc_number.startswith(SYSTEM_PREFIX):
+            return False
+        if self.storage.exists(acc_number):
+            return False
+        hashed = hash_pin(pin)
+        with self.locks.hold(acc_number):
+            if self.storage.exists(acc_number):
+                return False
+            self.storage.create(acc_number, hashed)
+        return True
+
+    def load_account(self, acc_number):
+        data = self.storage.get(acc_number)
+        if data is None:
+            return None
+        return SavingAccount(
+            acc_number,
+            data["pin"],
+            data["balance"],
+            data["history"]
+        )
+
+    @instrumented("authenticate", found)
+    def authenticate(self, acc_number, pin):
+        account = self.load_account(acc_number)
+        if account is None or not verify_pin(pin, account._pin):
+            return None
+        if needs_rehash(account._pin):
+            # Plaintext or outdated entry: store a fresh hash on login
+            account._pin = hash_pin(pin)
+            with self.locks.hold(acc_number):
+                self.storage.set_pin(acc_number, account._pin)
+        return account
+
+    def authenticate_async(self, acc_number, pin):
+        """Run ``authenticate`` on the auth pool; returns a Future, so an
+        event loop can poll it instead of blocking on the PIN hash"""
+        return self.auth_pool.submit(self.authenticate, acc_number, pin)
+
+    def migrate_pins(self):
+        """Hash every plaintext PIN in one commit; returns how many"""
+        plain = []
+        for acc_number in self.storage.acc_numbers():
+            pin = self.storage.get(acc_number, 0)["pin"]
+            if not is_hashed(pin):
+                plain.append((acc_number, pin))
+        hashes = self.auth_pool.map(hash_pin, [pin for _, pin in plain])
+        with self.storage.transaction():
+            for (acc_number, _), hashed in zip(plain, hashes):
+                self.storage.set_pin(acc_number, hashed)
+        return len(plain)
+
+    def history_page(self, acc_number, limit=RECENT, before=None):
+        """Return one page of history, oldest first, and the next cursor"""
+        return self.storage.history_page(acc_number, limit, before)
+
+    def statement(self, acc_number, start=None, end=None):
+        """Live entries of one account stamped in ``start <= time < end``;
+        ``bank.history.month_range`` gives the bounds of a month"""
+        return self.storage.statement(acc_number, start, end)
+
+    def statements(self, start=None, end=None):
+        """Yield ``(acc_number, entries)`` for every account with entries
+        in the range, for producing statements of the whole bank"""
+        for acc_number in self.storage.acc_numbers():
+            if acc_number.startswith(SYSTEM_PREFIX):
+                continue
+            entries = self.storage.statement(acc_number, start, end)
+            if entries:
+                yield acc_number, entries
+
+    def statement_page(self, acc_number, limit, start=None, end=None,
+                       after=None):
+        """One page of ``statement`` and the cursor of the next page, or
+        None after the last one"""
+        return self.storage.statement_page(acc_number, limit, start, end,
+                                           after)
+
+    def customer_accounts(self):
+        """Every account number except the bank's bookkeeping accounts"""
+        return [acc_number for acc_number in self.storage.acc_numbers()
+                if not acc_number.startswith(SYSTEM_PREFIX)]
+
+    def export(self, out, acc_numbers=None, start=None, end=None, fmt=None,
+               compress=None):
+        """Stream statements to ``out`` as CSV or JSONL, optionally
+        gzipped; see ``bank.export.export``"""
+        from bank.export import export
+        return export(self, out, acc_numbers, start, end, fmt, compress)
+
+    # ---------- TOTALS ----------
+    def totals(self, acc_number=None):
+        """Running totals of one account, or of every customer account
+        when ``acc_number`` is None; None for an unknown account.
+
+        A dict of ``aggregates.FIELDS`` and ``balance``, kept up to date
+        by the store with every change, so reading it is O(1).
+        """
+        return self.storage.totals(
+            TOTALS if acc_number is None else acc_number
+        )
+
+    def daily_totals(self, day=None):
+        """Bank-wide totals of one local day, a ``datetime.date`` or
+        ``"YYYY-MM-DD"`` (default today); ``balance`` is the net change
+        of that day"""
+        day = time.strftime("%Y-%m-%d") if day is None else day
+        totals = self.storage.totals(day_key(day))
+        return totals if totals is not None else as_dict(0, None)
+
+    def compact_history(self, archive, keep=None, before=None):
+        """Archive old history of every account; returns entries moved"""
+        moved = 0
+        for acc_number in self.storage.acc_numbers():
+            with self.locks.hold(acc_number):
+                moved += self.storage.compact(acc_number, archive, keep, before)
+        return moved
+
+    def archived_history(self, acc_number, archive):
+        """Yield the archived part of an account's history, oldest first"""
+        archived, _ = self.storage.balance_checkpoint(acc_number)
+        return archive.entries(acc_number, archived)
+
+    @instrumented("update_account")
+    def update_account(self, account: Account):
+        self._save(account)
+
+    def _save(self, account):
+        # deposit, withdraw and transfer save through here, so each of
+        # them is counted once under its own name
+        history = account.get_history()
+        with self.locks.hold(account._acc_number):
+            self.storage.update(
+                account._acc_number,
+                account.get_balance(),
+                history[account._saved:]
+            )
+        account._saved = len(history)
+
+    def _stored_account(self, acc_number):
+        account = self.load_account(acc_number)
+        if account is None:
+            raise ValueError("Rekening tidak ditemukan")
+        return account
+
+    @instrumented("deposit")
+    def deposit(self, acc_number, amount, key=None):
+        """Deposit atomically into the stored account and return it;
+        raises ValueError for an unknown account"""
+        request = ["deposit", acc_number, None, amount]
+        with self.key_lock(key):
+            if self.replay(key, request) is not None:
+                return self.load_account(acc_number)
+            with self.locks.hold(acc_number):
+                account = self._stored_account(acc_number)
+                account.deposit(amount)
+                with self.storage.transaction():
+                    self._save(account)
+                    self.record_key(key, request, True)
+            self.remember(key, request, True)
+        return account
+
+    @instrumented("withdraw", funded)
+    def withdraw(self, acc_number, amount, key=None):
+        """Withdraw atomically; returns the account, or None if short.
+        Raises ValueError for an unknown account"""
+        request = ["withdraw", acc_number, None, amount]
+        with self.key_lock(key):
+            ok = self.replay(key, request)
+            if ok is not None:
+                return self.load_account(acc_number) if ok else None
+            with self.locks.hold(acc_number):
+                account = self._stored_account(acc_number)
+                ok = account.withdraw(amount)
+                if ok:
+                    with self.storage.transaction():
+                        self._save(account)
+                        self.record_key(key, request, True)
+            self.remember(key, request, ok)
+        return account if ok else None
+
+    @instrumented("transfer", transfer_result)
+    def transfer(self, from_acc: Account, to_acc, amount, key=None):
+        request = ["transfer", from_acc._acc_number, to_acc, amount]
+        with self.key_lock(key):
+            result = self.replay(key, request)
+            if result is not None:
+                copy_state(from_acc, self.load_account(from_acc._acc_number))
+                return tuple(result)
+            result = self._transfer(from_acc, to_acc, amount, key, request)
+            self.remember(key, request, list(result))
+        return result
+
+    def _transfer(self, from_acc, to_acc, amount, key, request):
+        with self.locks.hold(from_acc._acc_number, to_acc):
+            # Bookkeeping accounts exist in the store but take no money
+            if (to_acc.startswith(SYSTEM_PREFIX)
+                    or not self.storage.exists(to_acc)):
+                return False, "Rekening tujuan tidak ditemukan"
+
+            # Work on the stored state, the caller's copy may be stale
+            account = self.load_account(from_acc._acc_number)
+            if amount > account.get_balance() or not account.withdraw(amount):
+                return False, "Saldo tidak cukup"
+            account.add_history(Transaction(TRANSFER_OUT, amount, 0, to_acc))
+
+            result = True, "Transfer berhasil"
+            with self.storage.transaction():
+                self._save(account)
+                self.storage.credit(
+                    to_acc,
+                    amount,
+                    Transaction(TRANSFER_IN, amount, 0, account._acc_number)
+                )
+                self.record_key(key, request, result)
+
+        copy_state(from_acc, account)
+        return result
+
+    # ---------- IDEMPOTENCY ----------
+    def key_lock(self, key):
+        """Serialize requests sharing ``key``, so a repeat racing the
+        first one waits for its result instead of running again"""
+        if key is None:
+            return nullcontext()
+        return self.locks.hold(KEYS + "/" + key)
+
+    def replay(self, key, request):
+        """First result of an earlier ``request`` with ``key``, or None"""
+        if key is None:
+            return None
+        hit = self.dedup.get(key)
+        if hit is None:
+            return None
+        first, result = hit
+        if first != request:
+            raise ValueError("Idempotency key dipakai untuk permintaan lain")
+        return result
+
+    def record_key(self, key, request, result):
+        """Store a key with its result; call inside the change's
+        ``storage.transaction()`` so both become durable together"""
+        if key is None:
+            return
+        if not self.storage.exists(KEYS):
+            self.storage.create(KEYS, LOCKED_PIN)
+        self.storage.credit(KEYS, 0, Transaction(
+            NOTE, 0, 0, json.dumps([key, request, result])
+        ))
+
+    def remember(self, key, request, result):
+        """Cache a result once its change is durable"""
+        if key is not None:
+            self.dedup.put(key, (request, result))
+
+    def _load_keys(self):
+        if not self.storage.exists(KEYS):
+            return
+        since = int(time.time() - self.dedup.ttl)
+        with self.locks.hold(KEYS):
+            self.storage.compact(KEYS, Discard(), before=since)
+        for entry in self.storage.statement(KEYS, since):
+            key, request, result = json.loads(entry.counterparty)
+            self.dedup.put(key, (request, result), entry.time)
+
+    @instrumented("apply_batch")
+    def apply_batch(self, rows):
+        """Settle deposits, withdrawals and transfers in one commit.
+
+        ``rows`` are dicts with ``op``, ``acc``, ``to`` and ``amount``, as
+        read by ``bank.batch.read_batch``.  Returns one result per row.
+        """
+        batch = Batch(SavingAccount.ADMIN_FEE)
+        batch.add(rows, self.storage.exists)
+        with self.locks.hold(*batch.accounts):
+            balances = [self.storage.get(acc_number, 0)["balance"]
+                        for acc_number in batch.accounts]
+            accepted, final = batch.settle(balances)
+            added = batch.entries(accepted)
+            with self.storage.transaction():
+                for acc_number, balance in zip(batch.accounts, final):
+                    if acc_number in added:
+                        self.storage.update(acc_number, balance,
+                                            added[acc_number])
+        return batch.report(accepted)
+
+
+def copy_state(account, stored):
+    """Copy the stored state into the caller's account object"""
+    account._balance = stored._balance
+    account._history = stored._history
+    account._saved = stored._saved
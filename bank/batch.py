@@ -0,0 +1,281 @@
+import argparse
+import csv
+import json
+import sys
+import time
+
+from bank.records import (
+    Transaction, DEPOSIT, WITHDRAW, TRANSFER_OUT, TRANSFER_IN, SYSTEM_PREFIX
+)
+
+_numpy = None  # resolved on first use, False when not installed
+
+OPS = ("deposit", "withdraw", "transfer")
+OK = "Berhasil"
+NO_FUNDS = "Saldo tidak cukup"
+
+
+def load_numpy():
+    """NumPy if installed; imported on first settlement, not at startup.
+    It is optional, the plain loop gives the same result."""
+    global _numpy
+    if _numpy is None:
+        try:
+            import numpy
+        except ImportError:
+            numpy = False
+        _numpy = numpy
+    return _numpy
+
+
+# ================= INPUT =================
+def read_batch(path):
+    """Yield operation rows from a CSV file with an ``op,acc,to,amount``
+    header or from JSON lines with the same keys"""
+    with open(path, "r", newline="") as f:
+        if path.endswith(".csv"):
+            yield from csv.DictReader(f)
+            return
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def parse_row(row):
+    """Return ``(op, acc, to, amount)`` or raise ValueError with the
+    message to report for the row"""
+    op = str(row.get("op", "")).strip().lower()
+    if op not in OPS:
+        raise ValueError("Operasi tidak dikenal")
+    acc = str(row.get("acc", "")).strip()
+    to = str(row.get("to") or "").strip() or None
+    amount = row.get("amount")
+    if isinstance(amount, str) and amount.strip().isdigit():
+        amount = int(amount)
+    if type(amount) is not int or amount <= 0:
+        raise ValueError("Jumlah tidak valid")
+    if op == "transfer":
+        if to is None:
+            raise ValueError("Rekening tujuan tidak ditemukan")
+        if to == acc:
+            raise ValueError("Rekening tujuan sama")
+    else:
+        to = None
+    return op, acc, to, amount
+
+
+# ================= SETTLEMENT =================
+class Batch:
+    """Validated operations over a dense index of the accounts they touch.
+
+    Every operation is one debit leg and/or one credit leg: a withdrawal
+    debits ``amount + fee``, a deposit credits ``amount``, a transfer
+    does both, the same way ``SavingAccount.withdraw`` charges its fee.
+    """
+
+    def __init__(self, fee):
+        self.fee = fee
+        self.index = {}
+        self.accounts = []
+        self.rows = []
+        self.ops = []
+        self.debit_acc = []
+        self.debit = []
+        self.credit_acc = []
+        self.credit = []
+        self.results = []
+
+    def _slot(self, acc_number):
+        slot = self.index.get(acc_number)
+        if slot is None:
+            slot = self.index[acc_number] = len(self.accounts)
+            self.accounts.append(acc_number)
+        return slot
+
+    def add(self, rows, exists):
+        """Validate every row up front; ``exists`` checks an account"""
+        known = {}
+        for number, row in enumerate(rows, 1):
+            try:
+                op, acc, to, amount = parse_row(row)
+            except (ValueError, AttributeError) as e:
+                self.results.append(_result(number, False, str(e)))
+                continue
+            for target, message in ((acc, "Rekening tidak ditemukan"),
+                                    (to, "Rekening tujuan tidak ditemukan")):
+                if target is not None and target not in known:
+                    known[target] = (not target.startswith(SYSTEM_PREFIX)
+                                     and exists(target))
+                if target is not None and not known[target]:
+                    self.results.append(_result(number, False, message))
+                    break
+            else:
+                self._add(number, op, acc, to, amount)
+                self.results.append(None)
+
+    def _add(self, number, op, acc, to, amount):
+        self.rows.append(number)
+        self.ops.append((op, acc, to, amount))
+        if op == "deposit":
+            self.debit_acc.append(-1)
+            self.debit.append(0)
+            self.credit_acc.append(self._slot(acc))
+            self.credit.append(amount)
+            return
+        self.debit_acc.append(self._slot(acc))
+        self.debit.append(amount + self.fee)
+        if op == "transfer":
+            self.credit_acc.append(self._slot(to))
+            self.credit.append(amount)
+        else:
+            self.credit_acc.append(-1)
+            self.credit.append(0)
+
+    def settle(self, balances):
+        """Apply the operations in order to ``balances`` (one per account
+        in ``self.accounts``); returns the accepted flags and the final
+        balances.  An operation is refused when its debit is larger than
+        the balance at that point, as ``Bank.transfer`` would refuse it.
+        """
+        start = _prefix_length(self, balances) if load_numpy() else 0
+        if start:
+            final = _vector_apply(self, balances, start)
+        else:
+            final = list(balances)
+        accepted = [True] * start
+        for k in range(start, len(self.ops)):
+            src, dst = self.debit_acc[k], self.credit_acc[k]
+            if src >= 0:
+                if self.debit[k] > final[src]:
+                    accepted.append(False)
+                    continue
+                final[src] -= self.debit[k]
+            if dst >= 0:
+                final[dst] += self.credit[k]
+            accepted.append(True)
+        return accepted, final
+
+    def entries(self, accepted, at=None):
+        """History entries per account for the accepted operations"""
+        at = int(time.time()) if at is None else at
+        added = {}
+        for (op, acc, to, amount), ok in zip(self.ops, accepted):
+            if not ok:
+                continue
+            if op == "deposit":
+                added.setdefault(acc, []).append(
+                    Transaction(DEPOSIT, amount, 0, None, at)
+                )
+                continue
+            entries = added.setdefault(acc, [])
+            entries.append(Transaction(WITHDRAW, amount, self.fee, None, at))
+            if op == "transfer":
+                entries.append(Transaction(TRANSFER_OUT, amount, 0, to, at))
+                added.setdefault(to, []).append(
+                    Transaction(TRANSFER_IN, amount, 0, acc, at)
+                )
+        return added
+
+    def report(self, accepted):
+        """One result per input row, in input order"""
+        flags = iter(zip(self.rows, accepted))
+        report = []
+        for result in self.results:
+            if result is None:
+                number, ok = next(flags)
+                result = _result(number, ok, OK if ok else NO_FUNDS)
+            report.append(result)
+        return report
+
+
+def _result(row, ok, message):
+    return {"row": row, "ok": ok, "message": message}
+
+
+def _prefix_length(batch, balances):
+    """How many leading operations can all be accepted, found in one
+    vectorized pass.
+
+    Every leg becomes an event on its account; a stable sort groups them
+    per account in batch order and a cumulative sum gives the running
+    balance after each.  Up to the first operation whose debit would go
+    negative, refusing nothing is exactly what the ordered loop does.
+    """
+    np = load_numpy()
+    n = len(batch.ops)
+    if n == 0:
+        return 0
+    debit_acc = np.asarray(batch.debit_acc, dtype=np.int64)
+    credit_acc = np.asarray(batch.credit_acc, dtype=np.int64)
+    # Interleave so each operation's debit comes before its credit
+    acc = np.stack([debit_acc, credit_acc], axis=1).ravel()
+    value = np.stack([-np.asarray(batch.debit, dtype=np.int64),
+                      np.asarray(batch.credit, dtype=np.int64)],
+                     axis=1).ravel()
+    op = np.repeat(np.arange(n), 2)
+    used = acc >= 0
+    acc, value, op = acc[used], value[used], op[used]
+
+    order = np.argsort(acc, kind="stable")
+    acc, value, op = acc[order], value[order], op[order]
+    total = np.cumsum(value)
+    starts = np.flatnonzero(np.r_[True, acc[1:] != acc[:-1]])
+    before = np.repeat(total[starts] - value[starts],
+                       np.diff(np.r_[starts, len(acc)]))
+    running = np.asarray(balances, dtype=np.int64)[acc] + total - before
+
+    short = op[(running < 0) & (value < 0)]
+    return int(short.min()) if len(short) else n
+
+
+def _vector_apply(batch, balances, count):
+    """Balances after accepting the first ``count`` operations"""
+    np = load_numpy()
+    final = np.asarray(balances, dtype=np.int64)
+    for accs, amounts, sign in ((batch.debit_acc, batch.debit, -1),
+                                (batch.credit_acc, batch.credit, 1)):
+        acc = np.asarray(accs[:count], dtype=np.int64)
+        amount = np.asarray(amounts[:count], dtype=np.int64)
+        used = acc >= 0
+        np.add.at(final, acc[used], sign * amount[used])
+    return [int(balance) for balance in final]
+
+
+# ================= CLI =================
+def write_report(report, out):
+    for result in report:
+        out.write(json.dumps(result) + "\n")
+
+
+def main(argv=None):
+    from bank.storage import STORAGE, STORAGE_KINDS, open_storage
+
+    parser = argparse.ArgumentParser(
+        description="Settle a CSV or JSONL file of operations in one commit"
+    )
+    parser.add_argument("batch", help="operations, .csv or .jsonl")
+    parser.add_argument("--storage", default=STORAGE, choices=STORAGE_KINDS)
+    parser.add_argument("--segmented", action="store_true")
+    parser.add_argument("--report", help="write the JSONL report here")
+    args = parser.parse_args(argv)
+
+    from bank.bank import DATA_FILE, Bank
+
+    bank = Bank(open_storage(args.storage, DATA_FILE,
+                             segmented=args.segmented))
+    try:
+        report = bank.apply_batch(read_batch(args.batch))
+    finally:
+        bank.storage.close()
+    if args.report:
+        with open(args.report, "w") as f:
+            write_report(report, f)
+    else:
+        write_report(report, sys.stdout)
+    done = sum(1 for result in report if result["ok"])
+    print(f"{done}/{len(report)} operations settled", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
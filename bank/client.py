@@ -0,0 +1,115 @@
+import json
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from bank.history import RECENT
+from bank.server import HOST, PORT
+
+
+# ================= CLIENT =================
+class RemoteBank:
+    """Thin client with the same interface ATMApp expects from Bank.
+
+    Money operations take an optional idempotency key: a terminal that
+    retries after a timeout with the same key gets the first result back
+    instead of moving the money twice.  The GUI thread, the worker
+    thread and the auth pool share the one connection, so a request and
+    its reply are exchanged under a lock.
+    """
+
+    def __init__(self, host=HOST, port=PORT, timeout=10):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.file = self.sock.makefile("rwb")
+        self.auth_pool = ThreadPoolExecutor(max_workers=1)
+        self._lock = threading.Lock()
+
+    def call(self, op, **params):
+        params["op"] = op
+        with self._lock:
+            self.file.write(json.dumps(params).encode() + b"\n")
+            self.file.flush()
+            line = self.file.readline()
+        if not line:
+            raise ConnectionError("Server menutup koneksi")
+        return json.loads(line)
+
+    def add_account(self, acc_number, pin):
+        return self.call("register", acc=acc_number, pin=pin)["ok"]
+
+    def authenticate(self, acc_number, pin):
+        reply = self.call("authenticate", acc=acc_number, pin=pin)
+        if not reply["ok"]:
+            return None
+        return RemoteAccount(self, acc_number, reply["balance"])
+
+    def authenticate_async(self, acc_number, pin):
+        return self.auth_pool.submit(self.authenticate, acc_number, pin)
+
+    def history_page(self, acc_number, limit=RECENT, before=None):
+        reply = self.call("history", limit=limit, before=before)
+        return reply.get("history", []), reply.get("cursor")
+
+    def update_account(self, account):
+        # Every operation is already committed by the server
+        pass
+
+    def deposit(self, acc_number, amount, key=None):
+        # The server applies it to the session's own account
+        reply = self.call("deposit", amount=amount, key=key)
+        if not reply["ok"]:
+            raise ValueError(reply["error"])
+        return RemoteAccount(self, acc_number, reply["balance"])
+
+    def withdraw(self, acc_number, amount, key=None):
+        reply = self.call("withdraw", amount=amount, key=key)
+        if reply["ok"]:
+            return RemoteAccount(self, acc_number, reply["balance"])
+        if reply["error"] == "Saldo tidak cukup":
+            return None
+        raise ValueError(reply["error"])
+
+    def transfer(self, from_acc, to_acc, amount, key=None):
+        reply = self.call("transfer", to=to_acc, amount=amount, key=key)
+        if "balance" in reply:
+            from_acc._balance = reply["balance"]
+        return reply["ok"], reply.get("message") or reply["error"]
+
+    def close(self):
+        self.auth_pool.shutdown()
+        self.file.close()
+        self.sock.close()
+
+
+class RemoteAccount:
+    """Session account whose operations execute on the server"""
+
+    __slots__ = ("_bank", "_acc_number", "_balance")
+
+    def __init__(self, bank, acc_number, balance):
+        self._bank = bank
+        self._acc_number = acc_number
+        self._balance = balance
+
+    def deposit(self, amount, key=None):
+        reply = self._bank.call("deposit", amount=amount, key=key)
+        if not reply["ok"]:
+            raise ValueError(reply["error"])
+        self._balance = reply["balance"]
+
+    def withdraw(self, amount, key=None):
+        reply = self._bank.call("withdraw", amount=amount, key=key)
+        if "balance" in reply:
+            self._balance = reply["balance"]
+        if not reply["ok"] and reply["error"] != "Saldo tidak cukup":
+            raise ValueError(reply["error"])
+        return reply["ok"]
+
+    def get_balance(self):
+        reply = self._bank.call("balance")
+        if reply["ok"]:
+            self._balance = reply["balance"]
+        return self._balance
+
+    def get_history(self):
+        return self._bank.history_page(self._acc_number)[0]
@@ -0,0 +1,49 @@
+import threading
+import time
+from collections import OrderedDict
+
+DEDUP_TTL = 24 * 3600
+DEDUP_CAPACITY = 100_000
+
+
+# ================= DEDUP CACHE =================
+class DedupCache:
+    """Results of requests by idempotency key, kept for ``ttl`` seconds
+    and for at most ``capacity`` keys.
+
+    Keys are kept in the order they were stored.  With one TTL for all,
+    that is also expiry order, so expired and surplus keys are always at
+    the front and every call is O(1) amortized.
+    """
+
+    def __init__(self, capacity=DEDUP_CAPACITY, ttl=DEDUP_TTL):
+        self.capacity = capacity
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires <= time.time():
+                del self._entries[key]
+                return None
+            return value
+
+    def put(self, key, value, stamp=None):
+        """Remember ``value``, stored at epoch ``stamp`` (default now)"""
+        now = time.time()
+        expires = (now if stamp is None else stamp) + self.ttl
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            entries = self._entries
+            while entries and (len(entries) > self.capacity
+                               or next(iter(entries.values()))[0] <= now):
+                entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
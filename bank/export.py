@@ -0,0 +1,178 @@
+import argparse
+import csv
+import gzip
+import io
+import json
+import os
+import sys
+import time
+
+PAGE = 1000  # entries read from the store at a time
+BUFFER = 1 << 16  # characters handed to the file at a time
+GZIP_LEVEL = 6  # level 9 costs about twice the time for a few percent
+FORMATS = ("csv", "jsonl")
+COLUMNS = ("acc_number", "time", "kind", "amount", "fee", "counterparty",
+           "description")
+
+
+# ================= ROWS =================
+def rows(bank, acc_numbers=None, start=None, end=None, page=PAGE,
+         stats=None):
+    """Yield one tuple of ``COLUMNS`` per statement entry, account by
+    account and oldest first.
+
+    Entries are read through ``bank.statement_page``, so only one page
+    of one account is held at a time.  ``acc_numbers`` defaults to every
+    customer account.  ``stats`` counts accounts and entries if given.
+    """
+    if acc_numbers is None:
+        acc_numbers = bank.customer_accounts()
+    for acc_number in acc_numbers:
+        if stats is not None:
+            stats["accounts"] += 1
+        cursor = None
+        while True:
+            entries, cursor = bank.statement_page(acc_number, page, start,
+                                                  end, cursor)
+            if stats is not None:
+                stats["entries"] += len(entries)
+            for t in entries:
+                yield (acc_number, t.time, t.kind, t.amount, t.fee,
+                       t.counterparty or "", str(t))
+            if cursor is None:
+                break
+
+
+# ================= FORMATS =================
+def csv_chunks(rows, size=BUFFER):
+    """Yield CSV text, header first, in pieces of about ``size``"""
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator="\n")
+    writer.writerow(COLUMNS)
+    for row in rows:
+        writer.writerow(row)
+        if buf.tell() >= size:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue()
+
+
+def jsonl_chunks(rows, size=BUFFER):
+    """Yield one JSON object per line in pieces of about ``size``"""
+    lines, length = [], 0
+    for row in rows:
+        line = json.dumps(dict(zip(COLUMNS, row)), ensure_ascii=False)
+        lines.append(line)
+        length += len(line) + 1
+        if length >= size:
+            yield "\n".join(lines) + "\n"
+            lines, length = [], 0
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+CHUNKS = {"csv": csv_chunks, "jsonl": jsonl_chunks}
+
+
+# ================= EXPORT =================
+def export(bank, out, acc_numbers=None, start=None, end=None, fmt=None,
+           compress=None):
+    """Write the statements of ``acc_numbers`` (default every customer
+    account) in ``start <= time < end`` to ``out``.
+
+    ``out`` is a path or an open file.  For a path, ``fmt`` and
+    ``compress`` default from the suffix (``.csv`` or ``.jsonl``, then
+    ``.gz``); a file is written as text unless ``compress`` is set, in
+    which case it must be binary.  Text is produced and compressed a
+    buffer at a time, so memory stays flat however much is exported.
+    Returns counts of the accounts and entries written.
+    """
+    path = os.fspath(out) if isinstance(out, (str, os.PathLike)) else None
+    if path is not None:
+        base = path[:-3] if path.endswith(".gz") else path
+        compress = path.endswith(".gz") if compress is None else compress
+        fmt = fmt or os.path.splitext(base)[1].lstrip(".")
+    if fmt not in CHUNKS:
+        raise ValueError(f"export format must be one of {FORMATS}, "
+                         f"not {fmt!r}")
+
+    stats = {"accounts": 0, "entries": 0}
+    chunks = CHUNKS[fmt](rows(bank, acc_numbers, start, end, stats=stats))
+    if path is not None and compress:
+        f = gzip.open(path, "wt", compresslevel=GZIP_LEVEL,
+                      encoding="utf-8", newline="")
+    elif path is not None:
+        f = open(path, "w", encoding="utf-8", newline="")
+    elif compress:
+        f = io.TextIOWrapper(gzip.GzipFile(fileobj=out, mode="wb",
+                                           compresslevel=GZIP_LEVEL),
+                             encoding="utf-8", newline="")
+    else:
+        f = None
+    if f is None:
+        for chunk in chunks:
+            out.write(chunk)
+        return stats
+    try:
+        for chunk in chunks:
+            f.write(chunk)
+    finally:
+        if path is None:
+            f.flush()
+            f.detach().close()  # ends the gzip stream, leaves ``out`` open
+        else:
+            f.close()
+    return stats
+
+
+# ================= CLI =================
+def main(argv=None):
+    from bank.storage import STORAGE, STORAGE_KINDS, open_storage
+    from bank.history import month_range
+
+    parser = argparse.ArgumentParser(
+        description="Export account statements as CSV or JSONL"
+    )
+    parser.add_argument("out", help="output file, .csv or .jsonl, "
+                                    "optionally .gz")
+    parser.add_argument("accounts", nargs="*",
+                        help="account numbers (default: every account)")
+    parser.add_argument("--storage", default=STORAGE, choices=STORAGE_KINDS)
+    parser.add_argument("--segmented", action="store_true")
+    parser.add_argument("--format", choices=FORMATS,
+                        help="default: from the suffix of out")
+    parser.add_argument("--month", help="only entries of one month, YYYY-MM")
+    args = parser.parse_args(argv)
+
+    start = end = None
+    if args.month:
+        try:
+            year, month = map(int, args.month.split("-"))
+            start, end = month_range(year, month)
+        except (ValueError, OverflowError):
+            parser.error("--month must be YYYY-MM")
+
+    from bank.bank import DATA_FILE, Bank
+
+    bank = Bank(open_storage(args.storage, DATA_FILE,
+                             segmented=args.segmented))
+    missing = [acc for acc in args.accounts if not bank.storage.exists(acc)]
+    if missing:
+        bank.storage.close()
+        parser.error(f"unknown accounts: {' '.join(missing)}")
+    t0 = time.perf_counter()
+    try:
+        stats = bank.export(args.out, args.accounts or None, start, end,
+                            args.format)
+    except ValueError as e:
+        parser.error(str(e))
+    finally:
+        bank.storage.close()
+    print(f"{stats['entries']} entries of {stats['accounts']} accounts "
+          f"exported in {time.perf_counter() - t0:.1f} s", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,84 @@
+import threading
+import time
+
+
+# ================= GROUP COMMIT =================
+class GroupCommit:
+    """Collect durable writes from many threads and flush them together.
+
+    Callers ``enqueue`` a record and get a ticket, then ``wait`` on it.  A
+    single writer thread gathers everything queued within ``window``
+    seconds (or until ``max_batch`` records are waiting), hands the batch
+    to ``flush`` - which must write and fsync it - and only then wakes the
+    callers of that batch.  One fsync is thus shared by the whole batch.
+    """
+
+    def __init__(self, flush, window=0.002, max_batch=512):
+        self._flush = flush
+        self.window = window
+        self.max_batch = max_batch
+        self._cond = threading.Condition()
+        self._queue = []
+        self._next = 1
+        self._done = 0
+        self._errors = {}
+        self._closed = False
+        self._thread = threading.Thread(
+            target=self._run, name="group-commit", daemon=True
+        )
+        self._thread.start()
+
+    def enqueue(self, record):
+        """Queue a record and return the ticket of its batch"""
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Group commit is closed")
+            self._queue.append(record)
+            if len(self._queue) == 1 or len(self._queue) >= self.max_batch:
+                self._cond.notify_all()
+            return self._next
+
+    def wait(self, ticket):
+        """Block until the batch holding ``ticket`` is durable"""
+        with self._cond:
+            while self._done < ticket:
+                self._cond.wait()
+            error = self._errors.get(ticket)
+        if error is not None:
+            raise error
+
+    def idle(self):
+        with self._cond:
+            return not self._queue
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+                deadline = time.monotonic() + self.window
+                while len(self._queue) < self.max_batch and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch, self._queue = self._queue, []
+                ticket = self._next
+                self._next += 1
+
+            try:
+                self._flush(batch)
+            except Exception as e:
+                self._errors[ticket] = e
+
+            with self._cond:
+                self._done = ticket
+                self._cond.notify_all()
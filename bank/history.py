@@ -0,0 +1,300 @@
+import json
+import os
+import re
+import time
+from array import array
+from bisect import bisect_left
+from itertools import accumulate
+
+from bank.records import Entries, Transaction
+
+RECENT = 10
+SEGMENT_SIZE = 256
+TIME_INDEX_CACHE = 4_000_000  # entry times kept in time indexes, 8 bytes each
+
+_SAFE_NAME = re.compile(r"[\w-]+")
+
+
+# ================= INLINE =================
+class InlineHistory:
+    """History kept as packed Entries inside the account table itself.
+
+    Indexes are absolute: entries archived by compaction still count, and
+    ``data.archived`` is the index of the first entry kept live.
+    """
+
+    def init(self, data):
+        data.history = Entries()
+
+    def adopt(self, acc_number, data):
+        if not isinstance(data.history, Entries):
+            data.history = Entries(data.history or ())
+
+    def first(self, data):
+        return data.archived
+
+    def count(self, data):
+        return data.archived + len(data.history)
+
+    def stage(self, acc_number, data, entries):
+        """Add entries to the in-memory table and return their index"""
+        at = self.count(data)
+        data.history.extend(entries)
+        return at
+
+    def persist(self, acc_number, at, entries):
+        pass
+
+    def restore(self, acc_number, data, at, entries):
+        data.history.extend(entries)
+
+    def settle(self, acc_number, data):
+        pass
+
+    def drop(self, acc_number, data, upto):
+        """Forget every entry before index ``upto`` (already archived)"""
+        # New Entries, so a rolled back transaction can put the old back
+        data.history = data.history.tail(upto - data.archived)
+        data.archived = upto
+
+    def discard(self, acc_number, upto):
+        pass
+
+    def read(self, acc_number, data, start, stop):
+        first = data.archived
+        return data.history[max(start - first, 0):max(stop - first, 0)]
+
+    def times(self, data):
+        """Times of the live entries, without building Transactions"""
+        return data.history.times()
+
+    def sync(self):
+        pass
+
+
+# ================= SEGMENTS =================
+class SegmentedHistory:
+    """Per-account history on disk in fixed-size JSONL segment files.
+
+    Entry ``i`` of an account is line ``i % segment_size`` of segment
+    ``i // segment_size``, so a page is read from at most a couple of
+    small files and the account table only keeps an ``entries`` count
+    (plus ``archived``, the first index still live after compaction).
+    Segments are written after the owning record is durable, so after a
+    crash ``restore``/``settle`` can bring them back in line with it.
+    """
+
+    def __init__(self, root, segment_size=SEGMENT_SIZE):
+        self.root = root
+        self.segment_size = segment_size
+        self._touched = set()
+        os.makedirs(root, exist_ok=True)
+
+    def _dir(self, acc_number):
+        if _SAFE_NAME.fullmatch(acc_number):
+            return os.path.join(self.root, acc_number)
+        return os.path.join(self.root, "x" + acc_number.encode().hex())
+
+    def _path(self, acc_number, segment):
+        return os.path.join(self._dir(acc_number), f"{segment:08d}.jsonl")
+
+    def _lines(self, acc_number, segment):
+        """Complete lines of one segment; a torn last line is dropped"""
+        try:
+            with open(self._path(acc_number, segment), "r") as f:
+                text = f.read()
+        except FileNotFoundError:
+            return []
+        lines = text.split("\n")
+        return lines[:-1]
+
+    # ---------- TABLE ----------
+    def init(self, data):
+        data.entries = 0
+
+    def adopt(self, acc_number, data):
+        """Move inline history from an older table into segments"""
+        history, data.history = data.history, None
+        if history is not None:
+            self.truncate(acc_number, 0)
+            self._pad(acc_number, data.archived)
+            self.persist(acc_number, data.archived, history)
+            data.entries = data.archived + len(history)
+
+    def first(self, data):
+        return data.archived
+
+    def count(self, data):
+        return data.entries
+
+    def stage(self, acc_number, data, entries):
+        at = data.entries
+        data.entries += len(entries)
+        return at
+
+    # ---------- DISK ----------
+    def persist(self, acc_number, at, entries):
+        size = self.segment_size
+        i = 0
+        while i < len(entries):
+            segment, line = divmod(at + i, size)
+            n = min(size - line, len(entries) - i)
+            if line == 0:
+                os.makedirs(self._dir(acc_number), exist_ok=True)
+            path = self._path(acc_number, segment)
+            with open(path, "a") as f:
+                f.write("".join(
+                    json.dumps(t.pack(), separators=(",", ":")) + "\n"
+                    for t in entries[i:i + n]
+                ))
+            self._touched.add(path)
+            i += n
+
+    def _pad(self, acc_number, first):
+        """Fill the archived head of a partly archived segment"""
+        line = first % self.segment_size
+        if line:
+            os.makedirs(self._dir(acc_number), exist_ok=True)
+            path = self._path(acc_number, first // self.segment_size)
+            with open(path, "w") as f:
+                f.write("null\n" * line)
+
+    def drop(self, acc_number, data, upto):
+        data.archived = upto
+
+    def discard(self, acc_number, upto):
+        """Delete segments that only hold entries before ``upto``"""
+        try:
+            names = os.listdir(self._dir(acc_number))
+        except FileNotFoundError:
+            return
+        for name in names:
+            if name.endswith(".jsonl"):
+                segment = int(name[:-6])
+                if (segment + 1) * self.segment_size <= upto:
+                    os.remove(os.path.join(self._dir(acc_number), name))
+
+    def read(self, acc_number, data, start, stop):
+        size = self.segment_size
+        entries = []
+        start = max(start, self.first(data))
+        if stop <= start:
+            return entries
+        for segment in range(start // size, (stop - 1) // size + 1):
+            base = segment * size
+            lines = self._lines(acc_number, segment)
+            for line in lines[max(start - base, 0):stop - base]:
+                entries.append(Transaction.unpack(json.loads(line)))
+        return entries
+
+    def times(self, data):
+        """None: the times are on disk, read with the entries"""
+        return None
+
+    def length(self, acc_number):
+        """Number of complete entries actually on disk"""
+        try:
+            names = os.listdir(self._dir(acc_number))
+        except FileNotFoundError:
+            return 0
+        segments = [int(name[:-6]) for name in names if name.endswith(".jsonl")]
+        if not segments:
+            return 0
+        last = max(segments)
+        return last * self.segment_size + len(self._lines(acc_number, last))
+
+    def truncate(self, acc_number, count):
+        """Drop every entry from index ``count`` on, and any torn line"""
+        size = self.segment_size
+        keep, rest = divmod(count, size)
+        try:
+            names = os.listdir(self._dir(acc_number))
+        except FileNotFoundError:
+            return
+        for name in names:
+            if not name.endswith(".jsonl"):
+                continue
+            segment = int(name[:-6])
+            if segment > keep or (segment == keep and rest == 0):
+                os.remove(os.path.join(self._dir(acc_number), name))
+            elif segment == keep:
+                lines = self._lines(acc_number, segment)[:rest]
+                with open(self._path(acc_number, segment), "w") as f:
+                    f.write("".join(line + "\n" for line in lines))
+
+    # ---------- RECOVERY ----------
+    def restore(self, acc_number, data, at, entries):
+        """Re-apply a replayed record, writing only what the disk lacks"""
+        end = at + len(entries)
+        have = self.length(acc_number)
+        if have < end:
+            start = max(have, at)
+            self.truncate(acc_number, start)
+            self.persist(acc_number, start, entries[start - at:])
+        data.entries = end
+
+    def settle(self, acc_number, data):
+        """Drop torn lines and entries written past the last durable record"""
+        self.truncate(acc_number, data.entries)
+
+    def sync(self):
+        for path in self._touched:
+            try:
+                with open(path, "a") as f:
+                    os.fsync(f.fileno())
+            except FileNotFoundError:
+                pass
+        self._touched.clear()
+
+
+# ================= TIME INDEX =================
+class TimeIndex:
+    """Entry times of one account's live history, for date-range lookups.
+
+    ``times[i]`` belongs to absolute entry ``first + i`` and holds the
+    latest stamp up to that entry, so the array stays sorted even if the
+    clock stepped back; such an entry is filed with the period of the
+    later stamp before it.  Migrated entries are stamped 0 and sort first.
+    """
+
+    __slots__ = ("first", "times")
+
+    def __init__(self, first, entries=()):
+        self.first = first
+        self.times = array("q")
+        self.add(entries)
+
+    def add(self, entries):
+        self.extend([entry.time for entry in entries])
+
+    def extend(self, stamps):
+        """Add the times of the next entries, in entry order"""
+        stamps = list(stamps)
+        if self.times:
+            stamps.insert(0, self.times.pop())
+        # Stamps are nearly always in order already; sorting checks that
+        # in one C-level pass, the running maximum is the slow fallback
+        if stamps != sorted(stamps):
+            stamps = list(accumulate(stamps, max))
+        self.times.extend(stamps)
+
+    def drop(self, upto):
+        """Forget entries before absolute index ``upto``"""
+        del self.times[:upto - self.first]
+        self.first = upto
+
+    def span(self, start=None, end=None):
+        """Absolute ``(lo, hi)`` indexes of entries with ``start <= time <
+        end``; either bound may be None for an open range"""
+        times = self.times
+        lo = 0 if start is None else bisect_left(times, start)
+        hi = len(times) if end is None else bisect_left(times, end, lo)
+        return self.first + lo, self.first + hi
+
+
+def month_range(year, month):
+    """Local-time epoch bounds ``(start, end)`` of one calendar month"""
+    start = time.mktime((year, month, 1, 0, 0, 0, 0, 0, -1))
+    year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    end = time.mktime((year, month, 1, 0, 0, 0, 0, 0, -1))
+    return int(start), int(end)
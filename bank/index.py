@@ -0,0 +1,133 @@
+import mmap
+import os
+import struct
+import zlib
+
+MAGIC = b"ATMIDX01"
+HEADER = struct.Struct("<8sQQQ")  # magic, capacity, count, generation
+SLOT = struct.Struct("<32sQI")  # account number, offset, length
+KEY_SIZE = 32
+LOAD_FACTOR = 0.7
+
+
+# ================= DISK INDEX =================
+class DiskIndex:
+    """On-disk hash table from account number to record location.
+
+    Fixed-width slots with linear probing live in a memory-mapped file, so
+    a lookup touches one or two pages and nothing is loaded up front.  The
+    table doubles (rewriting the file) once it is ``LOAD_FACTOR`` full.
+    """
+
+    def __init__(self, path, capacity=1024):
+        self.path = path
+        if not os.path.exists(path):
+            self._create(path, capacity)
+        self._open()
+
+    def _create(self, path, capacity, generation=0):
+        with open(path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, capacity, 0, generation))
+            f.truncate(HEADER.size + capacity * SLOT.size)
+
+    def reopen(self):
+        """Map the file again after it was replaced on disk"""
+        self._open()
+
+    def _open(self):
+        self._file = open(self.path, "r+b")
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        magic, self.capacity, self.count, self._generation = \
+            HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} is not an account index")
+
+    def _key(self, acc_number):
+        key = acc_number.encode()
+        if len(key) > KEY_SIZE:
+            raise ValueError("Nomor rekening terlalu panjang")
+        return key
+
+    def _probe(self, key):
+        """Slot holding ``key``, or the empty slot where it would go"""
+        slot = zlib.crc32(key) % self.capacity
+        while True:
+            stored = SLOT.unpack_from(self._map, HEADER.size + slot * SLOT.size)
+            name = stored[0].rstrip(b"\0")
+            if not name or name == key:
+                return slot, stored
+            slot = (slot + 1) % self.capacity
+
+    def lookup(self, acc_number):
+        """Return ``(offset, length)`` of the record, or None"""
+        _, (name, offset, length) = self._probe(self._key(acc_number))
+        if not name.rstrip(b"\0"):
+            return None
+        return offset, length
+
+    def put(self, acc_number, offset, length):
+        key = self._key(acc_number)
+        slot, (name, _, _) = self._probe(key)
+        if not name.rstrip(b"\0"):
+            if (self.count + 1) > self.capacity * LOAD_FACTOR:
+                self._grow()
+                slot, _ = self._probe(key)
+            self.count += 1
+            self._write_header()
+        SLOT.pack_into(self._map, HEADER.size + slot * SLOT.size,
+                       key, offset, length)
+
+    def keys(self):
+        for slot in range(self.capacity):
+            name = SLOT.unpack_from(self._map, HEADER.size + slot * SLOT.size)[0]
+            name = name.rstrip(b"\0")
+            if name:
+                yield name.decode()
+
+    def items(self):
+        """``(acc_number, offset, length)`` of every account"""
+        for slot in range(self.capacity):
+            name, offset, length = SLOT.unpack_from(
+                self._map, HEADER.size + slot * SLOT.size
+            )
+            name = name.rstrip(b"\0")
+            if name:
+                yield name.decode(), offset, length
+
+    @property
+    def generation(self):
+        return self._generation
+
+    @generation.setter
+    def generation(self, value):
+        self._generation = value
+        self._write_header()
+
+    def _write_header(self):
+        HEADER.pack_into(self._map, 0, MAGIC, self.capacity, self.count,
+                         self._generation)
+
+    def _grow(self):
+        tmp = self.path + ".tmp"
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        bigger = DiskIndex(tmp, self.capacity * 2)
+        bigger.generation = self._generation
+        for slot in range(self.capacity):
+            name, offset, length = SLOT.unpack_from(
+                self._map, HEADER.size + slot * SLOT.size
+            )
+            if name.rstrip(b"\0"):
+                bigger.put(name.rstrip(b"\0").decode(), offset, length)
+        bigger.flush()
+        bigger.close()
+        self.close()
+        os.replace(tmp, self.path)
+        self._open()
+
+    def flush(self):
+        self._map.flush()
+
+    def close(self):
+        self._map.close()
+        self._file.close()
@@ -0,0 +1,316 @@
+import json
+import os
+import sys
+from collections import OrderedDict
+
+from bank.aggregates import build
+from bank.index import DiskIndex
+from bank.journal import apply_record, iter_records
+from bank.metrics import STORAGE_SECONDS
+from bank.records import AccountRecord, pack
+from bank.storage import JournalStorage, load_accounts, file_size
+
+CACHE_SIZE = 10_000
+COMPACT_MIN = 1 << 20  # record files smaller than this are left alone
+
+
+# ================= ACCOUNT TABLE =================
+class AccountTable:
+    """Dict-like account table that faults records in from disk.
+
+    Records live in an append-only file located through a DiskIndex; only
+    the ``capacity`` most recently used clean accounts stay in memory.
+    Modified accounts are pinned outside the LRU until ``flush`` writes
+    them back, because until then the journal still holds their changes.
+    Every write-back leaves the old copy behind, so once the file has
+    grown to twice its live records ``flush`` rewrites it compactly.
+    """
+
+    def __init__(self, records_path, index, capacity=CACHE_SIZE):
+        self.records_path = records_path
+        self.index = index
+        self.capacity = capacity
+        self._cache = OrderedDict()
+        self._dirty = {}
+        if not os.path.exists(records_path):
+            open(records_path, "wb").close()
+        self._file = open(records_path, "r+b")
+        # Size after the last compaction; live bytes are only counted
+        # once the file has doubled since
+        self._baseline = max(file_size(records_path), COMPACT_MIN)
+
+    def get(self, acc_number, default=None):
+        data = self._dirty.get(acc_number)
+        if data is not None:
+            return data
+        data = self._cache.get(acc_number)
+        if data is not None:
+            self._cache.move_to_end(acc_number)
+            return data
+        location = self.index.lookup(acc_number)
+        if location is None:
+            return default
+        offset, length = location
+        self._file.seek(offset)
+        data = AccountRecord.from_dict(json.loads(self._file.read(length)))
+        self._cache[acc_number] = data
+        if len(self._cache) > self.capacity:
+            self._cache.popitem(last=False)
+        return data
+
+    def __getitem__(self, acc_number):
+        data = self.get(acc_number)
+        if data is None:
+            raise KeyError(acc_number)
+        return data
+
+    def __setitem__(self, acc_number, data):
+        self._cache.pop(acc_number, None)
+        self._dirty[acc_number] = data
+
+    def __delitem__(self, acc_number):
+        # Only an account not written back yet can be taken out again
+        del self._dirty[acc_number]
+
+    def __contains__(self, acc_number):
+        return (acc_number in self._dirty or acc_number in self._cache
+                or self.index.lookup(acc_number) is not None)
+
+    def __iter__(self):
+        for acc_number in self.index.keys():
+            yield acc_number
+        for acc_number in list(self._dirty):
+            if self.index.lookup(acc_number) is None:
+                yield acc_number
+
+    def mark_dirty(self, acc_number):
+        if acc_number not in self._dirty:
+            self._dirty[acc_number] = self[acc_number]
+            self._cache.pop(acc_number, None)
+
+    def dirty_count(self):
+        return len(self._dirty)
+
+    def __len__(self):
+        added = sum(1 for acc_number in self._dirty
+                    if self.index.lookup(acc_number) is None)
+        return self.index.count + added
+
+    def flush(self, generation):
+        """Write back every dirty account stamped with ``generation``"""
+        self._file.seek(0, os.SEEK_END)
+        offset = self._file.tell()
+        located = []
+        chunks = []
+        for acc_number, data in self._dirty.items():
+            data.gen = generation
+            line = (json.dumps(data, separators=(",", ":"), default=pack)
+                    + "\n").encode()
+            located.append((acc_number, offset, len(line)))
+            chunks.append(line)
+            offset += len(line)
+        self._file.write(b"".join(chunks))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        for acc_number, offset, length in located:
+            self.index.put(acc_number, offset, length)
+        self.index.generation = generation
+        self.index.flush()
+
+        # Written back, so they become ordinary evictable entries
+        for acc_number, data in self._dirty.items():
+            self._cache[acc_number] = data
+        self._dirty.clear()
+        while len(self._cache) > self.capacity:
+            self._cache.popitem(last=False)
+
+        if offset > 2 * self._baseline:
+            live = sum(length for _, _, length in self.index.items())
+            if 2 * live < offset:
+                self.compact()
+            else:
+                self._baseline = offset
+
+    def compact(self):
+        """Rewrite the record file with only the copy the index points
+        to, together with a new index.
+
+        Both are written beside the old ones; renaming the new index to
+        ``.ready`` is the commit point, after which ``finish_compaction``
+        swaps the pair in, also on the next open after a crash.
+        """
+        index = self.index
+        records_new = self.records_path + ".new"
+        index_new = index.path + ".new"
+        for leftover in (records_new, index_new):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+        fresh = DiskIndex(index_new, index.capacity)
+        fresh.generation = index.generation
+        offset = 0
+        with open(records_new, "wb") as out:
+            for acc_number, at, length in index.items():
+                self._file.seek(at)
+                out.write(self._file.read(length))
+                fresh.put(acc_number, offset, length)
+                offset += length
+            out.flush()
+            os.fsync(out.fileno())
+        fresh.flush()
+        fresh.close()
+        os.replace(index_new, index.path + ".ready")
+
+        self._file.close()
+        index.close()
+        finish_compaction(self.records_path, index.path)
+        self._file = open(self.records_path, "r+b")
+        index.reopen()
+        self._baseline = max(offset, COMPACT_MIN)
+
+    def close(self):
+        self._file.close()
+        self.index.close()
+
+
+def finish_compaction(records_path, index_path):
+    """Swap in the files of a committed compaction, or drop those of
+    one interrupted before its commit point"""
+    ready = index_path + ".ready"
+    if os.path.exists(ready):
+        if os.path.exists(records_path + ".new"):
+            os.replace(records_path + ".new", records_path)
+        os.replace(ready, index_path)
+        return
+    for leftover in (records_path + ".new", index_path + ".new"):
+        if os.path.exists(leftover):
+            os.remove(leftover)
+
+
+def compacted_paths(records_path, index_path):
+    """Record file and index holding the table, for readers that must
+    not finish a compaction themselves"""
+    ready = index_path + ".ready"
+    if not os.path.exists(ready):
+        return records_path, index_path
+    if os.path.exists(records_path + ".new"):
+        return records_path + ".new", ready
+    return records_path, ready
+
+
+# ================= REPLAY =================
+def replay(table, journal, history):
+    """Re-apply the log written since the table's last checkpoint to
+    ``table`` in memory; segments are repaired through ``history``"""
+    generation = table.index.generation
+    logged = generation
+    touched = set()
+
+    def stale(data):
+        return data.gen > logged
+
+    for record in journal.records():
+        if record["op"] == "gen":
+            logged = record["gen"]
+            continue
+        for sub in iter_records(record):
+            data = table.get(sub["acc"])
+            if data is not None:
+                if stale(data):
+                    continue  # written back by an interrupted checkpoint
+                table.mark_dirty(sub["acc"])
+            apply_record(table, sub, history, touched, stale)
+    for acc_number in touched:
+        history.settle(acc_number, table[acc_number])
+
+
+# ================= LAZY STORAGE =================
+class LazyStorage(JournalStorage):
+    """Journal backend whose account table is loaded on demand.
+
+    Start-up replays only the journal written since the last checkpoint,
+    faulting in the accounts it mentions; every other account is read
+    through the index the first time it is used.  A checkpoint writes the
+    dirty accounts back and bumps the index generation.  Each record keeps
+    the generation it was written in, so a replay after a crash in the
+    middle of a checkpoint skips changes an account already contains.
+    """
+
+    INDEX_ON_LOAD = False
+
+    def __init__(self, path, journal_path, records_path, index_path,
+                 history_dir, capacity=CACHE_SIZE, **options):
+        self.records_path = records_path
+        self.index_path = index_path
+        self.capacity = capacity
+        super().__init__(path, journal_path, history_dir=history_dir,
+                         **options)
+
+    def load(self):
+        finish_compaction(self.records_path, self.index_path)
+        fresh = not os.path.exists(self.index_path)
+        table = AccountTable(self.records_path, DiskIndex(self.index_path),
+                             self.capacity)
+        if fresh and os.path.exists(self.path):
+            self._import(table, load_accounts(self.path))
+        replay(table, self.journal, self.history_store)
+        build(table, self.history_store)
+        # Start from a clean log that names its generation
+        self._checkpoint(table)
+        return table
+
+    def _import(self, table, accounts):
+        """Build the record file from a legacy ``accounts.json``"""
+        for acc_number, data in accounts.items():
+            self.history_store.adopt(acc_number, data)
+            table[acc_number] = data
+            if table.dirty_count() >= self.capacity:
+                self.history_store.sync()
+                table.flush(table.index.generation)
+        self.history_store.sync()
+        table.flush(table.index.generation)
+
+    def _modify(self, acc_number):
+        # Pinned before the change, so a transaction touching more
+        # accounts than the cache holds cannot evict and reload one stale
+        self.accounts.mark_dirty(acc_number)
+        return super()._modify(acc_number)
+
+    def size(self):
+        return file_size(self.records_path, self.index_path,
+                         self.journal.log_file)
+
+    def checkpoint(self):
+        with self.metrics.time(STORAGE_SECONDS, call="checkpoint"):
+            self._checkpoint(self.accounts)
+
+    def _checkpoint(self, table):
+        self.history_store.sync()
+        generation = table.index.generation + 1
+        table.flush(generation)
+        self.journal.reset({"op": "gen", "gen": generation})
+
+    def close(self):
+        super().close()
+        self.accounts.close()
+
+
+def open_lazy(path, **options):
+    stem = os.path.splitext(path)[0]
+    return LazyStorage(
+        path, stem + ".journal", stem + ".records", stem + ".index",
+        stem + ".history", **options
+    )
+
+
+# ================= CLI =================
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 1:
+        print("usage: python -m bank.lazy_store accounts.json")
+        return 2
+    open_lazy(argv[0]).close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
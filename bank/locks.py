@@ -0,0 +1,48 @@
+import threading
+from contextlib import contextmanager
+
+
+# ================= LOCKS =================
+class LockManager:
+    """Per-account locks, so operations on unrelated accounts never wait.
+
+    ``hold`` takes the locks of every account involved in one go, always in
+    sorted account-number order, which rules out deadlocks between two
+    transfers running in opposite directions.  Locks are re-entrant and
+    only exist while somebody holds or waits for them.
+    """
+
+    def __init__(self):
+        self._guard = threading.Lock()
+        self._locks = {}
+
+    @contextmanager
+    def hold(self, *acc_numbers):
+        keys = sorted(set(acc_numbers))
+        locks = [self._ref(key) for key in keys]
+        acquired = []
+        try:
+            for lock in locks:
+                lock.acquire()
+                acquired.append(lock)
+            yield
+        finally:
+            for lock in reversed(acquired):
+                lock.release()
+            for key in keys:
+                self._unref(key)
+
+    def _ref(self, key):
+        with self._guard:
+            entry = self._locks.get(key)
+            if entry is None:
+                entry = self._locks[key] = [threading.RLock(), 0]
+            entry[1] += 1
+            return entry[0]
+
+    def _unref(self, key):
+        with self._guard:
+            entry = self._locks[key]
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[key]
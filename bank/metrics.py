@@ -0,0 +1,245 @@
+import bisect
+import functools
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+# Latency buckets in seconds, from an in-memory lookup to a slow fsync
+BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+OPERATIONS = "bank_operations_total"
+OPERATION_SECONDS = "bank_operation_seconds"
+STORAGE_SECONDS = "bank_storage_seconds"
+
+HELP = {
+    OPERATIONS: "Bank operations by result",
+    OPERATION_SECONDS: "Latency of Bank operations",
+    STORAGE_SECONDS: "Latency of persistence calls",
+    "bank_accounts": "Accounts in the store",
+    "bank_store_bytes": "Size of the store on disk",
+}
+
+# Stable label values for the messages Bank returns
+RESULTS = {
+    "Transfer berhasil": "ok",
+    "Saldo tidak cukup": "insufficient_funds",
+    "Rekening tujuan tidak ditemukan": "unknown_recipient",
+}
+
+
+# ================= REGISTRY =================
+class Metrics:
+    """Counters, latency histograms and scrape-time gauges.
+
+    Series are keyed by name and a sorted tuple of label pairs.  Gauges
+    are callbacks, so nothing is computed until a snapshot is taken.
+    """
+
+    enabled = True
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._gauges = {}
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        slot = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                counts = [0] * (len(self.buckets) + 1)
+                histogram = self._histograms[key] = [counts, 0.0]
+            histogram[0][slot] += 1
+            histogram[1] += seconds
+
+    @contextmanager
+    def time(self, name, **labels):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - t0, **labels)
+
+    def gauge(self, name, read):
+        """Register ``read()``, called on every snapshot"""
+        self._gauges[name] = read
+
+    def snapshot(self):
+        """Plain-dict copy of every series, for in-process scrapers"""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: (list(counts), total)
+                          for key, (counts, total) in self._histograms.items()}
+        return {
+            "counters": [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in sorted(counters.items())
+            ],
+            "histograms": [
+                {"name": name, "labels": dict(labels),
+                 "buckets": dict(zip(self.buckets + (float("inf"),),
+                                     _cumulative(counts))),
+                 "count": sum(counts), "sum": total}
+                for (name, labels), (counts, total)
+                in sorted(histograms.items())
+            ],
+            "gauges": {name: read() for name, read in self._gauges.items()},
+        }
+
+    def render(self):
+        """Prometheus text exposition format"""
+        snapshot = self.snapshot()
+        lines = []
+        typed = set()
+
+        def header(name, kind):
+            if name not in typed:
+                typed.add(name)
+                if name in HELP:
+                    lines.append(f"# HELP {name} {HELP[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for series in snapshot["counters"]:
+            header(series["name"], "counter")
+            lines.append(f"{series['name']}{_labels(series['labels'])} "
+                         f"{series['value']}")
+        for series in snapshot["histograms"]:
+            name, labels = series["name"], series["labels"]
+            header(name, "histogram")
+            for bound, count in series["buckets"].items():
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{name}_bucket{_labels(labels, le=le)} {count}")
+            lines.append(f"{name}_sum{_labels(labels)} {series['sum']}")
+            lines.append(f"{name}_count{_labels(labels)} {series['count']}")
+        for name, value in snapshot["gauges"].items():
+            header(name, "gauge")
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+class NullMetrics:
+    """Disabled registry: every call is a no-op"""
+
+    enabled = False
+
+    def inc(self, name, value=1, **labels):
+        pass
+
+    def observe(self, name, seconds, **labels):
+        pass
+
+    def time(self, name, **labels):
+        return _NO_TIMER
+
+    def gauge(self, name, read):
+        pass
+
+    def snapshot(self):
+        return {"counters": [], "histograms": [], "gauges": {}}
+
+    def render(self):
+        return ""
+
+
+_NO_TIMER = nullcontext()
+NULL_METRICS = NullMetrics()
+
+
+def _cumulative(counts):
+    total = 0
+    for count in counts:
+        total += count
+        yield total
+
+
+def _labels(labels, **extra):
+    pairs = list(labels.items()) + list(extra.items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"'
+                          for key, value in pairs) + "}"
+
+
+def _escape(value):
+    return (str(value).replace("\\", "\\\\").replace('"', '\\"')
+            .replace("\n", "\\n"))
+
+
+# ================= INSTRUMENTATION =================
+def instrumented(op, outcome=None):
+    """Count and time a Bank method under ``op``.
+
+    ``outcome(result)`` names the result label, "ok" by default.  With
+    disabled metrics the wrapper only adds one attribute check.
+    """
+    def wrap(method):
+        @functools.wraps(method)
+        def call(self, *args, **kwargs):
+            metrics = self.metrics
+            if not metrics.enabled:
+                return method(self, *args, **kwargs)
+            t0 = time.perf_counter()
+            try:
+                result = method(self, *args, **kwargs)
+            except Exception:
+                metrics.inc(OPERATIONS, op=op, result="error")
+                raise
+            finally:
+                metrics.observe(OPERATION_SECONDS, time.perf_counter() - t0,
+                                op=op)
+            metrics.inc(OPERATIONS, op=op,
+                        result=outcome(result) if outcome else "ok")
+            return result
+        return call
+    return wrap
+
+
+def found(result):
+    return "ok" if result else "failed"
+
+
+def funded(result):
+    return "ok" if result is not None else "insufficient_funds"
+
+
+def transfer_result(result):
+    return RESULTS.get(result[1], "failed")
+
+
+def storage_gauges(metrics, storage):
+    metrics.gauge("bank_accounts", storage.count)
+    metrics.gauge("bank_store_bytes", storage.size)
+
+
+# ================= HTTP =================
+def serve(metrics, host, port):
+    """Serve ``/metrics`` for Prometheus from a daemon thread"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type",
+                             "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
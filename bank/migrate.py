@@ -0,0 +1,235 @@
+import argparse
+import json
+import multiprocessing
+import os
+import re
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from bank.records import Transaction, NOTE, match_legacy
+
+CHUNK = 1 << 20  # characters read from the source at a time
+BATCH = 20_000  # history entries per unit of work handed to a process
+MIGRATE_KINDS = ("lazy", "sqlite")  # backends that stay bounded in memory
+_WS = re.compile(r"\s*")
+
+
+# ================= STREAM =================
+class JsonStream:
+    """Pull parser for one top-level JSON object, a value at a time.
+
+    Only the current value and the unread part of a chunk are held, so
+    memory is bounded by the largest single account, not the file.
+    """
+
+    def __init__(self, f, chunk_size=CHUNK):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buf = ""
+        self.pos = 0
+        self.offset = 0  # characters dropped from the front of buf
+
+    def _fill(self):
+        # Read at least as much as is buffered, so a value spanning many
+        # chunks is re-decoded a logarithmic number of times
+        data = self.f.read(max(self.chunk_size, len(self.buf) - self.pos))
+        if not data:
+            return False
+        self.offset += self.pos
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Next non-blank character, or "" at the end of the file"""
+        while True:
+            self.pos = _WS.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def take(self, chars):
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError(f"expected one of {chars!r} at character "
+                             f"{self.offset + self.pos}")
+        self.pos += 1
+        return char
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, self.pos = self.decoder.raw_decode(self.buf, self.pos)
+                return value
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+
+    def items(self):
+        """Yield the ``(key, value)`` pairs of the top-level object"""
+        self.take("{")
+        if self.peek() == "}":
+            return
+        while True:
+            key = self.value()
+            self.take(":")
+            yield key, self.value()
+            if self.take(",}") == "}":
+                return
+
+
+def iter_accounts(path, chunk_size=CHUNK):
+    """Yield ``(acc_number, data)`` from an ``accounts.json`` one account
+    at a time, without loading the whole file"""
+    with open(path, "r", encoding="utf-8") as f:
+        yield from JsonStream(f, chunk_size).items()
+
+
+# ================= PARSE =================
+def parse_account(acc_number, data):
+    """Return ``(acc_number, pin, balance, entries, quarantined, error)``.
+
+    ``entries`` are packed Transactions.  Entries that match no legacy
+    pattern are kept as NOTEs, so no text is lost, and listed in
+    ``quarantined`` as ``(index, entry)``.  ``error`` is set instead
+    when the account itself cannot be migrated.
+    """
+    if not isinstance(data, dict):
+        return acc_number, None, 0, [], [], "account is not an object"
+    pin = data.get("pin")
+    balance = data.get("balance")
+    if not isinstance(pin, str) or not isinstance(balance, int):
+        return acc_number, None, 0, [], [], "missing pin or balance"
+    entries = []
+    quarantined = []
+    for i, entry in enumerate(data.get("history") or ()):
+        if isinstance(entry, str):
+            t = match_legacy(entry)
+            if t is not None:
+                entries.append(t.pack())
+                continue
+        elif isinstance(entry, list) and 3 <= len(entry) <= 5:
+            entries.append(entry)  # already a typed record
+            continue
+        quarantined.append((i, entry))
+        text = entry if isinstance(entry, str) else json.dumps(entry)
+        entries.append(Transaction(NOTE, 0, 0, text, 0).pack())
+    return acc_number, pin, balance, entries, quarantined, None
+
+
+def parse_batch(batch):
+    """Worker entry point: parse a list of ``(acc_number, data)``"""
+    return [parse_account(acc_number, data) for acc_number, data in batch]
+
+
+def batches(accounts, size=BATCH):
+    """Group accounts into lists of about ``size`` history entries"""
+    batch, entries = [], 0
+    for acc_number, data in accounts:
+        batch.append((acc_number, data))
+        if isinstance(data, dict):
+            entries += len(data.get("history") or ()) + 1
+        if entries >= size:
+            yield batch
+            batch, entries = [], 0
+    if batch:
+        yield batch
+
+
+# ================= MIGRATE =================
+def migrate(source, storage, quarantine, workers=None, batch_size=BATCH):
+    """Copy every account of a legacy ``accounts.json`` into ``storage``.
+
+    Batches are parsed on a pool of ``workers`` processes (0 parses in
+    this process) and written in file order, one store transaction per
+    batch, with at most two batches per worker in flight.  Accounts
+    already in ``storage`` are skipped, so an interrupted run can be
+    repeated.  Every quarantined entry and skipped account is written
+    to ``quarantine`` as one JSON line.  Returns counts for a summary.
+    """
+    workers = os.cpu_count() if workers is None else workers
+    stats = {"accounts": 0, "entries": 0, "quarantined": 0, "skipped": 0}
+
+    def write(parsed):
+        with storage.transaction():
+            for acc_number, pin, balance, entries, bad, error in parsed:
+                if error is None and storage.exists(acc_number):
+                    error = "already in the target store"
+                for index, entry in bad:
+                    quarantine.write(json.dumps(
+                        {"acc": acc_number, "index": index, "entry": entry}
+                    ) + "\n")
+                if error is not None:
+                    quarantine.write(json.dumps(
+                        {"acc": acc_number, "error": error}
+                    ) + "\n")
+                    stats["skipped"] += 1
+                    continue
+                storage.create(acc_number, pin)
+                storage.update(acc_number, balance,
+                               [Transaction.unpack(entry) for entry in entries])
+                stats["accounts"] += 1
+                stats["entries"] += len(entries)
+                stats["quarantined"] += len(bad)
+
+    work = batches(iter_accounts(source), batch_size)
+    if workers == 0:
+        for batch in work:
+            write(parse_batch(batch))
+        return stats
+
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(workers, mp_context=context) as pool:
+        pending = deque()
+        for batch in work:
+            pending.append(pool.submit(parse_batch, batch))
+            if len(pending) >= 2 * workers:
+                write(pending.popleft().result())
+        while pending:
+            write(pending.popleft().result())
+    return stats
+
+
+# ================= CLI =================
+def main(argv=None):
+    from bank.storage import open_storage
+
+    parser = argparse.ArgumentParser(
+        description="Migrate a legacy accounts.json into a typed store"
+    )
+    parser.add_argument("source", help="legacy accounts.json")
+    parser.add_argument("target", help="path the new store is named after")
+    parser.add_argument("--storage", default="lazy", choices=MIGRATE_KINDS)
+    parser.add_argument("--quarantine", default="quarantine.jsonl",
+                        help="report of entries that could not be parsed")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--batch", type=int, default=BATCH)
+    args = parser.parse_args(argv)
+    if os.path.splitext(os.path.abspath(args.target))[0] == \
+            os.path.splitext(os.path.abspath(args.source))[0]:
+        parser.error("target must not share the name of source")
+
+    # A checkpoint per batch keeps the lazy store's dirty set small
+    options = {"checkpoint_every": 1} if args.storage == "lazy" else {}
+    storage = open_storage(args.storage, args.target, **options)
+    t0 = time.perf_counter()
+    try:
+        with open(args.quarantine, "w") as quarantine:
+            stats = migrate(args.source, storage, quarantine, args.workers,
+                            args.batch)
+    finally:
+        storage.close()
+    print(f"{stats['accounts']} accounts, {stats['entries']} entries "
+          f"migrated in {time.perf_counter() - t0:.1f} s; "
+          f"{stats['quarantined']} entries quarantined, "
+          f"{stats['skipped']} accounts skipped ({args.quarantine})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
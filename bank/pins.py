@@ -0,0 +1,75 @@
+import argparse
+import hashlib
+import hmac
+import os
+import sys
+
+ALGORITHM = "pbkdf2_sha256"
+ITERATIONS = 100_000  # a few tens of milliseconds per check
+SALT_BYTES = 16
+# Malformed on purpose, so verify_pin never accepts any PIN for it
+LOCKED_PIN = ALGORITHM + "$locked"
+
+
+# ================= HASHING =================
+def hash_pin(pin, iterations=ITERATIONS, salt=None):
+    """Salted PBKDF2 hash as ``pbkdf2_sha256$iterations$salt$hash``"""
+    salt = os.urandom(SALT_BYTES) if salt is None else salt
+    digest = hashlib.pbkdf2_hmac("sha256", pin.encode(), salt, iterations)
+    return f"{ALGORITHM}${iterations}${salt.hex()}${digest.hex()}"
+
+
+def is_hashed(stored):
+    return stored.startswith(ALGORITHM + "$")
+
+
+def verify_pin(pin, stored):
+    """Check ``pin`` against a hash, or against a legacy plaintext PIN.
+
+    hashlib releases the GIL while hashing, so checks running on
+    different threads proceed in parallel.
+    """
+    if not is_hashed(stored):
+        return hmac.compare_digest(pin.encode(), stored.encode())
+    try:
+        _, iterations, salt, digest = stored.split("$")
+        expected = bytes.fromhex(digest)
+        actual = hashlib.pbkdf2_hmac("sha256", pin.encode(),
+                                     bytes.fromhex(salt), int(iterations))
+    except ValueError:
+        return False
+    return hmac.compare_digest(actual, expected)
+
+
+def needs_rehash(stored, iterations=ITERATIONS):
+    """True for plaintext PINs and hashes weaker than ``iterations``"""
+    if not is_hashed(stored):
+        return True
+    return int(stored.split("$")[1]) < iterations
+
+
+# ================= CLI =================
+def main(argv=None):
+    from bank.storage import STORAGE, STORAGE_KINDS, open_storage
+
+    parser = argparse.ArgumentParser(
+        description="Hash every plaintext PIN in the account store"
+    )
+    parser.add_argument("--storage", default=STORAGE, choices=STORAGE_KINDS)
+    parser.add_argument("--segmented", action="store_true")
+    args = parser.parse_args(argv)
+
+    from bank.bank import DATA_FILE, Bank
+
+    bank = Bank(open_storage(args.storage, DATA_FILE,
+                             segmented=args.segmented))
+    try:
+        migrated = bank.migrate_pins()
+    finally:
+        bank.storage.close()
+    print(f"{migrated} PINs hashed")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
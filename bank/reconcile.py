@@ -0,0 +1,426 @@
+import argparse
+import json
+import multiprocessing
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+import time
+import zlib
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import groupby
+from operator import itemgetter
+
+from bank.account import SavingAccount
+from bank.history import SEGMENT_SIZE, InlineHistory, SegmentedHistory
+from bank.index import DiskIndex
+from bank.journal import JOURNAL, Journal, apply_record, load_snapshot
+from bank.lazy_store import AccountTable, compacted_paths, replay
+from bank.records import (
+    Transaction, WITHDRAW, TRANSFER_OUT, TRANSFER_IN, SYSTEM_PREFIX
+)
+from bank.snapshot import Snapshot, SnapshotTable, write_snapshot
+
+FEES = (0, SavingAccount.ADMIN_FEE)  # withdrawals of the old Account: none
+SCAN_PARTS = 4  # account ranges per worker, to even out the load
+JOIN_PARTITIONS = 64  # transfer legs are joined in this many pieces
+LOAD_ATTEMPTS = 5  # a store checkpointed while it is read is read again
+# Account numbers that can be spilled as tab-separated text; any other
+# leg is written as a JSON list
+_PLAIN = re.compile(r"[^\t\n\[]*")
+
+
+# ================= CHECKS =================
+class Ledger:
+    """Checks accounts one at a time within one worker.
+
+    The balance is replayed from the checkpoint through every live
+    entry, admin fees included.  Transfer legs are not matched here but
+    spilled to one file per join partition, keyed by sender and
+    receiver, so both legs of a transfer land in the same partition
+    whichever worker read them.
+    """
+
+    def __init__(self, spill_dir, tag, partitions=JOIN_PARTITIONS):
+        self.problems = []
+        self.accounts = 0
+        self.entries = 0
+        self._spill = [
+            open(os.path.join(spill_dir, f"legs.{p}.{tag}"), "w")
+            for p in range(partitions)
+        ]
+
+    def _leg(self, src, dst, amount, sign):
+        p = zlib.crc32(f"{src}\0{dst}".encode()) % len(self._spill)
+        if _PLAIN.fullmatch(f"{src}{dst}"):
+            line = f"{src}\t{dst}\t{amount}\t{sign}\n"
+        else:
+            line = json.dumps([src, dst, amount, sign]) + "\n"
+        self._spill[p].write(line)
+
+    def check(self, acc_number, balance, checkpoint, first, entries):
+        """``first`` is the absolute index of ``entries[0]``"""
+        self.accounts += 1
+        self.entries += len(entries)
+        replayed = checkpoint
+        prev = None
+        for i, t in enumerate(entries, first):
+            replayed += t.delta()
+            if t.kind == WITHDRAW and t.fee not in FEES:
+                self.problems.append({"check": "fee", "acc": acc_number,
+                                      "index": i, "fee": t.fee})
+            elif t.kind == TRANSFER_OUT:
+                if (prev is None or prev.kind != WITHDRAW
+                        or prev.amount != t.amount):
+                    self.problems.append({"check": "debit", "acc": acc_number,
+                                          "index": i, "amount": t.amount})
+                self._leg(acc_number, t.counterparty, t.amount, 1)
+            elif t.kind == TRANSFER_IN:
+                self._leg(t.counterparty, acc_number, t.amount, -1)
+            prev = t
+        if replayed != balance:
+            self.problems.append({"check": "balance", "acc": acc_number,
+                                  "stored": balance, "replayed": replayed})
+
+    def close(self):
+        for f in self._spill:
+            f.close()
+        return self.accounts, self.entries, self.problems
+
+
+# ================= WORKERS =================
+def scan(source, spill_dir, tag):
+    """Phase one: check one range of accounts of one store"""
+    ledger = Ledger(spill_dir, tag)
+    if source[0] == "sqlite":
+        _scan_sqlite(ledger, *source[1:])
+    else:
+        _scan_snapshot(ledger, *source[1:])
+    return ledger.close()
+
+
+def _scan_snapshot(ledger, path, history_dir, lo, hi):
+    snapshot = Snapshot(path)
+    history = FrozenSegments(history_dir) if history_dir else None
+    try:
+        for i in range(lo, hi):
+            acc_number, data = snapshot.record(i)
+            if acc_number.startswith(SYSTEM_PREFIX):
+                continue
+            entries = data.history
+            if entries is None:
+                entries = history.read(acc_number, data, data.archived,
+                                       data.entries)
+            ledger.check(acc_number, data.balance, data.checkpoint,
+                         data.archived, entries)
+    finally:
+        snapshot.close()
+
+
+def _scan_sqlite(ledger, path, lo, hi):
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    where, params = "acc_number >= ?", [lo]
+    if hi is not None:
+        where, params = where + " AND acc_number < ?", params + [hi]
+    try:
+        # Walk both tables in account order, one pass each
+        rows = conn.execute(
+            "SELECT acc_number, kind, amount, fee, counterparty, time "
+            f"FROM transactions WHERE {where} ORDER BY acc_number, id", params
+        )
+        groups = groupby(rows, key=itemgetter(0))
+        group = next(groups, None)
+        for acc_number, balance, archived, checkpoint in conn.execute(
+            "SELECT acc_number, balance, archived, checkpoint FROM accounts "
+            f"WHERE {where} ORDER BY acc_number", params
+        ):
+            while group is not None and group[0] < acc_number:
+                group = next(groups, None)  # history of no account
+            entries = []
+            if group is not None and group[0] == acc_number:
+                entries = [Transaction(kind, amount, fee, counterparty, t)
+                           for (_, kind, amount, fee, counterparty, t)
+                           in group[1]]
+                group = next(groups, None)
+            if not acc_number.startswith(SYSTEM_PREFIX):
+                ledger.check(acc_number, balance, checkpoint, archived,
+                             entries)
+    finally:
+        conn.close()
+
+
+def join(spill_dir, partition):
+    """Phase two: hash join of the transfer legs of one partition.
+
+    Each sent leg counts +1 and each received leg -1 on the key
+    (sender, receiver, amount); any key left non-zero is a discrepancy.
+    """
+    prefix = f"legs.{partition}."
+    net = Counter()
+    for name in os.listdir(spill_dir):
+        if not name.startswith(prefix):
+            continue
+        with open(os.path.join(spill_dir, name)) as f:
+            for line in f:
+                if line[0] == "[":
+                    src, dst, amount, sign = json.loads(line)
+                else:
+                    src, dst, amount, sign = line.split("\t")
+                    amount, sign = int(amount), int(sign)
+                net[src, dst, amount] += sign
+    return [{"check": "leg", "from": src, "to": dst, "amount": amount,
+             "unmatched": "transfer" if n > 0 else "receipt", "count": abs(n)}
+            for (src, dst, amount), n in net.items() if n]
+
+
+# ================= SOURCES =================
+class FrozenSegments(SegmentedHistory):
+    """Segment files of a live store, read but never written.
+
+    Entries a replay would write back to the segments are kept in
+    ``pending`` instead and merged into what ``read`` returns.
+    """
+
+    def __init__(self, root, segment_size=SEGMENT_SIZE):
+        self.root = root
+        self.segment_size = segment_size
+        self._touched = set()
+        self.pending = {}
+
+    def adopt(self, acc_number, data):
+        pass  # an inline history of an older table stays inline
+
+    def restore(self, acc_number, data, at, entries):
+        self.pending.setdefault(acc_number, {}).update(
+            zip(range(at, at + len(entries)), entries)
+        )
+        data.entries = at + len(entries)
+
+    def discard(self, acc_number, upto):
+        pass
+
+    def settle(self, acc_number, data):
+        pass
+
+    def read(self, acc_number, data, start, stop):
+        entries = super().read(acc_number, data, start, stop)
+        pending = self.pending.get(acc_number)
+        if not pending:
+            return entries
+        start = max(start, self.first(data))
+        merged = dict(zip(range(start, start + len(entries)), entries))
+        merged.update((i, t) for i, t in pending.items() if start <= i < stop)
+        return [merged[i] for i in range(start, stop) if i in merged]
+
+
+def _replay(table, journal, history):
+    """Apply the log of a journal store to ``table`` in memory.
+
+    Returns False when the log is newer than the table, i.e. a
+    checkpoint ran between reading the two.  A log older than the table
+    was left by a crash mid-checkpoint and is already contained in it.
+    """
+    marker = table.get(JOURNAL)
+    generation = 0 if marker is None else marker.gen
+    logged = None
+    for record in journal.records():
+        if logged is None:
+            logged = record["gen"] if record["op"] == "gen" else 0
+            if logged != generation:
+                return logged < generation
+            if record["op"] == "gen":
+                continue
+        apply_record(table, record, history)
+    return True
+
+
+def _write_image(kind, path, segmented, image):
+    """Write the store as of its last durable record to the snapshot
+    ``image``, reading its files without changing them; False if a
+    checkpoint got in the way"""
+    stem = os.path.splitext(path)[0]
+    history = (FrozenSegments(stem + ".history") if segmented
+               else InlineHistory())
+    journal = Journal(path, stem + ".journal")
+    if kind == "snapshot" and os.path.exists(stem + ".snap"):
+        table = SnapshotTable(Snapshot(stem + ".snap"), history.adopt)
+        rows = table.rows()
+    elif kind == "lazy" and os.path.exists(stem + ".index"):
+        records, index = compacted_paths(stem + ".records", stem + ".index")
+        table = AccountTable(records, DiskIndex(index))
+        replay(table, journal, history)
+        rows = ((acc_number, table[acc_number]) for acc_number in table)
+    else:
+        # A JSON table, or a store still to be converted from one
+        table = load_snapshot(path)
+        for acc_number, data in table.items():
+            history.adopt(acc_number, data)
+        rows = table.items()
+    try:
+        if kind in ("journal", "snapshot"):
+            if not _replay(table, journal, history):
+                return False
+        pending = getattr(history, "pending", {})
+
+        def inline(rows):
+            # Histories changed by the replay go into the image itself
+            for acc_number, record in rows:
+                if acc_number in pending:
+                    record.history = history.read(
+                        acc_number, record, record.archived, record.entries
+                    )
+                yield acc_number, record
+
+        write_snapshot(image, inline(rows))
+    finally:
+        if hasattr(table, "close"):
+            table.close()
+    return True
+
+
+def _stamp(paths):
+    stamp = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            stamp.append(None)
+        else:
+            stamp.append((st.st_ino, st.st_mtime_ns, st.st_size))
+    return stamp
+
+
+def sources(kind, path, segmented, parts, work_dir):
+    """Split one store into ``parts`` read-only ranges for ``scan``.
+
+    The store is never written, so it can be audited while the server
+    runs.  SQLite is read in place.  Every other backend is read from
+    its files, with the journal replayed in memory, and written out
+    once as a private snapshot image that the workers map; the image is
+    made again if a checkpoint replaced the files meanwhile.
+    """
+    stem = os.path.splitext(path)[0]
+    if kind == "sqlite":
+        db = stem + ".db"
+        conn = sqlite3.connect(f"file:{db}?mode=ro", uri=True)
+        try:
+            (count,) = conn.execute("SELECT COUNT(*) FROM accounts").fetchone()
+            bounds = [conn.execute(
+                "SELECT acc_number FROM accounts ORDER BY acc_number "
+                "LIMIT 1 OFFSET ?", (count * k // parts,)
+            ).fetchone()[0] for k in range(1, parts)] if count else []
+        finally:
+            conn.close()
+        bounds = sorted(set(bounds))
+        return [("sqlite", db, lo, hi)
+                for lo, hi in zip([""] + bounds, bounds + [None])]
+
+    segmented = segmented or kind == "lazy"
+    watched = [path, stem + ".snap", stem + ".index", stem + ".records",
+               stem + ".index.ready"]
+    fd, image = tempfile.mkstemp(".snap", dir=work_dir)
+    os.close(fd)
+    for _ in range(LOAD_ATTEMPTS):
+        before = _stamp(watched)
+        try:
+            written = _write_image(kind, path, segmented, image)
+        except ValueError:
+            written = False  # a JSON table caught while being rewritten
+        if written and _stamp(watched) == before:
+            break
+    else:
+        raise RuntimeError(f"{path} kept changing while it was read")
+    history_dir = stem + ".history" if segmented else None
+    snapshot = Snapshot(image)
+    count = len(snapshot)
+    snapshot.close()
+    cuts = sorted({count * k // parts for k in range(parts + 1)})
+    return [("snapshot", image, history_dir, lo, hi)
+            for lo, hi in zip(cuts, cuts[1:])]
+
+
+# ================= RECONCILE =================
+def reconcile(stores, workers=None):
+    """Audit every ledger of ``stores``, a list of ``(kind, path,
+    segmented)``; legs are matched across all of them, so the shard
+    stores of one bank are reconciled together.
+
+    Returns ``(accounts, entries, problems)``.  Legs of entries already
+    archived on one side, and the refund of a cross-shard transfer that
+    was aborted, show up as unmatched legs.
+    """
+    workers = os.cpu_count() if workers is None else workers
+    with tempfile.TemporaryDirectory() as work_dir:
+        spill_dir = os.path.join(work_dir, "legs")
+        os.mkdir(spill_dir)
+        parts = []
+        for kind, path, segmented in stores:
+            parts += sources(kind, path, segmented,
+                             max(workers, 1) * SCAN_PARTS, work_dir)
+
+        if workers == 0:
+            scanned = [scan(part, spill_dir, tag)
+                       for tag, part in enumerate(parts)]
+            joined = [join(spill_dir, p) for p in range(JOIN_PARTITIONS)]
+        else:
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(workers, mp_context=context) as pool:
+                scanned = list(pool.map(scan, parts,
+                                        [spill_dir] * len(parts),
+                                        range(len(parts))))
+                joined = list(pool.map(join, [spill_dir] * JOIN_PARTITIONS,
+                                       range(JOIN_PARTITIONS)))
+
+    accounts = sum(result[0] for result in scanned)
+    entries = sum(result[1] for result in scanned)
+    problems = [problem for result in scanned for problem in result[2]]
+    problems += [problem for result in joined for problem in result]
+    return accounts, entries, problems
+
+
+# ================= CLI =================
+def main(argv=None):
+    from bank.bank import DATA_FILE
+    from bank.storage import STORAGE, STORAGE_KINDS
+
+    parser = argparse.ArgumentParser(
+        description="Check every balance against its history and match "
+                    "both legs of every transfer"
+    )
+    parser.add_argument("path", nargs="?", default=DATA_FILE,
+                        help="store path, as given to the server")
+    parser.add_argument("--storage", default=STORAGE, choices=STORAGE_KINDS)
+    parser.add_argument("--segmented", action="store_true")
+    parser.add_argument("--shards", type=int, default=0,
+                        help="reconcile the stores of a sharded bank")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--report", help="write discrepancies here as JSONL")
+    args = parser.parse_args(argv)
+
+    paths = [args.path]
+    if args.shards:
+        from bank.shards import shard_path
+        paths = [shard_path(args.path, k) for k in range(args.shards)]
+    t0 = time.perf_counter()
+    accounts, entries, problems = reconcile(
+        [(args.storage, path, args.segmented) for path in paths], args.workers
+    )
+    if args.report:
+        with open(args.report, "w") as f:
+            for problem in problems:
+                f.write(json.dumps(problem) + "\n")
+    else:
+        for problem in problems:
+            print(json.dumps(problem))
+    kinds = Counter(problem["check"] for problem in problems)
+    print(f"{accounts} accounts, {entries} entries reconciled in "
+          f"{time.perf_counter() - t0:.1f} s; {len(problems)} discrepancies"
+          + "".join(f", {n} {check}" for check, n in sorted(kinds.items())),
+          file=sys.stderr)
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,213 @@
+import argparse
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from bank.history import RECENT
+
+HOST = "127.0.0.1"
+PORT = 8765
+MAX_PAGE = 100
+MAX_KEY = 64
+AUTH_OPS = ("register", "authenticate")
+
+
+# ================= SERVER =================
+class BankServer:
+    """Line-delimited JSON front door to a single shared Bank.
+
+    Every connection is one terminal session.  Requests are objects such
+    as ``{"op": "deposit", "amount": 5000}``; every reply carries ``"ok"``
+    and, on failure, an ``"error"`` message ready to show to the user.
+    Bank calls run on a pool of worker threads so disk writes never stall
+    the event loop; the bank's per-account locks keep them consistent.
+    Logins and registrations hash the PIN, so they run on the bank's
+    auth pool and cannot hold up the workers serving other sessions.
+    """
+
+    def __init__(self, bank, host=HOST, port=PORT, workers=8):
+        self.bank = bank
+        self.host = host
+        self.port = port
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(
+            self.handle, self.host, self.port
+        )
+        return self.server
+
+    async def serve_forever(self):
+        if self.server is None:
+            await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def handle(self, reader, writer):
+        session = {"acc": None}
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                response = await self.dispatch(session, line)
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def dispatch(self, session, line):
+        try:
+            request = json.loads(line)
+            handler = getattr(self, "op_" + request["op"])
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return {"ok": False, "error": "Permintaan tidak valid"}
+        loop = asyncio.get_running_loop()
+        executor = self.executor
+        if request["op"] in AUTH_OPS:
+            executor = self.bank.auth_pool
+        try:
+            return await loop.run_in_executor(
+                executor, handler, session, request
+            )
+        except (ValueError, KeyError, TypeError):
+            return {"ok": False, "error": "Input tidak valid"}
+
+    # ---------- OPERATIONS ----------
+    def op_register(self, session, request):
+        if self.bank.add_account(str(request["acc"]), str(request["pin"])):
+            return {"ok": True}
+        return {"ok": False, "error": "Rekening sudah ada"}
+
+    def op_authenticate(self, session, request):
+        account = self.bank.authenticate(
+            str(request["acc"]), str(request["pin"])
+        )
+        if account is None:
+            session["acc"] = None
+            return {"ok": False, "error": "Login gagal"}
+        session["acc"] = account._acc_number
+        return {"ok": True, "balance": account.get_balance()}
+
+    def op_metrics(self, session, request):
+        self._session_acc(session)  # not for anonymous connections
+        return {"ok": True, "metrics": self.bank.metrics.snapshot()}
+
+    def op_logout(self, session, request):
+        session["acc"] = None
+        return {"ok": True}
+
+    def op_balance(self, session, request):
+        account = self._session_account(session)
+        return {"ok": True, "balance": account.get_balance()}
+
+    def op_history(self, session, request):
+        limit = request.get("limit", RECENT)
+        if type(limit) is not int or not 0 < limit <= MAX_PAGE:
+            raise ValueError("limit")
+        entries, cursor = self.bank.history_page(
+            self._session_acc(session), limit, request.get("before")
+        )
+        return {"ok": True, "history": [str(t) for t in entries],
+                "cursor": cursor}
+
+    def op_deposit(self, session, request):
+        acc_number = self._session_acc(session)
+        account = self.bank.deposit(acc_number, _amount(request),
+                                    _key(request, acc_number))
+        return {"ok": True, "balance": account.get_balance()}
+
+    def op_withdraw(self, session, request):
+        acc_number = self._session_acc(session)
+        account = self.bank.withdraw(acc_number, _amount(request),
+                                     _key(request, acc_number))
+        if account is None:
+            return {"ok": False, "error": "Saldo tidak cukup"}
+        return {"ok": True, "balance": account.get_balance()}
+
+    def op_transfer(self, session, request):
+        account = self._session_account(session)
+        ok, msg = self.bank.transfer(
+            account, str(request["to"]), _amount(request),
+            _key(request, account._acc_number)
+        )
+        return {"ok": ok, "message": msg, "error": None if ok else msg,
+                "balance": account.get_balance()}
+
+    def _session_acc(self, session):
+        if session["acc"] is None:
+            raise KeyError("acc")
+        return session["acc"]
+
+    def _session_account(self, session):
+        # Reload on every request so sessions never act on a stale copy
+        return self.bank.load_account(self._session_acc(session))
+
+
+def _amount(request):
+    amount = request["amount"]
+    if type(amount) is not int or amount <= 0:
+        raise ValueError("amount")
+    return amount
+
+
+def _key(request, acc_number):
+    """Optional idempotency key, scoped to the session's account"""
+    key = request.get("key")
+    if key is None:
+        return None
+    if type(key) is not str or not 0 < len(key) <= MAX_KEY:
+        raise ValueError("key")
+    return f"{acc_number}:{key}"
+
+
+# ================= RUN =================
+def main(argv=None):
+    from bank.storage import STORAGE, STORAGE_KINDS, open_storage
+
+    parser = argparse.ArgumentParser(description="ATM transaction server")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--storage", default=STORAGE,
+                        choices=STORAGE_KINDS)
+    parser.add_argument("--segmented", action="store_true",
+                        help="keep history in per-account segment files")
+    parser.add_argument("--metrics-port", type=int,
+                        help="serve Prometheus metrics on this port")
+    parser.add_argument("--shards", type=int, default=0,
+                        help="split accounts over this many processes")
+    args = parser.parse_args(argv)
+    if args.shards and args.metrics_port:
+        parser.error("--metrics-port is not supported with --shards")
+
+    from bank.bank import DATA_FILE, Bank
+    from bank.metrics import Metrics, serve
+
+    metrics = Metrics() if args.metrics_port else None
+    if args.shards:
+        from bank.shards import ShardedBank
+        bank = ShardedBank(args.shards, args.storage, DATA_FILE,
+                           segmented=args.segmented)
+        close = bank.close
+    else:
+        bank = Bank(open_storage(args.storage, DATA_FILE,
+                                 segmented=args.segmented), metrics=metrics)
+        close = bank.storage.close
+    if metrics is not None:
+        serve(metrics, args.host, args.metrics_port)
+        print(f"metrics on http://{args.host}:{args.metrics_port}/metrics")
+    server = BankServer(bank, args.host, args.port)
+    print(f"ATM server listening on {args.host}:{args.port}")
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,561 @@
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from bank.account import SavingAccount
+from bank.aggregates import FIELDS
+from bank.archive import Archive
+from bank.bank import KEYS, Bank, copy_state
+from bank.history import RECENT
+from bank.metrics import NULL_METRICS
+from bank.pins import LOCKED_PIN
+from bank.records import (
+    AccountRecord, Transaction, NOTE, TRANSFER_IN, TRANSFER_OUT,
+    SYSTEM_PREFIX
+)
+from bank.storage import open_storage, save_accounts
+
+TRANSIT = SYSTEM_PREFIX + "transit"
+APPLIED_TTL = 3600  # seconds a committed transfer id is kept in memory
+
+
+class ShardError(Exception):
+    """A shard process died; it has been restarted from its store"""
+
+
+def shard_of(acc_number, shards):
+    return zlib.crc32(acc_number.encode()) % shards
+
+
+def shard_path(path, k):
+    stem, ext = os.path.splitext(path)
+    return f"{stem}.shard{k}{ext}"
+
+
+def _tag(xid, src, to):
+    return f"{xid} {src} {to}"
+
+
+# ================= SHARD =================
+class Shard:
+    """One partition of the accounts, served by its own process.
+
+    Transfers to another shard move through the shard's transit account.
+    The source debits the sender and credits transit in one transaction
+    (``prepare``).  The destination credits the receiver and records the
+    transfer id in one transaction (``commit``).  The source then debits
+    transit (``settle``) or refunds the sender (``abort``).  Each step is
+    idempotent and the open transfers are rebuilt from the transit
+    history on start, so the router can finish them after a crash.
+
+    Committed ids stay in memory for ``APPLIED_TTL`` seconds; an older
+    transfer is looked up in the transit history from its prepare time
+    on.  Once the router has finished every open transfer it archives
+    the transit history with ``checkpoint``, so a start only reads what
+    was written since the last one.
+    """
+
+    def __init__(self, bank, archive):
+        self.bank = bank
+        self.archive = archive
+        self.pending = {}
+        self.applied = {}  # xid -> time of its commit, oldest first
+        storage = bank.storage
+        if not storage.exists(TRANSIT):
+            storage.create(TRANSIT, LOCKED_PIN)
+        for entry in storage.statement(TRANSIT):
+            xid, src, to = entry.counterparty.split(" ")
+            if entry.kind == TRANSFER_IN:
+                self.pending[xid] = (src, to, entry.amount, entry.time)
+            elif entry.kind == TRANSFER_OUT:
+                self.pending.pop(xid, None)
+            elif entry.kind == NOTE:
+                self.applied[xid] = entry.time
+        self._forget_applied()
+
+    # ---------- ACCOUNTS ----------
+    def exists(self, acc_number):
+        return self.bank.storage.exists(acc_number)
+
+    def add_account(self, acc_number, pin):
+        return self.bank.add_account(acc_number, pin)
+
+    def authenticate(self, acc_number, pin):
+        return self.bank.authenticate(acc_number, pin)
+
+    def load_account(self, acc_number):
+        return self.bank.load_account(acc_number)
+
+    def update_account(self, account):
+        self.bank.update_account(account)
+        return account._saved
+
+    def deposit(self, acc_number, amount, key):
+        return self.bank.deposit(acc_number, amount, key)
+
+    def withdraw(self, acc_number, amount, key):
+        return self.bank.withdraw(acc_number, amount, key)
+
+    def transfer(self, account, to_acc, amount, key):
+        ok, msg = self.bank.transfer(account, to_acc, amount, key)
+        return ok, msg, account
+
+    def history_page(self, acc_number, limit, before):
+        return self.bank.history_page(acc_number, limit, before)
+
+    def statement(self, acc_number, start, end):
+        return self.bank.statement(acc_number, start, end)
+
+    def statements(self, start, end):
+        return list(self.bank.statements(start, end))
+
+    def statement_page(self, acc_number, limit, start, end, after):
+        return self.bank.statement_page(acc_number, limit, start, end, after)
+
+    def customer_accounts(self):
+        return self.bank.customer_accounts()
+
+    def totals(self, acc_number):
+        return self.bank.totals(acc_number)
+
+    def daily_totals(self, day):
+        return self.bank.daily_totals(day)
+
+    # ---------- TWO-PHASE TRANSFER ----------
+    def prepare(self, xid, account, to_acc, amount, key):
+        """Debit the sender into transit; returns ``(ok, msg, account,
+        fresh)``, where ``fresh`` is False for a replayed idempotency key
+        whose transfer needs no second phase"""
+        bank = self.bank
+        src = account._acc_number
+        request = ["transfer", src, to_acc, amount]
+        with bank.key_lock(key):
+            result = bank.replay(key, request)
+            if result is not None:
+                return result[0], result[1], bank.load_account(src), False
+            with bank.locks.hold(src, TRANSIT):
+                stored = bank.load_account(src)
+                if amount > stored.get_balance() or not stored.withdraw(amount):
+                    result = [False, "Saldo tidak cukup"]
+                    bank.remember(key, request, result)
+                    return result[0], result[1], account, False
+                stored.add_history(
+                    Transaction(TRANSFER_OUT, amount, 0, to_acc)
+                )
+                result = [True, "Transfer berhasil"]
+                held = Transaction(TRANSFER_IN, amount, 0,
+                                   _tag(xid, src, to_acc))
+                with bank.storage.transaction():
+                    bank.update_account(stored)
+                    bank.storage.credit(TRANSIT, amount, held)
+                    bank.record_key(key, request, result)
+                self.pending[xid] = (src, to_acc, amount, held.time)
+            bank.remember(key, request, result)
+        return result[0], result[1], stored, True
+
+    def commit(self, xid, src, to_acc, amount, prepared=None):
+        """Credit the receiver once per transfer id; False if it is gone.
+
+        ``prepared`` is the time of the prepare, None for one just made.
+        """
+        bank = self.bank
+        with bank.locks.hold(to_acc, TRANSIT):
+            if xid in self.applied or self._noted(xid, prepared):
+                return True
+            if not bank.storage.exists(to_acc):
+                return False
+            note = Transaction(NOTE, 0, 0, _tag(xid, src, to_acc))
+            with bank.storage.transaction():
+                bank.storage.credit(to_acc, amount, Transaction(
+                    TRANSFER_IN, amount, 0, src
+                ))
+                bank.storage.credit(TRANSIT, 0, note)
+            self.applied[xid] = note.time
+            self._forget_applied()
+        return True
+
+    def _noted(self, xid, prepared):
+        # An id leaves memory APPLIED_TTL after its commit, which came
+        # after the prepare, so only older transfers need the history
+        if prepared is None or prepared >= time.time() - APPLIED_TTL:
+            return False
+        return any(entry.kind == NOTE and entry.counterparty.split(" ")[0]
+                   == xid for entry in self.bank.storage.statement(
+                       TRANSIT, prepared))
+
+    def _forget_applied(self):
+        horizon = time.time() - APPLIED_TTL
+        stale = []
+        for xid, committed in self.applied.items():
+            if committed >= horizon:
+                break
+            stale.append(xid)
+        for xid in stale:
+            del self.applied[xid]
+
+    def settle(self, xid):
+        """Release the transit funds of a committed transfer"""
+        bank = self.bank
+        with bank.locks.hold(TRANSIT):
+            transfer = self.pending.get(xid)
+            if transfer is None:
+                return
+            src, to_acc, amount, _ = transfer
+            bank.storage.credit(TRANSIT, -amount, Transaction(
+                TRANSFER_OUT, amount, 0, _tag(xid, src, to_acc)
+            ))
+            del self.pending[xid]
+
+    def abort(self, xid):
+        """Return the funds of a transfer that cannot be committed,
+        admin fee included"""
+        bank = self.bank
+        transfer = self.pending.get(xid)
+        if transfer is None:
+            return
+        src, to_acc, amount, _ = transfer
+        refund = amount + SavingAccount.ADMIN_FEE
+        with bank.locks.hold(src, TRANSIT):
+            if xid not in self.pending:
+                return
+            with bank.storage.transaction():
+                bank.storage.credit(TRANSIT, -amount, Transaction(
+                    TRANSFER_OUT, amount, 0, _tag(xid, src, to_acc)
+                ))
+                bank.storage.credit(src, refund, Transaction(
+                    TRANSFER_IN, refund, 0, to_acc
+                ))
+            del self.pending[xid]
+
+    def open_transfers(self):
+        return [(xid, *transfer) for xid, transfer in self.pending.items()]
+
+    def checkpoint(self):
+        """Archive the transit history once no transfer is open anywhere,
+        which only the router knows; returns the entries archived"""
+        bank = self.bank
+        with bank.locks.hold(TRANSIT):
+            if self.pending:
+                return 0
+            moved = bank.storage.compact(TRANSIT, self.archive, keep=0)
+            self.applied.clear()
+        return moved
+
+
+def serve(conn, kind, path, options):
+    """Shard process main loop: one ``(method, args)`` request at a time"""
+    bank = Bank(open_storage(kind, path, **options), auth_workers=1)
+    shard = Shard(bank, Archive(os.path.splitext(path)[0] + ".archive"))
+    try:
+        while True:
+            try:
+                request = conn.recv()
+            except EOFError:
+                break
+            if request is None:
+                break
+            method, args = request
+            try:
+                conn.send(("ok", getattr(shard, method)(*args)))
+            except Exception as e:
+                conn.send(("error", e))
+    finally:
+        bank.auth_pool.shutdown()
+        bank.storage.close()
+
+
+# ================= ROUTER =================
+class _Process:
+    __slots__ = ("process", "conn", "lock")
+
+
+class ShardedBank:
+    """Bank front spread over ``shards`` worker processes.
+
+    Accounts are partitioned by a CRC32 of the account number, and each
+    shard owns its own store next to ``path`` (``accounts.shard0.json``
+    and so on), so logins, deposits and saves run on every core.  Calls
+    are routed to the owning shard.  Transfers within one shard are
+    ordinary Bank transfers; between shards they run the two-phase
+    protocol of ``Shard``.  A shard that dies is restarted from its
+    store, and the next transfer first runs ``recover`` to finish the
+    transfers it left open.  The first start of a data set that is not
+    split yet divides the unsharded store at ``path`` between the shards.
+    """
+
+    metrics = NULL_METRICS
+
+    def __init__(self, shards, kind="journal", path="accounts.json",
+                 **options):
+        if not _check_layout(path, shards):
+            if _unsharded(kind, path):
+                split_store(kind, path, shards, **options)
+            _write_layout(path, shards)
+        self.kind = kind
+        self.path = path
+        self.options = options
+        self._context = multiprocessing.get_context("spawn")
+        self._recover_due = False
+        self.shards = [self._start(k) for k in range(shards)]
+        self.auth_pool = ThreadPoolExecutor(max_workers=shards,
+                                            thread_name_prefix="auth")
+        self.recover()
+        # Nothing else runs yet, so no transfer is open on any shard
+        for k in range(shards):
+            self._call(k, "checkpoint")
+
+    def _start(self, k):
+        proc = _Process()
+        proc.conn, child = self._context.Pipe()
+        proc.process = self._context.Process(
+            target=serve, name=f"bank-shard-{k}", daemon=True,
+            args=(child, self.kind, shard_path(self.path, k), self.options)
+        )
+        proc.process.start()
+        child.close()
+        proc.lock = threading.RLock()
+        return proc
+
+    def _call(self, k, method, *args):
+        # One request in flight per shard; shards run side by side
+        proc = self.shards[k]
+        with proc.lock:
+            try:
+                proc.conn.send((method, args))
+                status, result = proc.conn.recv()
+            except (EOFError, OSError):
+                self._restart(k)
+                raise ShardError(f"Shard {k} restarted during {method}")
+        if status == "error":
+            raise result
+        return result
+
+    def _restart(self, k):
+        old = self.shards[k]
+        old.conn.close()
+        old.process.join(timeout=1)
+        if old.process.is_alive():
+            old.process.kill()
+        proc = self._start(k)
+        proc.lock = old.lock
+        self.shards[k] = proc
+        self._recover_due = True
+
+    def _route(self, acc_number, method, *args):
+        return self._call(shard_of(acc_number, len(self.shards)), method,
+                          acc_number, *args)
+
+    # ---------- BANK API ----------
+    def add_account(self, acc_number, pin):
+        return self._route(acc_number, "add_account", pin)
+
+    def authenticate(self, acc_number, pin):
+        return self._route(acc_number, "authenticate", pin)
+
+    def authenticate_async(self, acc_number, pin):
+        return self.auth_pool.submit(self.authenticate, acc_number, pin)
+
+    def load_account(self, acc_number):
+        return self._route(acc_number, "load_account")
+
+    def update_account(self, account):
+        k = shard_of(account._acc_number, len(self.shards))
+        account._saved = self._call(k, "update_account", account)
+
+    def deposit(self, acc_number, amount, key=None):
+        return self._route(acc_number, "deposit", amount, key)
+
+    def withdraw(self, acc_number, amount, key=None):
+        return self._route(acc_number, "withdraw", amount, key)
+
+    def history_page(self, acc_number, limit=RECENT, before=None):
+        return self._route(acc_number, "history_page", limit, before)
+
+    def statement(self, acc_number, start=None, end=None):
+        return self._route(acc_number, "statement", start, end)
+
+    def statements(self, start=None, end=None):
+        for k in range(len(self.shards)):
+            yield from self._call(k, "statements", start, end)
+
+    def statement_page(self, acc_number, limit, start=None, end=None,
+                       after=None):
+        return self._route(acc_number, "statement_page", limit, start, end,
+                           after)
+
+    def customer_accounts(self):
+        return [acc_number for k in range(len(self.shards))
+                for acc_number in self._call(k, "customer_accounts")]
+
+    def export(self, out, acc_numbers=None, start=None, end=None, fmt=None,
+               compress=None):
+        from bank.export import export
+        return export(self, out, acc_numbers, start, end, fmt, compress)
+
+    def totals(self, acc_number=None):
+        if acc_number is not None:
+            return self._route(acc_number, "totals")
+        return self._sum("totals", None)
+
+    def daily_totals(self, day=None):
+        return self._sum("daily_totals", day)
+
+    def _sum(self, method, *args):
+        # Every shard counts its own side of a cross-shard transfer
+        parts = [self._call(k, method, *args)
+                 for k in range(len(self.shards))]
+        return {name: sum(part[name] for part in parts) for name in parts[0]}
+
+    def transfer(self, from_acc, to_acc, amount, key=None):
+        if self._recover_due:
+            self.recover()
+        if to_acc.startswith(SYSTEM_PREFIX):
+            return False, "Rekening tujuan tidak ditemukan"
+        shards = len(self.shards)
+        src = shard_of(from_acc._acc_number, shards)
+        dst = shard_of(to_acc, shards)
+        if src == dst:
+            ok, msg, account = self._call(src, "transfer", from_acc, to_acc,
+                                          amount, key)
+            copy_state(from_acc, account)
+            return ok, msg
+        if not self._call(dst, "exists", to_acc):
+            return False, "Rekening tujuan tidak ditemukan"
+
+        xid = uuid.uuid4().hex
+        try:
+            ok, msg, account, fresh = self._call(
+                src, "prepare", xid, from_acc, to_acc, amount, key
+            )
+        except ShardError:
+            # The prepare may have become durable before the crash
+            if not self.recover().get(xid):
+                return False, "Transfer gagal, silakan coba lagi"
+            ok, msg, fresh = True, "Transfer berhasil", False
+            account = self.load_account(from_acc._acc_number)
+        copy_state(from_acc, account)
+        if not fresh:
+            return ok, msg
+        try:
+            committed = self._finish(src, xid, from_acc._acc_number, to_acc,
+                                     amount)
+        except ShardError:
+            # Absent means a concurrent recovery already finished it
+            committed = self.recover().get(xid, True)
+        if not committed:
+            copy_state(from_acc, self.load_account(from_acc._acc_number))
+            return False, "Rekening tujuan tidak ditemukan"
+        return True, "Transfer berhasil"
+
+    def _finish(self, k, xid, src, to_acc, amount, prepared=None):
+        dst = shard_of(to_acc, len(self.shards))
+        committed = self._call(dst, "commit", xid, src, to_acc, amount,
+                               prepared)
+        self._call(k, "settle" if committed else "abort", xid)
+        return committed
+
+    def recover(self):
+        """Finish every transfer left open by a crash; returns
+        ``{xid: committed}`` for the transfers it finished"""
+        self._recover_due = False
+        outcomes = {}
+        for k in range(len(self.shards)):
+            for xid, src, to_acc, amount, prepared in self._call(
+                    k, "open_transfers"):
+                outcomes[xid] = self._finish(k, xid, src, to_acc, amount,
+                                             prepared)
+        return outcomes
+
+    def close(self):
+        self.auth_pool.shutdown()
+        for proc in self.shards:
+            with proc.lock:
+                try:
+                    proc.conn.send(None)
+                except OSError:
+                    pass
+                proc.process.join()
+                proc.conn.close()
+
+
+def _check_layout(path, shards):
+    """Refuse to reopen a data set with a different shard count, which
+    would route accounts to shards that do not hold them; returns False
+    for a data set not split yet"""
+    layout = os.path.splitext(path)[0] + ".shards"
+    if not os.path.exists(layout):
+        return False
+    with open(layout) as f:
+        existing = int(f.read())
+    if existing != shards:
+        raise ValueError(f"{path} is split into {existing} shards, "
+                         f"not {shards}")
+    return True
+
+
+def _write_layout(path, shards):
+    # Written last, so a split cut short is done again on the next start
+    with open(os.path.splitext(path)[0] + ".shards", "w") as f:
+        f.write(f"{shards}\n")
+
+
+def _unsharded(kind, path):
+    stem = os.path.splitext(path)[0]
+    if kind == "sqlite":
+        return os.path.exists(stem + ".db")
+    return any(os.path.exists(name) for name in (
+        path, stem + ".journal", stem + ".records", stem + ".snap"
+    ))
+
+
+# ================= SPLIT =================
+def split_store(kind, path, shards, **options):
+    """Divide an unsharded store between ``shards`` new shard stores.
+
+    Every account goes to the shard ``shard_of`` names, with its live
+    history inline in a JSON table that each backend converts when the
+    shard first opens it (sqlite imports it here).  Bank-wide totals are
+    rebuilt per shard and the idempotency keys are copied to every shard.
+    The unsharded store itself is left as it was.
+    """
+    tables = [{} for _ in range(shards)]
+    source = open_storage(kind, path, **options)
+    try:
+        for acc_number in source.acc_numbers():
+            if acc_number.startswith(SYSTEM_PREFIX) and acc_number != KEYS:
+                continue
+            stored = source.get(acc_number, 0)
+            history, _ = source.history_page(acc_number, 1 << 62)
+            archived, checkpoint = source.balance_checkpoint(acc_number)
+            totals = source.totals(acc_number)
+            if totals is not None:
+                totals = [totals[name] for name in FIELDS]
+            record = AccountRecord(
+                stored["pin"], stored["balance"], history,
+                archived=archived, checkpoint=checkpoint, totals=totals
+            )
+            if acc_number == KEYS:
+                for table in tables:
+                    table[KEYS] = record
+            else:
+                tables[shard_of(acc_number, shards)][acc_number] = record
+    finally:
+        source.close()
+    for k, table in enumerate(tables):
+        target = shard_path(path, k)
+        if kind != "sqlite":
+            save_accounts(table, target)
+            continue
+        db = os.path.splitext(target)[0] + ".db"
+        for name in (db, db + "-wal", db + "-shm"):
+            if os.path.exists(name):
+                os.remove(name)  # left by a split cut short
+        store = open_storage(kind, target)
+        try:
+            store.import_accounts(table)
+        finally:
+            store.close()
@@ -0,0 +1,389 @@
+import mmap
+import os
+import struct
+import sys
+
+from bank.aggregates import FIELDS
+from bank.index import KEY_SIZE
+from bank.journal import JOURNAL, apply_record, journal_marker
+from bank.metrics import STORAGE_SECONDS
+from bank.records import AccountRecord, Transaction
+from bank.storage import (
+    JournalStorage, load_accounts, save_accounts, file_size
+)
+
+MAGIC = b"ATMSNAP3"
+# Older versions are still read, never written: 1 had 16-bit text
+# lengths, 1 and 2 a fixed 128-byte PIN field and 64-bit fees and times
+MAGICS = {MAGIC: 3, b"ATMSNAP2": 2, b"ATMSNAP1": 1}
+HEADER = struct.Struct("<8sQ")  # magic, account count
+# account number, PIN length, balance, entries, archived, checkpoint,
+# generation, blob byte offset, blob byte length, inline entry count
+# (-1: none) and whether the account has running totals.  The blob holds
+# the PIN, the totals if any, then the inline history.
+ROW = struct.Struct(f"<{KEY_SIZE}sHqQQqQQQq?")
+TOTALS = struct.Struct(f"<{len(FIELDS)}q")
+ROW_V2 = struct.Struct(f"<{KEY_SIZE}s128sqQQqQQQq{len(FIELDS)}q?")
+# kind, amount, fee, time, text length (NO_TEXT: no counterparty)
+ENTRY = struct.Struct("<cqIII")
+NO_TEXT = 0xFFFFFFFF
+ENTRY_V2 = struct.Struct("<cqqqI?")
+ENTRY_V1 = struct.Struct("<cqqqH")
+NO_TEXT_V1 = 0xFFFF
+
+
+# ================= FORMAT =================
+def _key(acc_number):
+    key = acc_number.encode()
+    if len(key) > KEY_SIZE:
+        raise ValueError("Nomor rekening terlalu panjang")
+    return key.ljust(KEY_SIZE, b"\0")
+
+
+def encode_history(history):
+    chunks = []
+    for t in history:
+        text = b"" if t.counterparty is None else t.counterparty.encode()
+        try:
+            chunks.append(ENTRY.pack(
+                t.kind.encode(), t.amount, t.fee, t.time,
+                NO_TEXT if t.counterparty is None else len(text)
+            ))
+        except struct.error:
+            raise ValueError(f"Entry does not fit a snapshot: {t!r}")
+        chunks.append(text)
+    return b"".join(chunks)
+
+
+def decode_history(blob, count, version=3):
+    history = []
+    at = 0
+    entry = {3: ENTRY, 2: ENTRY_V2, 1: ENTRY_V1}[version]
+    for _ in range(count):
+        if version == 2:
+            kind, amount, fee, time, size, text = entry.unpack_from(blob, at)
+        else:
+            kind, amount, fee, time, size = entry.unpack_from(blob, at)
+            text = size != (NO_TEXT if version == 3 else NO_TEXT_V1)
+            size = size if text else 0
+        at += entry.size
+        counterparty = None
+        if text:
+            counterparty = bytes(blob[at:at + size]).decode()
+            at += size
+        history.append(Transaction(kind.decode(), amount, fee, counterparty,
+                                   time))
+    return history
+
+
+def write_snapshot(path, rows):
+    """Write ``(acc_number, record)`` pairs, sorted by account number.
+
+    A record may instead be ``(row, blob)`` as returned by
+    ``Snapshot.raw``, which is copied without decoding.  The file is
+    replaced atomically.
+    """
+    rows = sorted(rows, key=lambda item: _key(item[0]))
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        table = bytearray(HEADER.pack(MAGIC, len(rows)))
+        offset = len(table) + len(rows) * ROW.size
+        f.seek(offset)
+        for acc_number, record in rows:
+            if isinstance(record, AccountRecord):
+                pin = record.pin.encode()
+                if len(pin) > 0xFFFF:
+                    raise ValueError(f"PIN of {acc_number} is too long")
+                history = record.history
+                totals = record.totals
+                blob = b"".join((
+                    pin,
+                    b"" if totals is None else TOTALS.pack(*totals),
+                    b"" if history is None else encode_history(history),
+                ))
+                row = (_key(acc_number), len(pin), record.balance,
+                       record.entries, record.archived, record.checkpoint,
+                       record.gen, offset, len(blob),
+                       -1 if history is None else len(history),
+                       totals is not None)
+            else:
+                row, blob = record
+                row = row[:7] + (offset,) + row[8:]
+            f.write(blob)
+            table += ROW.pack(*row)
+            offset += len(blob)
+        f.seek(0)
+        f.write(table)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+# ================= READER =================
+class Snapshot:
+    """Read-only view of a binary snapshot through ``mmap``.
+
+    The fixed-width account table is sorted by account number, so a
+    lookup is a binary search over a few pages; histories are decoded
+    only for the accounts that are read.  A missing file is empty.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+        self._map = None
+        self.count = 0
+        self.version = 3
+        self._layout = ROW
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            self._file = open(path, "rb")
+            self._map = mmap.mmap(self._file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+            magic, self.count = HEADER.unpack_from(self._map, 0)
+            if magic not in MAGICS:
+                raise ValueError(f"{path} is not an account snapshot")
+            self.version = MAGICS[magic]
+            if self.version < 3:
+                self._layout = ROW_V2
+
+    def __len__(self):
+        return self.count
+
+    def _row(self, i):
+        size = self._layout.size
+        return self._layout.unpack_from(self._map, HEADER.size + i * size)
+
+    def _find(self, acc_number):
+        """Index of the account's row, or -1"""
+        key = _key(acc_number)
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            at = HEADER.size + mid * self._layout.size
+            name = self._map[at:at + KEY_SIZE]
+            if name < key:
+                lo = mid + 1
+            elif name > key:
+                hi = mid
+            else:
+                return mid
+        return -1
+
+    def __contains__(self, acc_number):
+        return self._find(acc_number) >= 0
+
+    def balance(self, acc_number):
+        """Balance straight from the table, or None"""
+        i = self._find(acc_number)
+        return None if i < 0 else self._row(i)[2]
+
+    def get(self, acc_number):
+        i = self._find(acc_number)
+        return None if i < 0 else self.record(i)[1]
+
+    def record(self, i):
+        """``(acc_number, AccountRecord)`` of row ``i``, in account order"""
+        row = self._row(i)
+        (_, pin, balance, entries, archived, checkpoint, gen, offset,
+         length, count) = row[:10]
+        totals = None
+        if self.version == 3:
+            start = offset + pin
+            pin = self._map[offset:start]
+            if row[-1]:
+                totals = list(TOTALS.unpack_from(self._map, start))
+                start += TOTALS.size
+        else:
+            start = offset
+            pin = pin.rstrip(b"\0")
+            if row[-1]:
+                totals = list(row[10:-1])
+        history = None
+        if count >= 0:
+            with memoryview(self._map) as view:
+                history = decode_history(view[start:offset + length], count,
+                                         self.version)
+        return row[0].rstrip(b"\0").decode(), AccountRecord(
+            pin.decode(), balance, history, entries, archived, checkpoint,
+            gen, totals
+        )
+
+    def raw(self, acc_number):
+        """``(row, blob)`` of an account, for copying it unchanged; the
+        decoded record for an older file, whose entries are re-encoded"""
+        if self.version != 3:
+            return self.get(acc_number)
+        row = self._row(self._find(acc_number))
+        return row, self._map[row[7]:row[7] + row[8]]
+
+    def __iter__(self):
+        for i in range(self.count):
+            at = HEADER.size + i * self._layout.size
+            yield self._map[at:at + KEY_SIZE].rstrip(b"\0").decode()
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._file.close()
+            self._map = self._file = None
+
+
+# ================= TABLE =================
+class SnapshotTable:
+    """Dict-like account table over a Snapshot.
+
+    An account is decoded the first time it is read and handed to
+    ``adopt``, then kept, so changes made to its record stick until the
+    next ``save`` writes the table back; untouched accounts are copied
+    over as raw bytes.
+    """
+
+    def __init__(self, snapshot, adopt=None):
+        self.snapshot = snapshot
+        self.adopt = adopt
+        self._loaded = {}
+        self._added = 0
+
+    def get(self, acc_number, default=None):
+        data = self._loaded.get(acc_number)
+        if data is None:
+            data = self.snapshot.get(acc_number)
+            if data is None:
+                return default
+            if self.adopt is not None:
+                self.adopt(acc_number, data)
+            self._loaded[acc_number] = data
+        return data
+
+    def __getitem__(self, acc_number):
+        data = self.get(acc_number)
+        if data is None:
+            raise KeyError(acc_number)
+        return data
+
+    def __setitem__(self, acc_number, data):
+        if acc_number not in self:
+            self._added += 1
+        self._loaded[acc_number] = data
+
+    def __delitem__(self, acc_number):
+        # Only an account added since the last save can be taken out again
+        del self._loaded[acc_number]
+        self._added -= 1
+
+    def __contains__(self, acc_number):
+        return acc_number in self._loaded or acc_number in self.snapshot
+
+    def __iter__(self):
+        yield from self.snapshot
+        for acc_number in list(self._loaded):
+            if acc_number not in self.snapshot:
+                yield acc_number
+
+    def __len__(self):
+        return len(self.snapshot) + self._added
+
+    def rows(self):
+        """``(acc_number, record)`` pairs for ``write_snapshot``; accounts
+        never read are passed on raw"""
+        for acc_number in self:
+            yield acc_number, (self._loaded.get(acc_number)
+                               or self.snapshot.raw(acc_number))
+
+    def save(self, path):
+        """Write the whole table to ``path`` and map the new file"""
+        write_snapshot(path, self.rows())
+        self.snapshot.close()
+        self.snapshot = Snapshot(path)
+        self._loaded.clear()
+        self._added = 0
+
+    def close(self):
+        self.snapshot.close()
+
+
+# ================= STORAGE =================
+class SnapshotStorage(JournalStorage):
+    """Journal backend whose checkpoint is a binary snapshot.
+
+    Start-up maps the snapshot and replays only the journal written
+    since the last checkpoint, so Bank can serve balances without
+    parsing the whole table first.
+    """
+
+    INDEX_ON_LOAD = False
+
+    def load(self):
+        table = SnapshotTable(Snapshot(self.path),
+                              self.history_store.adopt)
+        touched = set()
+        marker = journal_marker(table, self.history_store)
+        for record in self.journal.current(marker.gen):
+            apply_record(table, record, self.history_store, touched)
+        for acc_number in touched:
+            self.history_store.settle(acc_number, table[acc_number])
+        return table
+
+    def checkpoint(self):
+        with self.metrics.time(STORAGE_SECONDS, call="checkpoint"):
+            self.history_store.sync()
+            # Stamped first, so a crash before the reset is detected
+            marker = self.accounts[JOURNAL]
+            marker.gen += 1
+            self.accounts.save(self.path)
+            self.journal.reset({"op": "gen", "gen": marker.gen})
+
+    def close(self):
+        super().close()
+        self.accounts.close()
+
+
+def open_snapshot(path, **options):
+    """Open the snapshot next to ``path``, converting ``path`` itself
+    (a legacy ``accounts.json``) the first time"""
+    stem = os.path.splitext(path)[0]
+    snap = stem + ".snap"
+    if not os.path.exists(snap) and os.path.exists(path):
+        to_binary(path, snap)
+    return SnapshotStorage(snap, stem + ".journal", **options)
+
+
+# ================= CONVERT =================
+def to_binary(json_path, snap_path):
+    write_snapshot(snap_path, load_accounts(json_path).items())
+
+
+def to_json(snap_path, json_path):
+    snapshot = Snapshot(snap_path)
+    try:
+        save_accounts({acc_number: snapshot.get(acc_number)
+                       for acc_number in snapshot}, json_path)
+    finally:
+        snapshot.close()
+
+
+def is_snapshot(path):
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) in MAGICS
+
+
+# ================= CLI =================
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 2:
+        print("usage: python -m bank.snapshot SOURCE TARGET\n"
+              "converts accounts.json to a binary snapshot or back, "
+              "depending on SOURCE")
+        return 2
+    source, target = argv
+    if is_snapshot(source):
+        to_json(source, target)
+    else:
+        to_binary(source, target)
+    print(f"{source} ({file_size(source)} bytes) -> "
+          f"{target} ({file_size(target)} bytes)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
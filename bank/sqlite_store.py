@@ -0,0 +1,347 @@
+import sqlite3
+import sys
+import threading
+from contextlib import contextmanager
+
+from bank.aggregates import (
+    FIELDS, TOTALS, as_dict, day_key, entry_day, tally, zero
+)
+from bank.archive import split_point, checkpoint_balance
+from bank.history import RECENT
+from bank.metrics import STORAGE_SECONDS
+from bank.records import Transaction, SYSTEM_PREFIX
+from bank.storage import Storage, load_accounts, file_size
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS accounts (
+    acc_number TEXT PRIMARY KEY,
+    pin        TEXT NOT NULL,
+    balance    INTEGER NOT NULL DEFAULT 0,
+    archived   INTEGER NOT NULL DEFAULT 0,
+    checkpoint INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS transactions (
+    id           INTEGER PRIMARY KEY,
+    acc_number   TEXT NOT NULL REFERENCES accounts(acc_number),
+    time         INTEGER NOT NULL,
+    kind         TEXT NOT NULL,
+    amount       INTEGER NOT NULL,
+    fee          INTEGER NOT NULL DEFAULT 0,
+    counterparty TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_transactions_acc_time
+    ON transactions (acc_number, time);
+CREATE INDEX IF NOT EXISTS idx_transactions_acc_id
+    ON transactions (acc_number, id);
+CREATE TABLE IF NOT EXISTS totals (
+    name          TEXT PRIMARY KEY,
+    balance       INTEGER NOT NULL DEFAULT 0,
+    deposits      INTEGER NOT NULL DEFAULT 0,
+    withdrawals   INTEGER NOT NULL DEFAULT 0,
+    fees          INTEGER NOT NULL DEFAULT 0,
+    transfers_in  INTEGER NOT NULL DEFAULT 0,
+    transfers_out INTEGER NOT NULL DEFAULT 0,
+    transactions  INTEGER NOT NULL DEFAULT 0
+);
+"""
+# Adds one change to a row of running totals, creating it if needed
+POST = (
+    f"INSERT INTO totals (name, balance, {', '.join(FIELDS)}) "
+    f"VALUES ({', '.join('?' * (len(FIELDS) + 2))}) "
+    "ON CONFLICT (name) DO UPDATE SET "
+    + ", ".join(f"{column} = {column} + excluded.{column}"
+                for column in ("balance",) + FIELDS)
+)
+
+
+# ================= SQLITE =================
+class SQLiteStorage(Storage):
+    """Embedded SQLite backend in WAL mode.
+
+    Accounts are looked up through the primary key and history through the
+    (account, time) index, so every operation touches only the rows of the
+    accounts involved and nothing is held in memory between calls.
+    Running totals are rows of their own table, named like the accounts
+    of the JSON backends.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path, isolation_level=None,
+                                    check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=FULL")
+        self.conn.executescript(SCHEMA)
+        self._lock = threading.RLock()
+        self._depth = 0
+        if self.totals(TOTALS) is None:
+            self._build_totals()
+
+    def exists(self, acc_number):
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT 1 FROM accounts WHERE acc_number = ?", (acc_number,)
+            ).fetchone()
+        return row is not None
+
+    def get(self, acc_number, recent=RECENT):
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT pin, balance FROM accounts WHERE acc_number = ?",
+                (acc_number,)
+            ).fetchone()
+            if row is None:
+                return None
+            history, _ = self.history_page(acc_number, recent)
+        return {"pin": row[0], "balance": row[1], "history": history}
+
+    def history_page(self, acc_number, limit, before=None):
+        # The cursor is the row id of the oldest entry already returned
+        sql = ("SELECT id, time, kind, amount, fee, counterparty "
+               "FROM transactions WHERE acc_number = ?")
+        params = [acc_number]
+        if before is not None:
+            sql += " AND id < ?"
+            params.append(before)
+        sql += " ORDER BY id DESC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self.conn.execute(sql, params).fetchall()
+        rows.reverse()
+        entries = [Transaction(kind, amount, fee, counterparty, t)
+                   for (_, t, kind, amount, fee, counterparty) in rows]
+        cursor = rows[0][0] if rows and len(rows) == limit else None
+        return entries, cursor
+
+    def statement(self, acc_number, start=None, end=None):
+        # Served by the (account, time) index
+        sql = ("SELECT time, kind, amount, fee, counterparty "
+               "FROM transactions WHERE acc_number = ?")
+        params = [acc_number]
+        if start is not None:
+            sql += " AND time >= ?"
+            params.append(start)
+        if end is not None:
+            sql += " AND time < ?"
+            params.append(end)
+        sql += " ORDER BY time, id"
+        with self._lock:
+            rows = self.conn.execute(sql, params).fetchall()
+        return [Transaction(kind, amount, fee, counterparty, t)
+                for (t, kind, amount, fee, counterparty) in rows]
+
+    def statement_page(self, acc_number, limit, start=None, end=None,
+                       after=None):
+        # The cursor is the (time, id) of the last entry returned
+        sql = ("SELECT id, time, kind, amount, fee, counterparty "
+               "FROM transactions WHERE acc_number = ?")
+        params = [acc_number]
+        if start is not None:
+            sql += " AND time >= ?"
+            params.append(start)
+        if end is not None:
+            sql += " AND time < ?"
+            params.append(end)
+        if after is not None:
+            sql += " AND (time > ? OR (time = ? AND id > ?))"
+            params += [after[0], after[0], after[1]]
+        sql += " ORDER BY time, id LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self.conn.execute(sql, params).fetchall()
+        entries = [Transaction(kind, amount, fee, counterparty, t)
+                   for (_, t, kind, amount, fee, counterparty) in rows]
+        cursor = (rows[-1][1], rows[-1][0]) if len(rows) == limit else None
+        return entries, cursor
+
+    def totals(self, name):
+        with self._lock:
+            row = self.conn.execute(
+                f"SELECT balance, {', '.join(FIELDS)} FROM totals "
+                "WHERE name = ?", (name,)
+            ).fetchone()
+            if name.startswith(SYSTEM_PREFIX):
+                return None if row is None else as_dict(row[0], row[1:])
+            found = self.conn.execute(
+                "SELECT balance FROM accounts WHERE acc_number = ?", (name,)
+            ).fetchone()
+        if found is None:
+            return None
+        return as_dict(found[0], row[1:] if row else None)
+
+    def create(self, acc_number, pin):
+        with self.transaction():
+            self.conn.execute(
+                "INSERT INTO accounts (acc_number, pin, balance) "
+                "VALUES (?, ?, 0)", (acc_number, pin)
+            )
+
+    def set_pin(self, acc_number, pin):
+        with self.transaction():
+            self.conn.execute(
+                "UPDATE accounts SET pin = ? WHERE acc_number = ?",
+                (pin, acc_number)
+            )
+
+    def update(self, acc_number, balance, added):
+        with self.transaction():
+            (old,) = self.conn.execute(
+                "SELECT balance FROM accounts WHERE acc_number = ?",
+                (acc_number,)
+            ).fetchone()
+            self.conn.execute(
+                "UPDATE accounts SET balance = ? WHERE acc_number = ?",
+                (balance, acc_number)
+            )
+            self._append(acc_number, added)
+            self._post(acc_number, balance - old, added)
+
+    def credit(self, acc_number, amount, entry):
+        with self.transaction():
+            self.conn.execute(
+                "UPDATE accounts SET balance = balance + ? "
+                "WHERE acc_number = ?", (amount, acc_number)
+            )
+            self._append(acc_number, [entry])
+            self._post(acc_number, amount, [entry])
+
+    def _append(self, acc_number, entries):
+        self.conn.executemany(
+            "INSERT INTO transactions "
+            "(acc_number, time, kind, amount, fee, counterparty) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [(acc_number, t.time, t.kind, t.amount, t.fee, t.counterparty)
+             for t in entries]
+        )
+
+    def _post(self, acc_number, delta, entries):
+        if acc_number.startswith(SYSTEM_PREFIX):
+            return
+        totals = zero()
+        tally(totals, entries)
+        rows = [(acc_number, 0, *totals), (TOTALS, delta, *totals)]
+        if entries:
+            rows.append((day_key(entry_day(entries)), delta, *totals))
+        self.conn.executemany(POST, rows)
+
+    def _build_totals(self):
+        """Tally the totals of every account from its live history"""
+        with self.transaction():
+            self.conn.execute(
+                "DELETE FROM totals WHERE name = ? OR name NOT LIKE ?",
+                (TOTALS, SYSTEM_PREFIX + "%")
+            )
+            self.conn.execute(POST, (TOTALS, 0, *zero()))
+            for acc_number, balance in self.conn.execute(
+                "SELECT acc_number, balance FROM accounts"
+            ).fetchall():
+                if acc_number.startswith(SYSTEM_PREFIX):
+                    continue
+                entries, _ = self.history_page(acc_number, 1 << 62)
+                totals = zero()
+                tally(totals, entries)
+                self.conn.executemany(POST, [
+                    (acc_number, 0, *totals), (TOTALS, balance, *totals)
+                ])
+
+    @contextmanager
+    def transaction(self):
+        with self._lock:
+            if self._depth == 0:
+                self.conn.execute("BEGIN IMMEDIATE")
+            self._depth += 1
+            try:
+                yield
+            except BaseException:
+                self._depth -= 1
+                if self._depth == 0:
+                    self.conn.execute("ROLLBACK")
+                raise
+            self._depth -= 1
+            if self._depth == 0:
+                with self.metrics.time(STORAGE_SECONDS, call="commit"):
+                    self.conn.execute("COMMIT")
+
+    def acc_numbers(self):
+        with self._lock:
+            return [acc for (acc,) in self.conn.execute(
+                "SELECT acc_number FROM accounts ORDER BY acc_number"
+            )]
+
+    def count(self):
+        with self._lock:
+            return self.conn.execute(
+                "SELECT COUNT(*) FROM accounts"
+            ).fetchone()[0]
+
+    def size(self):
+        return file_size(self.path, self.path + "-wal")
+
+    def compact(self, acc_number, archive, keep=None, before=None):
+        with self.transaction():
+            balance, archived = self.conn.execute(
+                "SELECT balance, archived FROM accounts WHERE acc_number = ?",
+                (acc_number,)
+            ).fetchone()
+            rows = self.conn.execute(
+                "SELECT id, time, kind, amount, fee, counterparty "
+                "FROM transactions WHERE acc_number = ? ORDER BY id",
+                (acc_number,)
+            ).fetchall()
+            live = [Transaction(kind, amount, fee, counterparty, t)
+                    for (_, t, kind, amount, fee, counterparty) in rows]
+            cut = split_point(live, keep, before)
+            if cut == 0:
+                return 0
+            archive.write(acc_number, archived, live[:cut])
+            self.conn.execute(
+                "DELETE FROM transactions WHERE acc_number = ? AND id <= ?",
+                (acc_number, rows[cut - 1][0])
+            )
+            self.conn.execute(
+                "UPDATE accounts SET archived = ?, checkpoint = ? "
+                "WHERE acc_number = ?",
+                (archived + cut, checkpoint_balance(balance, live[cut:]),
+                 acc_number)
+            )
+        return cut
+
+    def balance_checkpoint(self, acc_number):
+        with self._lock:
+            return self.conn.execute(
+                "SELECT archived, checkpoint FROM accounts "
+                "WHERE acc_number = ?", (acc_number,)
+            ).fetchone()
+
+    def import_accounts(self, accounts):
+        """Bulk-load a legacy ``accounts.json`` table"""
+        with self.transaction():
+            for acc_number, data in accounts.items():
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO accounts "
+                    "(acc_number, pin, balance, archived, checkpoint) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (acc_number, data.pin, data.balance,
+                     data.archived, data.checkpoint)
+                )
+                self._append(acc_number, data.history or [])
+            self._build_totals()
+
+    def close(self):
+        self.conn.close()
+
+
+# ================= CLI =================
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 2:
+        print("usage: python -m bank.sqlite_store accounts.json accounts.db")
+        return 2
+    store = SQLiteStorage(argv[1])
+    store.import_accounts(load_accounts(argv[0]))
+    store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,575 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from bank.aggregates import as_dict, build, post, zero
+from bank.group_commit import GroupCommit
+from bank.history import (
+    RECENT, TIME_INDEX_CACHE, InlineHistory, SegmentedHistory, TimeIndex
+)
+from bank.archive import split_point, checkpoint_balance
+from bank.journal import (
+    Journal, open_record, pin_record, set_record, credit_record,
+    compact_record, pack_records, iter_records, load_snapshot
+)
+from bank.metrics import NULL_METRICS, STORAGE_SECONDS
+from bank.records import AccountRecord, pack
+
+
+# ================= FILE =================
+def load_accounts(path):
+    return load_snapshot(path)
+
+
+def save_accounts(accounts, path):
+    with open(path, "w") as f:
+        json.dump(accounts, f, separators=(",", ":"), default=pack)
+
+
+def file_size(*paths):
+    """Total size of the files that exist among ``paths``"""
+    return sum(os.path.getsize(path) for path in paths
+               if path is not None and os.path.exists(path))
+
+
+# ================= STORAGE =================
+class Storage:
+    """Persistence interface behind Bank.
+
+    A backend only has to answer for the accounts it is asked about, so
+    Bank never needs the whole account table in memory.  Mutations made
+    inside ``transaction()`` are persisted together, atomically where the
+    backend supports it.  Persistence calls are timed through
+    ``metrics``, which Bank replaces when metrics are enabled.
+    """
+
+    metrics = NULL_METRICS
+
+    def exists(self, acc_number):
+        raise NotImplementedError
+
+    def get(self, acc_number, recent=RECENT):
+        """Return ``{"pin", "balance", "history"}`` or None.
+
+        ``history`` only holds the ``recent`` newest entries; older ones
+        are reached through ``history_page``.
+        """
+        raise NotImplementedError
+
+    def history_page(self, acc_number, limit, before=None):
+        """Return up to ``limit`` entries older than cursor ``before``.
+
+        Entries come oldest first, together with the cursor of the page
+        before them, or None once the start of the history is reached.
+        """
+        raise NotImplementedError
+
+    def statement(self, acc_number, start=None, end=None):
+        """Live entries stamped in ``start <= time < end``, oldest first.
+
+        Bounds are epoch seconds and either may be None.  Backends answer
+        through a time index, in O(log n + k) for k entries returned.
+        """
+        raise NotImplementedError
+
+    def statement_page(self, acc_number, limit, start=None, end=None,
+                       after=None):
+        """The next ``limit`` entries of ``statement``, oldest first.
+
+        Returns the entries and the cursor to pass as ``after`` for the
+        page after them, or None once the range is exhausted, so a long
+        statement is read without holding it whole.
+        """
+        raise NotImplementedError
+
+    def totals(self, name):
+        """Running totals of an account, ``aggregates.TOTALS`` or a
+        ``aggregates.day_key``, as a dict; None if there are none"""
+        raise NotImplementedError
+
+    def create(self, acc_number, pin):
+        raise NotImplementedError
+
+    def set_pin(self, acc_number, pin):
+        """Replace the stored PIN hash"""
+        raise NotImplementedError
+
+    def update(self, acc_number, balance, added):
+        """Set the balance and append the new history entries"""
+        raise NotImplementedError
+
+    def credit(self, acc_number, amount, entry):
+        """Add to the balance of an account that is not loaded"""
+        raise NotImplementedError
+
+    def acc_numbers(self):
+        """Every account number, for maintenance jobs"""
+        raise NotImplementedError
+
+    def count(self):
+        """Number of accounts"""
+        return len(self.acc_numbers())
+
+    def size(self):
+        """Bytes the store takes on disk"""
+        return 0
+
+    def compact(self, acc_number, archive, keep=None, before=None):
+        """Move old entries of one account into ``archive``.
+
+        Records the balance at the archive boundary as a checkpoint and
+        returns how many entries were moved.
+        """
+        raise NotImplementedError
+
+    def balance_checkpoint(self, acc_number):
+        """Return ``(archived, balance)``: entries archived so far and the
+        balance just before the first live entry"""
+        raise NotImplementedError
+
+    @contextmanager
+    def transaction(self):
+        yield
+
+    def close(self):
+        pass
+
+
+class JsonStorage(Storage):
+    """Whole table in memory, rewritten to one JSON file per commit.
+
+    Mutations are serialized by one lock; the records of the calling
+    thread's outermost transaction are handed to ``write`` as a unit, or
+    dropped and the changed accounts restored if the transaction raises.
+    With ``history_dir`` the history lives in per-account segment files
+    and only a count is kept in the table.  Time indexes for statements
+    are kept, most recently queried first, up to ``TIME_INDEX_CACHE``
+    entries in all: built at load for an inline table held whole, as far
+    as the budget goes, and otherwise on first use.  Running totals
+    are posted with every change, and built and checkpointed once for an
+    older table.
+    """
+
+    INDEX_ON_LOAD = True  # False where the table is paged in on demand
+
+    def __init__(self, path, history_dir=None):
+        self.path = path
+        if history_dir is None:
+            self.history_store = InlineHistory()
+        else:
+            self.history_store = SegmentedHistory(history_dir)
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._time_indexes = OrderedDict()
+        self._indexed = 0  # entries held by all time indexes
+        self.accounts = self.load()
+        if build(self.accounts, self.history_store):
+            # Written out at once, so later starts find the totals
+            self.checkpoint()
+        if self.INDEX_ON_LOAD:
+            self._index_table()
+
+    def load(self):
+        accounts = load_accounts(self.path)
+        for acc_number, data in accounts.items():
+            self.history_store.adopt(acc_number, data)
+        return accounts
+
+    def save(self):
+        with self.metrics.time(STORAGE_SECONDS, call="save_accounts"):
+            save_accounts(self.accounts, self.path)
+
+    def checkpoint(self):
+        """Write the whole table out"""
+        self.save()
+
+    def exists(self, acc_number):
+        with self._lock:
+            return acc_number in self.accounts
+
+    def get(self, acc_number, recent=RECENT):
+        with self._lock:
+            data = self.accounts.get(acc_number)
+            if data is None:
+                return None
+            count = self.history_store.count(data)
+            return {
+                "pin": data.pin,
+                "balance": data.balance,
+                "history": self.history_store.read(
+                    acc_number, data, max(count - recent, 0), count
+                )
+            }
+
+    def history_page(self, acc_number, limit, before=None):
+        with self._lock:
+            data = self.accounts[acc_number]
+            first = self.history_store.first(data)
+            stop = self.history_store.count(data)
+            if before is not None:
+                stop = min(before, stop)
+            start = max(stop - limit, first)
+            entries = self.history_store.read(acc_number, data, start, stop)
+        return entries, (start if start > first else None)
+
+    def statement(self, acc_number, start=None, end=None):
+        with self._lock:
+            data = self.accounts[acc_number]
+            lo, hi = self._time_index(acc_number, data).span(start, end)
+            return self.history_store.read(acc_number, data, lo, hi)
+
+    def statement_page(self, acc_number, limit, start=None, end=None,
+                       after=None):
+        # The cursor is the absolute index of the next entry
+        with self._lock:
+            data = self.accounts[acc_number]
+            if start is None and end is None:
+                lo = self.history_store.first(data)
+                hi = self.history_store.count(data)
+            else:
+                lo, hi = self._time_index(acc_number, data).span(start, end)
+            if after is not None:
+                lo = max(lo, after)
+            stop = min(lo + limit, hi)
+            entries = self.history_store.read(acc_number, data, lo, stop)
+        return entries, (stop if stop < hi else None)
+
+    def _time_index(self, acc_number, data):
+        index = self._time_indexes.get(acc_number)
+        if index is not None:
+            self._time_indexes.move_to_end(acc_number)
+            return index
+        first = self.history_store.first(data)
+        index = self._time_indexes[acc_number] = TimeIndex(first)
+        times = self.history_store.times(data)
+        if times is None:
+            index.add(self.history_store.read(
+                acc_number, data, first, self.history_store.count(data)
+            ))
+        else:
+            index.extend(times)
+        self._indexed += len(index.times)
+        self._evict_time_indexes()
+        return index
+
+    def _index_table(self):
+        # Times of inline entries are copied out of their rows, so the
+        # cost is small next to parsing the table; segments are left to
+        # be read on first use
+        store = self.history_store
+        if isinstance(store, SegmentedHistory):
+            return
+        for acc_number, data in self.accounts.items():
+            if self._indexed + store.count(data) - store.first(data) \
+                    > TIME_INDEX_CACHE:
+                return
+            self._time_index(acc_number, data)
+
+    def _evict_time_indexes(self):
+        # Bounded by entries, not accounts, so a few long histories cannot
+        # hold more than the budget; the newest index always stays
+        while self._indexed > TIME_INDEX_CACHE and len(self._time_indexes) > 1:
+            _, index = self._time_indexes.popitem(last=False)
+            self._indexed -= len(index.times)
+
+    def _index_added(self, acc_number, entries):
+        # Accounts without a built index pick the entries up when built
+        index = self._time_indexes.get(acc_number)
+        if index is not None:
+            index.add(entries)
+            self._indexed += len(entries)
+            self._evict_time_indexes()
+
+    def totals(self, name):
+        with self._lock:
+            data = self.accounts.get(name)
+            if data is None:
+                return None
+            return as_dict(data.balance, data.totals)
+
+    def create(self, acc_number, pin):
+        with self.transaction():
+            self._touch(acc_number, self.accounts.get(acc_number))
+            data = AccountRecord(pin, totals=zero())
+            self.accounts[acc_number] = data
+            self.history_store.init(data)
+            self._pending().append(open_record(acc_number, pin))
+
+    def _modify(self, acc_number):
+        """The record of an account about to be changed in place"""
+        data = self.accounts[acc_number]
+        self._touch(acc_number, data)
+        return data
+
+    def _touch(self, acc_number, data):
+        """Remember the state of a record, or None for one not there yet,
+        before the current transaction first changes it"""
+        undo = self._local.undo
+        if acc_number in undo:
+            return
+        if data is None:
+            undo[acc_number] = None
+            return
+        # Entries are only appended in place, so the length restores them
+        history = data.history
+        undo[acc_number] = (
+            data,
+            [getattr(data, name) for name in AccountRecord.FIELDS],
+            None if history is None else len(history),
+            None if data.totals is None else data.totals[:],
+        )
+
+    def _rollback(self, undo):
+        for acc_number, saved in undo.items():
+            index = self._time_indexes.pop(acc_number, None)
+            if index is not None:
+                self._indexed -= len(index.times)
+            if saved is None:
+                if acc_number in self.accounts:
+                    del self.accounts[acc_number]
+                continue
+            data, values, length, totals = saved
+            for name, value in zip(AccountRecord.FIELDS, values):
+                setattr(data, name, value)
+            if length is not None:
+                del data.history[length:]
+            data.totals = totals
+            self.accounts[acc_number] = data
+
+    def set_pin(self, acc_number, pin):
+        with self.transaction():
+            self._modify(acc_number).pin = pin
+            self._pending().append(pin_record(acc_number, pin))
+
+    def update(self, acc_number, balance, added):
+        with self.transaction():
+            data = self._modify(acc_number)
+            delta = balance - data.balance
+            data.balance = balance
+            at = self.history_store.stage(acc_number, data, added)
+            self._index_added(acc_number, added)
+            post(self.accounts, self.history_store, acc_number, data, delta,
+                 added, before=self._touch)
+            self._pending().append(
+                set_record(acc_number, balance, added, at)
+            )
+
+    def credit(self, acc_number, amount, entry):
+        with self.transaction():
+            data = self._modify(acc_number)
+            data.balance += amount
+            at = self.history_store.stage(acc_number, data, [entry])
+            self._index_added(acc_number, [entry])
+            post(self.accounts, self.history_store, acc_number, data, amount,
+                 [entry], before=self._touch)
+            self._pending().append(
+                credit_record(acc_number, amount, entry, at)
+            )
+
+    def acc_numbers(self):
+        with self._lock:
+            return list(self.accounts)
+
+    def count(self):
+        return len(self.accounts)
+
+    def size(self):
+        return file_size(self.path)
+
+    def compact(self, acc_number, archive, keep=None, before=None):
+        with self.transaction():
+            data = self._modify(acc_number)
+            first = self.history_store.first(data)
+            live = self.history_store.read(
+                acc_number, data, first, self.history_store.count(data)
+            )
+            cut = split_point(live, keep, before)
+            if cut == 0:
+                return 0
+            balance = checkpoint_balance(data.balance, live[cut:])
+            archive.write(acc_number, first, live[:cut])
+            self.history_store.drop(acc_number, data, first + cut)
+            index = self._time_indexes.get(acc_number)
+            if index is not None:
+                self._indexed -= len(index.times)
+                index.drop(first + cut)
+                self._indexed += len(index.times)
+            data.checkpoint = balance
+            self._pending().append(
+                compact_record(acc_number, first + cut, balance)
+            )
+        return cut
+
+    def balance_checkpoint(self, acc_number):
+        with self._lock:
+            data = self.accounts[acc_number]
+            return data.archived, data.checkpoint
+
+    def _pending(self):
+        pending = getattr(self._local, "records", None)
+        if pending is None:
+            pending = self._local.records = []
+            self._local.undo = {}
+            self._local.depth = 0
+        return pending
+
+    @contextmanager
+    def transaction(self):
+        pending = self._pending()
+        undo = self._local.undo
+        ticket = None
+        with self._lock:
+            self._local.depth += 1
+            try:
+                yield
+            except BaseException:
+                self._local.depth -= 1
+                if self._local.depth == 0:
+                    # Nothing is written, as the SQLite backend rolls back
+                    self._rollback(undo)
+                    pending.clear()
+                    undo.clear()
+                raise
+            self._local.depth -= 1
+            if self._local.depth == 0:
+                undo.clear()
+                if pending:
+                    ticket = self.write(pending[:])
+                    pending.clear()
+        self.wait(ticket)
+
+    def write(self, records):
+        """Persist one transaction; called with the lock held"""
+        self.persist_history(records)
+        self.save()
+
+    def wait(self, ticket):
+        """Block until a ticket returned by ``write`` is durable"""
+        pass
+
+    def persist_history(self, records):
+        for record in records:
+            for sub in iter_records(record):
+                if "add" in sub:
+                    self.history_store.persist(sub["acc"], sub["at"], sub["add"])
+                elif sub["op"] == "compact":
+                    self.history_store.discard(sub["acc"], sub["archived"])
+
+
+class MemoryStorage(JsonStorage):
+    """JsonStorage that never touches disk, for tests and benchmarks"""
+
+    def __init__(self, accounts=None):
+        self.initial = accounts if accounts is not None else {}
+        super().__init__(None)
+
+    def load(self):
+        accounts = {}
+        for acc_number, data in self.initial.items():
+            if isinstance(data, dict):
+                data = AccountRecord.from_dict(data)
+            self.history_store.adopt(acc_number, data)
+            accounts[acc_number] = data
+        return accounts
+
+    def save(self):
+        pass
+
+
+class JournalStorage(JsonStorage):
+    """JSON snapshot plus an append-only journal of compact records.
+
+    With ``group_commit`` the journal is written by a background thread
+    that shares one fsync between every transaction queued within
+    ``commit_window`` seconds or ``commit_batch`` records.
+    """
+
+    def __init__(self, path, journal_path, checkpoint_every=1000,
+                 group_commit=False, commit_window=0.002, commit_batch=512,
+                 history_dir=None):
+        self.journal = Journal(path, journal_path, checkpoint_every)
+        self.group = None
+        super().__init__(path, history_dir)
+        if group_commit:
+            self.group = GroupCommit(
+                self._write_batch, commit_window, commit_batch
+            )
+
+    def load(self):
+        return self.journal.replay(self.history_store)
+
+    def write(self, records):
+        record = pack_records(records)
+        if self.group is not None:
+            return self.group.enqueue(record)
+        with self.metrics.time(STORAGE_SECONDS, call="journal_append"):
+            self.journal.append(record)
+        self.persist_history([record])
+        if self.journal.needs_checkpoint():
+            self.checkpoint()
+        return None
+
+    def wait(self, ticket):
+        if ticket is not None:
+            with self.metrics.time(STORAGE_SECONDS, call="commit_wait"):
+                self.group.wait(ticket)
+
+    def size(self):
+        return file_size(self.path, self.journal.log_file)
+
+    def checkpoint(self):
+        with self.metrics.time(STORAGE_SECONDS, call="checkpoint"):
+            self.history_store.sync()
+            self.journal.checkpoint(self.accounts)
+
+    def _write_batch(self, batch):
+        # Runs on the group-commit thread, which alone owns the log file
+        # and writes history segments once their records are durable
+        with self.metrics.time(STORAGE_SECONDS, call="journal_append"):
+            self.journal.append_many(batch)
+        self.persist_history(batch)
+        if self.journal.needs_checkpoint():
+            with self._lock:
+                # Queued records are already applied to the table, so a
+                # snapshot is only consistent with the log when none wait
+                if self.group.idle():
+                    self.checkpoint()
+
+    def close(self):
+        if self.group is not None:
+            self.group.close()
+        self.journal.close()
+
+
+STORAGE_KINDS = ("json", "journal", "sqlite", "lazy", "snapshot")
+# Backend of the GUI and the default of every command line tool
+STORAGE = os.environ.get("ATM_STORAGE", "json")
+
+
+def open_storage(kind, path, segmented=False, **options):
+    """Open a backend by name; side files share the stem of ``path``.
+
+    ``segmented`` moves the history of the JSON backends out of the
+    account table into per-account segment files; the lazy backend
+    always keeps it there.
+    """
+    stem = os.path.splitext(path)[0]
+    if segmented and kind != "sqlite":
+        options["history_dir"] = stem + ".history"
+    if kind == "json":
+        return JsonStorage(path, **options)
+    if kind == "journal":
+        return JournalStorage(path, stem + ".journal", **options)
+    if kind == "sqlite":
+        from bank.sqlite_store import SQLiteStorage
+        return SQLiteStorage(stem + ".db", **options)
+    if kind == "lazy":
+        from bank.lazy_store import open_lazy
+        options.pop("history_dir", None)
+        return open_lazy(path, **options)
+    if kind == "snapshot":
+        from bank.snapshot import open_snapshot
+        return open_snapshot(path, **options)
+    raise ValueError(f"Unknown storage backend: {kind}")
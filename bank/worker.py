@@ -0,0 +1,44 @@
+import queue
+import threading
+from concurrent.futures import Future
+
+
+# ================= WORKER =================
+class Worker:
+    """One background thread running queued jobs in submission order.
+
+    Front-ends hand every Bank call that may touch the disk to a worker,
+    so their own thread never waits on a save; each ``submit`` returns a
+    Future that carries the result or the exception.
+    """
+
+    def __init__(self, name="bank-writer"):
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name=name,
+                                        daemon=True)
+        self._thread.start()
+
+    def submit(self, fn, *args):
+        future = Future()
+        self._queue.put((future, fn, args))
+        return future
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            try:
+                if job is None:
+                    return
+                future, fn, args = job
+                if future.set_running_or_notify_cancel():
+                    try:
+                        future.set_result(fn(*args))
+                    except BaseException as e:
+                        future.set_exception(e)
+            finally:
+                self._queue.task_done()
+
+    def close(self):
+        """Finish the queued jobs and stop the thread"""
+        self._queue.put(None)
+        self._thread.join()
@@ -0,0 +1,265 @@
+"""Time Bank operations on synthetic banks of growing size.
+
+Reports latency percentiles, throughput, cold start and peak memory per
+size as JSON, and can compare against an earlier report.
+
+    python benchmarks/bank_ops.py --sizes 1000 10000 --out run.json
+    python benchmarks/bank_ops.py --storage journal --compare run.json
+
+Each size runs in a fresh process so peak memory is per size.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bank import Bank  # noqa: E402
+from bank.pins import hash_pin  # noqa: E402
+from bank.records import (  # noqa: E402
+    Transaction, DEPOSIT, WITHDRAW, TRANSFER_OUT, TRANSFER_IN
+)
+from bank.storage import (  # noqa: E402
+    STORAGE_KINDS, open_storage, load_accounts, save_accounts
+)
+
+PIN = "123456"
+OPERATIONS = ("add_account", "authenticate", "update_account", "transfer")
+
+
+# ================= DATA =================
+def synth_history(rng, count, accounts):
+    """``count`` plausible entries: mostly deposits and withdrawals, some
+    transfers, spread over the last year"""
+    now = int(time.time())
+    entries = []
+    for t in sorted(rng.randrange(now - 365 * 86400, now) for _ in range(count)):
+        amount = rng.randrange(10_000, 2_000_000, 1000)
+        roll = rng.random()
+        if roll < 0.4:
+            entry = Transaction(DEPOSIT, amount, 0, None, t)
+        elif roll < 0.7:
+            entry = Transaction(WITHDRAW, amount, 2000, None, t)
+        elif roll < 0.85:
+            entry = Transaction(TRANSFER_OUT, amount, 0,
+                                str(rng.randrange(accounts)), t)
+        else:
+            entry = Transaction(TRANSFER_IN, amount, 0,
+                                str(rng.randrange(accounts)), t)
+        entries.append(entry.pack())
+    return entries
+
+
+def build_table(path, accounts, history, seed):
+    """Stream a synthetic ``accounts.json``; history lengths are
+    exponential around ``history`` entries.  Every account shares one
+    PIN hash; hashing a million PINs would dwarf the run"""
+    rng = random.Random(seed)
+    pin = hash_pin(PIN)
+    with open(path, "w") as f:
+        f.write("{")
+        for n in range(accounts):
+            length = 0
+            if history:
+                length = min(int(rng.expovariate(1 / history)), history * 10)
+            data = {
+                "pin": pin,
+                "balance": rng.randrange(100_000_000, 1_000_000_000),
+                "history": synth_history(rng, length, accounts),
+            }
+            f.write(("," if n else "") + json.dumps(str(n)) + ":"
+                    + json.dumps(data, separators=(",", ":")))
+        f.write("}")
+
+
+# ================= MEASURE =================
+def percentile(ordered, q):
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+def summarize(samples):
+    """Latency percentiles in milliseconds and operations per second"""
+    ordered = sorted(samples)
+    total = sum(ordered)
+    return {
+        "count": len(ordered),
+        "p50_ms": percentile(ordered, 0.50) * 1000,
+        "p95_ms": percentile(ordered, 0.95) * 1000,
+        "p99_ms": percentile(ordered, 0.99) * 1000,
+        "mean_ms": total / len(ordered) * 1000,
+        "ops_per_s": len(ordered) / total if total else None,
+    }
+
+
+def sample(operation, count, budget):
+    """Time ``operation(i)`` up to ``count`` times or ``budget`` seconds"""
+    samples = []
+    deadline = time.perf_counter() + budget
+    for i in range(count):
+        t0 = time.perf_counter()
+        operation(i)
+        t1 = time.perf_counter()
+        samples.append(t1 - t0)
+        if t1 > deadline:
+            break
+    return summarize(samples)
+
+
+def timed(fn, *args):
+    t0 = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - t0, result
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1 << 20 if sys.platform == "darwin" else 1 << 10)
+
+
+def run_size(accounts, args):
+    """Build one synthetic bank and measure it; runs in a child process"""
+    workdir = tempfile.mkdtemp(prefix="bank-bench-")
+    try:
+        path = os.path.join(workdir, "accounts.json")
+        build_seconds, _ = timed(build_table, path, accounts, args.history,
+                                 args.seed)
+        result = {
+            "accounts": accounts,
+            "file_mb": os.path.getsize(path) / (1 << 20),
+            "build_s": build_seconds,
+        }
+
+        load_seconds, table = timed(load_accounts, path)
+        save_seconds, _ = timed(save_accounts, table,
+                                os.path.join(workdir, "copy.json"))
+        result["load_accounts_s"] = load_seconds
+        result["save_accounts_s"] = save_seconds
+        del table
+
+        open_seconds, storage = timed(open_storage, args.storage, path)
+        result["open_s"] = open_seconds
+        if args.storage == "sqlite":
+            # The database starts empty next to the seeded table
+            import_seconds, _ = timed(storage.import_accounts,
+                                      load_accounts(path))
+            result["import_s"] = import_seconds
+        bank = Bank(storage)
+        rng = random.Random(args.seed)
+
+        def pick():
+            return str(rng.randrange(accounts))
+
+        def add_account(i):
+            bank.add_account(f"new{i}", PIN)
+
+        def authenticate(i):
+            bank.authenticate(pick(), PIN)
+
+        loaded = [bank.load_account(pick()) for _ in range(args.ops)]
+
+        def update_account(i):
+            loaded[i].deposit(50_000)
+            bank.update_account(loaded[i])
+
+        def transfer(i):
+            bank.transfer(loaded[i], pick(), 10_000)
+
+        operations = {
+            "add_account": add_account,
+            "authenticate": authenticate,
+            "update_account": update_account,
+            "transfer": transfer,
+        }
+        result["ops"] = {
+            name: sample(operations[name], args.ops, args.budget)
+            for name in OPERATIONS
+        }
+        storage.close()
+        result["peak_rss_mb"] = peak_rss_mb()
+        return result
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+# ================= REPORT =================
+def compare(report, baseline, tolerance):
+    """Return the p95 latencies that got slower than ``tolerance``"""
+    before = {r["accounts"]: r for r in baseline["results"]}
+    regressions = []
+    for result in report["results"]:
+        old = before.get(result["accounts"])
+        if old is None:
+            continue
+        for name, stats in result["ops"].items():
+            was = old["ops"].get(name, {}).get("p95_ms")
+            if was and stats["p95_ms"] > was * (1 + tolerance):
+                regressions.append(
+                    f"{result['accounts']:,} accounts {name}: p95 "
+                    f"{was:.3f} -> {stats['p95_ms']:.3f} ms"
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=[1_000, 10_000, 100_000, 1_000_000])
+    parser.add_argument("--storage", default="json", choices=STORAGE_KINDS)
+    parser.add_argument("--history", type=int, default=10,
+                        help="mean history entries per account")
+    parser.add_argument("--ops", type=int, default=200,
+                        help="samples per operation")
+    parser.add_argument("--budget", type=float, default=30,
+                        help="seconds per operation before sampling stops")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", help="write the JSON report here")
+    parser.add_argument("--compare", metavar="BASELINE",
+                        help="fail when a p95 latency regressed")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "storage": args.storage,
+        "history": args.history,
+        "seed": args.seed,
+        "started": int(time.time()),
+        "results": [],
+    }
+    for accounts in args.sizes:
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            result = pool.submit(run_size, accounts, args).result()
+        report["results"].append(result)
+        print(f"{accounts:>10,} accounts: " + ", ".join(
+            f"{name} p95 {stats['p95_ms']:.2f} ms"
+            for name, stats in result["ops"].items()
+        ), file=sys.stderr)
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for line in regressions:
+            print("REGRESSION " + line, file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,72 @@
+"""Statement export: streamed pages against materializing every history.
+
+    python benchmarks/export.py --accounts 2000 --history 500
+
+"list" collects ``bank.statements()`` and formats it whole, as the only
+way before the paged export.  Memory is the peak traced while exporting,
+on top of the store itself.
+"""
+import argparse
+import csv
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bank import Bank  # noqa: E402
+from bank.export import COLUMNS  # noqa: E402
+from bank.records import AccountRecord, Transaction, DEPOSIT  # noqa: E402
+from bank.storage import MemoryStorage  # noqa: E402
+
+
+def materialized(bank, path):
+    statements = list(bank.statements())
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f, lineterminator="\n")
+        writer.writerow(COLUMNS)
+        writer.writerows([(acc_number, t.time, t.kind, t.amount, t.fee,
+                           t.counterparty or "", str(t))
+                          for acc_number, entries in statements
+                          for t in entries])
+
+
+def streamed(bank, path):
+    bank.export(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--accounts", type=int, default=2000)
+    parser.add_argument("--history", type=int, default=500)
+    args = parser.parse_args()
+
+    # Accounts share the entry objects to keep large runs in memory
+    entries = [Transaction(DEPOSIT, 1000 + n, 0, None, 1_700_000_000 + n)
+               for n in range(args.history)]
+    bank = Bank(MemoryStorage({
+        str(n): AccountRecord("0", 0, entries[:])
+        for n in range(args.accounts)
+    }))
+    total = args.accounts * args.history
+    with tempfile.TemporaryDirectory() as tmp:
+        for how, run, name in (("list", materialized, "list.csv"),
+                               ("stream", streamed, "stream.csv"),
+                               ("stream gz", streamed, "stream.csv.gz")):
+            path = os.path.join(tmp, name)
+            tracemalloc.start()
+            t0 = time.perf_counter()
+            run(bank, path)
+            elapsed = time.perf_counter() - t0
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f"{how:<10}: {elapsed:7.2f} s, {total / elapsed:9.0f} "
+                  f"entries/s, peak {peak / 1e6:7.1f} MB, "
+                  f"file {os.path.getsize(path) / 1e6:6.1f} MB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,80 @@
+"""History entries in memory and on disk: formatted strings, Transaction
+objects and packed Entries.
+
+    python benchmarks/history.py --entries 1000000
+
+The mix is a typical account: deposits, withdrawals paying the admin
+fee, and transfers out and in.  "strings" is the history as it was
+before typed records; "objects" a list of Transactions, as loaded pages
+still are; "entries" the inline history kept in the account table.
+Memory is what stays allocated, disk the compact JSON of the history.
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bank.records import (  # noqa: E402
+    Entries, Transaction, DEPOSIT, WITHDRAW, TRANSFER_OUT, TRANSFER_IN, pack
+)
+
+START = 1_700_000_000
+
+
+def mixed(count):
+    entries = []
+    for n in range(count):
+        amount = 50_000 + (n * 7919) % 950_000
+        time = START + n * 600
+        kind = n % 4
+        if kind == 0:
+            entries.append(Transaction(DEPOSIT, amount, 0, None, time))
+        elif kind == 1:
+            entries.append(Transaction(WITHDRAW, amount, 2000, None, time))
+        elif kind == 2:
+            entries.append(Transaction(TRANSFER_OUT, amount, 0,
+                                       str(1000 + n % 9000), time))
+        else:
+            entries.append(Transaction(TRANSFER_IN, amount, 0,
+                                       str(1000 + n % 9000), time))
+    return entries
+
+
+def measure(build, count):
+    """Bytes allocated by ``build(count)`` that are still alive"""
+    gc.collect()
+    tracemalloc.start()
+    kept = build(count)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return size, kept
+
+
+FORMS = (
+    ("strings", lambda count: [str(t) for t in mixed(count)]),
+    ("objects", mixed),
+    ("entries", lambda count: Entries(mixed(count))),
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    count = args.entries
+    print(f"{'':8} {'memory':>12} {'disk':>12}")
+    for name, build in FORMS:
+        size, kept = measure(build, count)
+        disk = len(json.dumps(kept, separators=(",", ":"), default=pack))
+        del kept
+        print(f"{name:8} {size / count:>8.1f} B/e {disk / count:>8.1f} B/e")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
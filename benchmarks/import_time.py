@@ -0,0 +1,65 @@
+"""Import time of the headless core against the GUI module.
+
+    python benchmarks/import_time.py --runs 20 --budget-ms 50
+
+Each run is a fresh interpreter using ``-X importtime``; the median
+cumulative time of the top-level import is compared with the budget.
+Importing the core must not pull in tkinter.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BUDGET_MS = 50
+FORBIDDEN = ("tkinter", "_tkinter", "numpy", "sqlite3")
+
+
+def import_ms(module):
+    """Cumulative import time of ``module`` in a fresh interpreter"""
+    code = f"import {module}"
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    for line in reversed(result.stderr.splitlines()):
+        _, cumulative, name = line.split(":", 1)[1].split("|")
+        if name.strip() == module:
+            return int(cumulative) / 1000
+    raise RuntimeError(f"no import time reported for {module}")
+
+
+def loaded_modules(module):
+    code = f"import sys, {module}; print(' '.join(sys.modules))"
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT,
+                            capture_output=True, text=True, check=True)
+    return set(result.stdout.split())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--budget-ms", type=float, default=BUDGET_MS)
+    parser.add_argument("--modules", nargs="+", default=["bank", "Main"])
+    args = parser.parse_args()
+
+    for module in args.modules:
+        times = sorted(import_ms(module) for _ in range(args.runs))
+        print(f"{module:8} median {statistics.median(times):6.1f} ms  "
+              f"min {times[0]:6.1f} ms  max {times[-1]:6.1f} ms")
+
+    core = statistics.median(import_ms("bank") for _ in range(args.runs))
+    heavy = sorted(set(FORBIDDEN) & loaded_modules("bank"))
+    ok = core <= args.budget_ms and not heavy
+    if heavy:
+        print(f"bank imports {', '.join(heavy)}")
+    print(f"core import {core:.1f} ms, budget {args.budget_ms:.0f} ms: "
+          + ("OK" if ok else "FAILED"))
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+"""Login throughput with hashed PINs as the auth pool grows.
+
+    python benchmarks/login.py --logins 200 --workers 1 2 4 8
+
+Also reports how long a ticking event loop stalls when logins block it
+directly, against handing them to the pool with ``authenticate_async``.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bank import Bank  # noqa: E402
+from bank.pins import hash_pin  # noqa: E402
+from bank.storage import MemoryStorage  # noqa: E402
+
+PIN = "123456"
+
+
+def make_bank(accounts, workers):
+    hashed = hash_pin(PIN)
+    return Bank(MemoryStorage({
+        str(n): {"pin": hashed, "balance": 0, "history": []}
+        for n in range(accounts)
+    }), auth_workers=workers)
+
+
+def throughput(bank, accounts, logins):
+    t0 = time.perf_counter()
+    futures = [bank.authenticate_async(str(n % accounts), PIN)
+               for n in range(logins)]
+    ok = sum(1 for future in futures if future.result() is not None)
+    elapsed = time.perf_counter() - t0
+    assert ok == logins
+    return logins / elapsed
+
+
+async def loop_stall(bank, logins, offload):
+    """Longest gap between 1 ms ticks while ``logins`` run"""
+    worst = 0.0
+    running = True
+
+    async def tick():
+        nonlocal worst
+        last = time.perf_counter()
+        while running:
+            await asyncio.sleep(0.001)
+            now = time.perf_counter()
+            worst = max(worst, now - last)
+            last = now
+
+    ticker = asyncio.create_task(tick())
+    await asyncio.sleep(0.01)
+    for _ in range(logins):
+        if offload:
+            await asyncio.wrap_future(bank.authenticate_async("0", PIN))
+        else:
+            bank.authenticate("0", PIN)
+            await asyncio.sleep(0)
+    running = False
+    await ticker
+    return worst
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--accounts", type=int, default=100)
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--workers", type=int, nargs="+",
+                        default=sorted({1, 2, 4, os.cpu_count() or 1}))
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} CPUs")
+    base = None
+    for workers in args.workers:
+        bank = make_bank(args.accounts, workers)
+        rate = throughput(bank, args.accounts, args.logins)
+        bank.auth_pool.shutdown()
+        base = base or rate
+        print(f"{workers:>3} workers: {rate:8.1f} logins/s "
+              f"({rate / base:.1f}x)")
+
+    bank = make_bank(1, 1)
+    for offload in (False, True):
+        stall = asyncio.run(loop_stall(bank, 20, offload))
+        how = "authenticate_async" if offload else "authenticate inline"
+        print(f"event loop stall, {how:19}: {stall * 1000:6.1f} ms")
+    bank.auth_pool.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
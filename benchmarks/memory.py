@@ -0,0 +1,88 @@
+"""Resident memory per account: dict table and plain objects against
+AccountRecord and slotted accounts.
+
+    python benchmarks/memory.py --sizes 10000 100000 1000000
+"""
+import argparse
+import gc
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bank import SavingAccount  # noqa: E402
+from bank.records import AccountRecord, Transaction, DEPOSIT  # noqa: E402
+
+
+class DictAccount:
+    """Account as it was before ``__slots__``, for comparison"""
+
+    def __init__(self, acc_number, pin, balance=0, history=None):
+        self._acc_number = acc_number
+        self._pin = pin
+        self._balance = balance
+        self._history = history or []
+        self._saved = len(self._history)
+
+
+def dict_table(count):
+    return {
+        str(n): {"pin": "1234", "balance": n, "history": []}
+        for n in range(count)
+    }
+
+
+def record_table(count):
+    return {str(n): AccountRecord("1234", n, []) for n in range(count)}
+
+
+def dict_accounts(count):
+    return [DictAccount(str(n), "1234", n) for n in range(count)]
+
+
+def slot_accounts(count):
+    return [SavingAccount(str(n), "1234", n) for n in range(count)]
+
+
+def entries(count):
+    return [Transaction(DEPOSIT, 50_000) for _ in range(count)]
+
+
+def measure(build, count):
+    """Bytes allocated by ``build(count)`` that are still alive"""
+    gc.collect()
+    tracemalloc.start()
+    kept = build(count)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+    return size
+
+
+CASES = (
+    ("account table", dict_table, record_table),
+    ("loaded accounts", dict_accounts, slot_accounts),
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=[10_000, 100_000, 1_000_000])
+    args = parser.parse_args()
+
+    print(f"{'':16} {'accounts':>10} {'before':>10} {'after':>10} {'saved':>6}")
+    for count in args.sizes:
+        for name, before, after in CASES:
+            old = measure(before, count)
+            new = measure(after, count)
+            print(f"{name:16} {count:>10,} {old / count:>8.0f} B "
+                  f"{new / count:>8.0f} B {1 - new / old:>6.0%}")
+        size = measure(entries, count)
+        print(f"{'history entry':16} {count:>10,} {'':>10} "
+              f"{size / count:>8.0f} B")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Throughput and peak memory of the streaming legacy-history migration.
+
+    python benchmarks/migrate.py --accounts 20000 --history 200 --workers 0 4
+
+Writes a legacy ``accounts.json`` of formatted history strings in the
+mixed styles of the old front-ends (one entry in a thousand garbled),
+then migrates it once per ``--workers`` value.  Peak RSS is reported
+after all runs, next to the size of the file: a migration that loaded
+the file whole would need several times the file.
+"""
+import argparse
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bank.migrate import MIGRATE_KINDS, migrate  # noqa: E402
+from bank.storage import file_size, open_storage  # noqa: E402
+
+FORMATS = (
+    "Setor Rp {a}",
+    "Setor Rp {a:,}",
+    "Tarik Rp {a:,}",
+    "Tarik Rp {a:,} (Admin Rp 2,000)",
+    "Tarik Rp {d} (Admin Rp 2.000)",
+    "Transfer Rp {a:,} ke {to}",
+    "Terima transfer Rp {a:,} dari {to}",
+)
+
+
+def write_legacy(path, accounts, history):
+    """Stream out a legacy table, one account per line as Atm.py wrote"""
+    rng = random.Random(1)
+    with open(path, "w") as f:
+        f.write("{\n")
+        for n in range(accounts):
+            entries = []
+            for _ in range(history):
+                if rng.random() < 0.001:
+                    entries.append('"catatan rusak ##"')
+                    continue
+                a = rng.randrange(1, 1000) * 1000
+                text = rng.choice(FORMATS).format(
+                    a=a, d=f"{a:,}".replace(",", "."), to=rng.randrange(n + 1)
+                )
+                entries.append(f'"{text}"')
+            sep = "," if n + 1 < accounts else ""
+            f.write(f'    "{n}": {{"pin": "123456", "balance": 0, '
+                    f'"history": [{", ".join(entries)}]}}{sep}\n')
+        f.write("}\n")
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1 << 20 if sys.platform == "darwin" else 1 << 10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--accounts", type=int, default=20_000)
+    parser.add_argument("--history", type=int, default=200)
+    parser.add_argument("--workers", type=int, nargs="+",
+                        default=sorted({0, os.cpu_count() or 1}))
+    parser.add_argument("--storage", default="sqlite", choices=MIGRATE_KINDS)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "accounts.json")
+        write_legacy(source, args.accounts, args.history)
+        print(f"source: {file_size(source) / 1e6:.1f} MB, {os.cpu_count()} "
+              f"CPUs, {args.storage} target")
+        for workers in args.workers:
+            target = os.path.join(tmp, f"migrated{workers}.json")
+            options = {"checkpoint_every": 1} if args.storage == "lazy" else {}
+            storage = open_storage(args.storage, target, **options)
+            t0 = time.perf_counter()
+            with open(os.devnull, "w") as quarantine:
+                stats = migrate(source, storage, quarantine, workers)
+            elapsed = time.perf_counter() - t0
+            storage.close()
+            print(f"{workers:>2} workers: {elapsed:7.2f} s, "
+                  f"{stats['entries'] / elapsed:10.0f} entries/s, "
+                  f"{stats['quarantined']} quarantined")
+        print(f"peak RSS: {peak_rss_mb():.1f} MB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,90 @@
+"""Nightly reconciliation throughput across worker processes.
+
+    python benchmarks/reconcile.py --accounts 100000 --transfers 4 --workers 1 4
+
+Builds a consistent snapshot store (a deposit per account, then
+``--transfers`` transfers out of each account with admin fee), plants a
+few discrepancies, and times ``bank.reconcile`` once per ``--workers``
+value.  Every planted problem must be found and nothing else.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bank.account import SavingAccount  # noqa: E402
+from bank.aggregates import TOTALS, zero  # noqa: E402
+from bank.records import (  # noqa: E402
+    AccountRecord, Transaction, DEPOSIT, WITHDRAW, TRANSFER_OUT, TRANSFER_IN
+)
+from bank.reconcile import reconcile  # noqa: E402
+from bank.snapshot import write_snapshot  # noqa: E402
+
+FEE = SavingAccount.ADMIN_FEE
+
+
+def build(path, accounts, transfers):
+    rng = random.Random(1)
+    names = [str(n) for n in range(accounts)]
+    records = {name: AccountRecord("0", 10 ** 9, [
+        Transaction(DEPOSIT, 10 ** 9, 0, None, 1)
+    ], totals=zero()) for name in names}
+    for name in names:
+        for _ in range(transfers):
+            to = rng.choice(names)
+            amount = rng.randrange(1, 100) * 1000
+            sender = records[name]
+            sender.history += [Transaction(WITHDRAW, amount, FEE, None, 2),
+                               Transaction(TRANSFER_OUT, amount, 0, to, 2)]
+            sender.balance -= amount + FEE
+            records[to].history.append(
+                Transaction(TRANSFER_IN, amount, 0, name, 2)
+            )
+            records[to].balance += amount
+    # Planted: a drifted balance, a lost receipt and an odd fee
+    records["1"].balance += 1
+    lost = next(t for t in records["2"].history if t.kind == TRANSFER_IN)
+    records["2"].history.remove(lost)
+    records["2"].balance -= lost.amount
+    records["3"].history.append(Transaction(WITHDRAW, 1000, 500, None, 3))
+    records["3"].balance -= 1500
+    # Totals are already there, so opening the store skips building them
+    records[TOTALS] = AccountRecord("0", totals=zero())
+    write_snapshot(path, records.items())
+    return {("balance", "1"), ("leg", None), ("fee", "3")}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--accounts", type=int, default=100_000)
+    parser.add_argument("--transfers", type=int, default=4)
+    parser.add_argument("--workers", type=int, nargs="+",
+                        default=sorted({1, os.cpu_count() or 1}))
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "accounts.json")
+        planted = build(os.path.join(tmp, "accounts.snap"), args.accounts,
+                        args.transfers)
+        print(f"{args.accounts} accounts, {os.cpu_count()} CPUs")
+        for workers in args.workers:
+            t0 = time.perf_counter()
+            accounts, entries, problems = reconcile(
+                [("snapshot", path, False)], workers
+            )
+            elapsed = time.perf_counter() - t0
+            found = {(p["check"], p.get("acc")) for p in problems}
+            assert found == planted, found
+            print(f"{workers:>2} workers: {elapsed:7.2f} s, "
+                  f"{accounts / elapsed:9.0f} accounts/s, "
+                  f"{entries / elapsed:10.0f} entries/s "
+                  f"(1M accounts in ~{1e6 / accounts * elapsed / 60:.1f} min)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,61 @@
+"""Cost of retried transfers answered from the idempotency cache.
+
+    python benchmarks/retries.py --transfers 2000 --retries 3
+
+Runs keyed transfers, then repeats each key ``--retries`` times as a
+retry storm would, and checks the repeats neither moved money nor grew
+the store.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bank import Bank  # noqa: E402
+from bank.storage import STORAGE_KINDS, open_storage  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--transfers", type=int, default=2000)
+    parser.add_argument("--retries", type=int, default=3)
+    parser.add_argument("--storage", default="journal", choices=STORAGE_KINDS)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        bank = Bank(open_storage(args.storage,
+                                 os.path.join(tmp, "accounts.json")))
+        bank.add_account("1", "0")
+        bank.add_account("2", "0")
+        bank.deposit("1", 10 ** 12)
+        account = bank.load_account("1")
+        keys = [f"k{n}" for n in range(args.transfers)]
+
+        t0 = time.perf_counter()
+        for key in keys:
+            bank.transfer(account, "2", 1, key=key)
+        first = time.perf_counter() - t0
+        balance = bank.load_account("2").get_balance()
+        size = bank.storage.size()
+
+        t0 = time.perf_counter()
+        for _ in range(args.retries):
+            for key in keys:
+                bank.transfer(account, "2", 1, key=key)
+        repeat = time.perf_counter() - t0
+        assert bank.load_account("2").get_balance() == balance
+        assert bank.storage.size() == size
+        bank.storage.close()
+
+    retried = args.transfers * args.retries
+    print(f"first   : {first / args.transfers * 1e6:9.1f} us/transfer")
+    print(f"retries : {repeat / retried * 1e6:9.1f} us/transfer "
+          f"({retried} repeats, no money moved, store unchanged)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+"""Longest event-loop stall while ATM transactions are saved.
+
+    python benchmarks/save_stall.py --accounts 20000 --deposits 20
+
+Stands in for the Tk mainloop with a ticking asyncio loop, so it runs
+headless: "inline" saves on the loop thread as ``proses()`` used to,
+"worker" hands each save to ``bank.worker.Worker`` and polls the future
+every ``POLL_MS`` as ATMApp does.  A 60 fps UI needs stalls under 16 ms.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bank import Bank  # noqa: E402
+from bank.storage import STORAGE_KINDS, open_storage  # noqa: E402
+from bank.worker import Worker  # noqa: E402
+
+POLL_MS = 16
+
+
+def make_bank(path, kind, accounts):
+    with open(path, "w") as f:
+        json.dump({
+            str(n): {"pin": "0", "balance": 1000, "history": []}
+            for n in range(accounts)
+        }, f)
+    return Bank(open_storage(kind, path))
+
+
+def deposit(bank, account):
+    account.deposit(1)
+    bank.update_account(account)
+
+
+async def loop_stall(bank, deposits, worker):
+    """Longest gap between 1 ms ticks while ``deposits`` are saved"""
+    worst = 0.0
+    running = True
+
+    async def tick():
+        nonlocal worst
+        last = time.perf_counter()
+        while running:
+            await asyncio.sleep(0.001)
+            now = time.perf_counter()
+            worst = max(worst, now - last)
+            last = now
+
+    ticker = asyncio.create_task(tick())
+    await asyncio.sleep(0.01)
+    account = bank.load_account("0")
+    for _ in range(deposits):
+        if worker is None:
+            deposit(bank, account)
+            await asyncio.sleep(0)
+        else:
+            future = worker.submit(deposit, bank, account)
+            while not future.done():
+                await asyncio.sleep(POLL_MS / 1000)
+            future.result()
+    running = False
+    await ticker
+    return worst
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--accounts", type=int, default=20_000)
+    parser.add_argument("--deposits", type=int, default=20)
+    parser.add_argument("--storage", default="json", choices=STORAGE_KINDS)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        bank = make_bank(os.path.join(tmp, "accounts.json"), args.storage,
+                         args.accounts)
+        worker = Worker()
+        for how, use in (("inline", None), ("worker", worker)):
+            stall = asyncio.run(loop_stall(bank, args.deposits, use))
+            print(f"{args.storage} storage, save {how:6}: "
+                  f"longest stall {stall * 1000:7.1f} ms")
+        worker.close()
+        bank.storage.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
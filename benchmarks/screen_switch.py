@@ -0,0 +1,83 @@
+"""Screen-switch latency of ATMApp with cached screens against rebuilding.
+
+    python benchmarks/screen_switch.py --rounds 50 --app Main
+
+Needs a display (use xvfb-run on a headless box).  "rebuild" destroys
+every cached screen before each switch, which is what navigation did
+before screens were cached.
+"""
+import argparse
+import importlib
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bank import Bank  # noqa: E402
+from bank.storage import MemoryStorage  # noqa: E402
+
+ROUTE = ("setor_screen", "main_menu", "tarik_screen", "main_menu",
+         "transfer_screen", "main_menu")
+
+
+def make_app(module):
+    gui = importlib.import_module(module)
+    tk = gui.load_tk()
+    root = tk.Tk()
+    bank = Bank(MemoryStorage({
+        "1": {"pin": "0", "balance": 1_000_000, "history": []}
+    }))
+    app = gui.ATMApp(root, bank)
+    app.current_account = bank.load_account("1")
+    app.main_menu()
+    root.update()
+    return root, app
+
+
+def forget_screens(app):
+    for screen in app.screens.values():
+        screen.destroy()
+    app.screens.clear()
+
+
+def switch_times(root, app, rounds, rebuild):
+    samples = []
+    for _ in range(rounds):
+        for name in ROUTE:
+            t0 = time.perf_counter()
+            if rebuild:
+                forget_screens(app)
+            getattr(app, name)()
+            root.update()
+            samples.append(time.perf_counter() - t0)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--app", default="Main", choices=("Main", "Atm"))
+    args = parser.parse_args()
+
+    try:
+        root, app = make_app(args.app)
+    except Exception as e:  # tkinter.TclError without a display
+        print(f"cannot open a window: {e}")
+        return 1
+
+    # Build every screen once so the cached run measures switching only
+    switch_times(root, app, 1, rebuild=False)
+    for rebuild in (True, False):
+        samples = sorted(switch_times(root, app, args.rounds, rebuild))
+        p95 = samples[min(int(0.95 * len(samples)), len(samples) - 1)]
+        label = "rebuild" if rebuild else "cached"
+        print(f"{label:8} median {statistics.median(samples) * 1000:7.2f} ms"
+              f"  p95 {p95 * 1000:7.2f} ms  ({len(samples)} switches)")
+    root.destroy()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+"""Throughput of ShardedBank as the number of shard processes grows.
+
+    python benchmarks/shards.py --shards 1 2 4 --accounts 2000
+
+Each run opens a fresh sharded store in a temporary directory and drives
+it from a pool of client threads, as the transaction server does.
+Logins are bound by PIN hashing, deposits and transfers by saving the
+owning shard's store, so both should scale with the cores available.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bank.shards import ShardedBank  # noqa: E402
+from bank.storage import STORAGE_KINDS  # noqa: E402
+
+PIN = "123456"
+
+
+def rate(bank, clients, ops, op):
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        list(pool.map(op, range(ops)))
+    return ops / (time.perf_counter() - t0)
+
+
+def run(shards, args):
+    with tempfile.TemporaryDirectory() as tmp:
+        bank = ShardedBank(shards, args.storage,
+                           os.path.join(tmp, "accounts.json"))
+        accounts = [str(n) for n in range(args.accounts)]
+        clients = 2 * shards
+        rng = random.Random(1)
+
+        def register(n):
+            bank.add_account(accounts[n], PIN)
+            bank.deposit(accounts[n], 1_000_000)
+
+        def login(n):
+            assert bank.authenticate(accounts[n % len(accounts)], PIN)
+
+        def deposit(n):
+            bank.deposit(rng.choice(accounts), 1000)
+
+        def transfer(n):
+            source = bank.load_account(rng.choice(accounts))
+            bank.transfer(source, rng.choice(accounts), 1000)
+
+        rate(bank, clients, len(accounts), register)
+        result = {
+            "login": rate(bank, clients, args.logins, login),
+            "deposit": rate(bank, clients, args.ops, deposit),
+            "transfer": rate(bank, clients, args.ops, transfer),
+        }
+        bank.close()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shards", type=int, nargs="+",
+                        default=sorted({1, 2, os.cpu_count() or 1}))
+    parser.add_argument("--accounts", type=int, default=2000)
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--ops", type=int, default=2000)
+    parser.add_argument("--storage", default="journal", choices=STORAGE_KINDS)
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} CPUs, {args.storage} storage")
+    base = None
+    for shards in args.shards:
+        result = run(shards, args)
+        base = base or result
+        print(f"{shards:>3} shards: " + "  ".join(
+            f"{op} {ops:8.1f}/s ({ops / base[op]:.1f}x)"
+            for op, ops in result.items()
+        ))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
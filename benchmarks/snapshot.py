@@ -0,0 +1,88 @@
+"""Cold start from the binary snapshot against parsing accounts.json.
+
+    python benchmarks/snapshot.py --accounts 100000 --history 20
+
+Writes one table of ``--accounts`` accounts with ``--history`` entries
+each in both formats, then times opening it and looking up the balance
+of ``--lookups`` random accounts, as a freshly started Bank would.  The
+Bank is opened once beforehand, so the timed start reopens a snapshot
+that already holds the totals and journal marker of a first start.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bank import Bank  # noqa: E402
+from bank.records import AccountRecord, Transaction, DEPOSIT  # noqa: E402
+from bank.snapshot import Snapshot, to_binary  # noqa: E402
+from bank.storage import (  # noqa: E402
+    file_size, load_accounts, open_storage, save_accounts
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--accounts", type=int, default=100_000)
+    parser.add_argument("--history", type=int, default=20)
+    parser.add_argument("--lookups", type=int, default=100)
+    args = parser.parse_args()
+
+    entries = [Transaction(DEPOSIT, 1000, 0, None, 1_700_000_000 + n)
+               for n in range(args.history)]
+    accounts = {str(n): AccountRecord("0", 1000 * args.history, entries)
+                for n in range(args.accounts)}
+    wanted = random.Random(1).sample(sorted(accounts), args.lookups)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "accounts.json")
+        save_accounts(accounts, path)
+        snap = os.path.join(tmp, "accounts.snap")
+        t0 = time.perf_counter()
+        to_binary(path, snap)
+        convert = time.perf_counter() - t0
+        del accounts
+        # Compared before a Bank adds the totals to the snapshot
+        print(f"accounts.json : {file_size(path) / 1e6:8.1f} MB")
+        print(f"accounts.snap : {file_size(snap) / 1e6:8.1f} MB "
+              f"(converted in {convert:.2f} s)")
+
+        def json_start():
+            table = load_accounts(path)
+            return [table[acc_number].balance for acc_number in wanted]
+
+        def snapshot_start():
+            snapshot = Snapshot(snap)
+            balances = [snapshot.balance(acc_number) for acc_number in wanted]
+            snapshot.close()
+            return balances
+
+        # The first open builds the totals and checkpoints them
+        Bank(open_storage("snapshot", path)).storage.close()
+
+        def bank_start():
+            bank = Bank(open_storage("snapshot", path))
+            balances = [bank.load_account(acc_number).get_balance()
+                        for acc_number in wanted]
+            bank.storage.close()
+            return balances
+
+        expected = None
+        for how, start in (("json", json_start), ("snapshot", snapshot_start),
+                           ("snapshot Bank", bank_start)):
+            t0 = time.perf_counter()
+            balances = start()
+            elapsed = time.perf_counter() - t0
+            expected = expected or balances
+            assert balances == expected
+            print(f"{how:<14}: {elapsed * 1e3:9.1f} ms to open "
+                  f"+ {args.lookups} balance lookups")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
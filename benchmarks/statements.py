@@ -0,0 +1,81 @@
+"""Monthly statement queries through the time index against a full scan.
+
+    python benchmarks/statements.py --accounts 2000 --history 5000
+
+Every account gets ``--history`` entries spread evenly over one year.
+"scan" filters the whole live history by time, as the only option was
+before entries had a time index.  The table is loaded twice, with the
+indexes built at load and without, and the first statement of every
+account is timed on both, so the build cost shows wherever it is paid.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bank import Bank  # noqa: E402
+from bank.history import month_range  # noqa: E402
+from bank.records import AccountRecord, Transaction, DEPOSIT  # noqa: E402
+from bank.storage import MemoryStorage  # noqa: E402
+
+YEAR = 2025
+
+
+class Unindexed(MemoryStorage):
+    INDEX_ON_LOAD = False
+
+
+def make_bank(accounts, history, storage=MemoryStorage):
+    start, _ = month_range(YEAR, 1)
+    _, end = month_range(YEAR, 12)
+    step = (end - start) // history
+    entries = [Transaction(DEPOSIT, 1000, 0, None, start + n * step)
+               for n in range(history)]
+    # Accounts share the entry objects to keep large runs in memory
+    return Bank(storage({
+        str(n): AccountRecord("0", 1000 * history, entries[:])
+        for n in range(accounts)
+    }))
+
+
+def scan(bank, acc_number, start, end):
+    entries, _ = bank.history_page(acc_number, 1 << 62)
+    return [t for t in entries if start <= t.time < end]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--accounts", type=int, default=2000)
+    parser.add_argument("--history", type=int, default=5000)
+    args = parser.parse_args()
+
+    print(f"{args.accounts} accounts x {args.history} entries")
+    for how, storage in (("at load", MemoryStorage), ("on query", Unindexed)):
+        t0 = time.perf_counter()
+        bank = make_bank(args.accounts, args.history, storage)
+        loaded = time.perf_counter() - t0
+        acc_numbers = bank.storage.acc_numbers()
+        t0 = time.perf_counter()
+        for acc_number in acc_numbers:
+            bank.statement(acc_number, 0, 0)
+        first = time.perf_counter() - t0
+        print(f"indexes {how:8}: load {loaded:7.3f} s, "
+              f"first statements {first:7.3f} s")
+
+    for month in (3, 12):
+        start, end = month_range(YEAR, month)
+        for how, query in (("scan", scan), ("index", Bank.statement)):
+            t0 = time.perf_counter()
+            found = sum(len(query(bank, acc_number, start, end))
+                        for acc_number in acc_numbers)
+            elapsed = time.perf_counter() - t0
+            print(f"{YEAR}-{month:02d} {how:5}: {elapsed:7.3f} s, "
+                  f"{found} entries, "
+                  f"{elapsed / len(acc_numbers) * 1e6:8.1f} us/account")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+"""Concurrent random transfers must neither create nor destroy money.
+
+    python benchmarks/stress_transfer.py --transfers 1000000 --threads 8
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bank import Bank, SavingAccount  # noqa: E402
+from bank.records import SYSTEM_PREFIX  # noqa: E402
+from bank.storage import MemoryStorage  # noqa: E402
+
+ADMIN_FEE = 2000
+
+
+def run(accounts, transfers, threads, seed):
+    start_balance = 100_000_000
+    bank = Bank(MemoryStorage({
+        str(n): {"pin": "0", "balance": start_balance, "history": []}
+        for n in range(accounts)
+    }))
+    expected = accounts * start_balance
+    done = [0] * threads
+
+    def worker(index):
+        rng = random.Random(seed + index)
+        ok = 0
+        for _ in range(transfers // threads):
+            src, dst = rng.sample(range(accounts), 2)
+            sender = SavingAccount(str(src), "0")
+            if bank.transfer(sender, str(dst), rng.randint(1, 50_000))[0]:
+                ok += 1
+        done[index] = ok
+
+    workers = [threading.Thread(target=worker, args=(i,))
+               for i in range(threads)]
+    t0 = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - t0
+
+    succeeded = sum(done)
+    # The store also holds bookkeeping records such as the running totals
+    balances = [data for acc_number, data in bank.storage.accounts.items()
+                if not acc_number.startswith(SYSTEM_PREFIX)]
+    total = sum(data.balance for data in balances)
+    fees = succeeded * ADMIN_FEE
+    negative = sum(1 for data in balances if data.balance < 0)
+    print(f"{succeeded:,}/{transfers // threads * threads:,} transfers "
+          f"in {elapsed:.1f}s ({succeeded / elapsed:,.0f}/s)")
+    print(f"total {total:,} + fees {fees:,} = {total + fees:,} "
+          f"(expected {expected:,}), negative balances: {negative}")
+    return total + fees == expected and negative == 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--accounts", type=int, default=1000)
+    parser.add_argument("--transfers", type=int, default=200_000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    ok = run(args.accounts, args.transfers, args.threads, args.seed)
+    print("OK" if ok else "FAILED: money was created or lost")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,77 @@
+"""Bank-wide totals from running aggregates against walking every history.
+
+    python benchmarks/totals.py --accounts 2000 --history 500
+
+"scan" adds up fees and deposits by reading the whole history of every
+account, as was the only way before the store kept running totals.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bank import Bank  # noqa: E402
+from bank.records import (  # noqa: E402
+    AccountRecord, Transaction, DEPOSIT, WITHDRAW, SYSTEM_PREFIX
+)
+from bank.storage import MemoryStorage  # noqa: E402
+
+
+def scan(bank):
+    fees = deposits = 0
+    for acc_number in bank.storage.acc_numbers():
+        if acc_number.startswith(SYSTEM_PREFIX):
+            continue
+        entries, _ = bank.history_page(acc_number, 1 << 62)
+        for t in entries:
+            fees += t.fee
+            if t.kind == DEPOSIT:
+                deposits += t.amount
+    return fees, deposits
+
+
+def aggregate(bank):
+    totals = bank.totals()
+    return totals["fees"], totals["deposits"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--accounts", type=int, default=2000)
+    parser.add_argument("--history", type=int, default=500)
+    args = parser.parse_args()
+
+    entries = [Transaction(DEPOSIT if n % 2 else WITHDRAW, 1000,
+                           0 if n % 2 else 2000)
+               for n in range(args.history)]
+    t0 = time.perf_counter()
+    bank = Bank(MemoryStorage({
+        str(n): AccountRecord("0", 0, entries[:])
+        for n in range(args.accounts)
+    }))
+    print(f"build totals: {time.perf_counter() - t0:8.3f} s "
+          f"({args.accounts} accounts x {args.history} entries, once)")
+
+    expected = None
+    for how, query in (("scan", scan), ("aggregate", aggregate)):
+        t0 = time.perf_counter()
+        result = query(bank)
+        elapsed = time.perf_counter() - t0
+        expected = expected or result
+        assert result == expected
+        print(f"{how:<10}: {elapsed * 1e3:10.3f} ms per query")
+
+    deposits = 1000
+    t0 = time.perf_counter()
+    for n in range(deposits):
+        bank.deposit(str(n % args.accounts), 1000)
+    elapsed = time.perf_counter() - t0
+    print(f"deposit   : {elapsed / deposits * 1e6:10.3f} us each "
+          f"(totals posted with every change)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())